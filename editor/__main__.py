@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The editor modules import each other as top-level modules (as when running
+# editor/main.py directly), so make that work for "python -m editor" too.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cli import main
+
+sys.exit(main())
@@ -0,0 +1,334 @@
+# Benchmarks the data layer and the editor on generated catalogs, to find
+# where things stop scaling before the real catalog grows.
+#
+#   python editor/benchmark.py [--sizes 100,1000,10000,100000] [--repeat 5]
+#                              [--output bench_results.json] [--compare old.json]
+#
+# Each size gets a seeded catalog in a temporary project (public/*.json in the
+# real schema, images linked from this checkout), opened in a MainWindow on
+# Qt's offscreen platform. Every operation is timed `repeat` times, then run
+# once more under tracemalloc for its peak Python allocation. Results go to
+# a JSON file; --compare prints the change against an earlier one.
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RESULTS_VERSION = 1
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_WORDS = ("fresh", "double", "spicy", "classic", "toasted", "smoked", "crispy", "house", "garden", "loaded",
+          "italian", "club", "deluxe", "honey", "pepper", "ranch", "melt", "stack", "wrap", "special")
+
+
+# Synthetic catalogs
+
+def _real_catalog():
+    # The checked-in catalog, as the vocabulary for generated ones
+    public = os.path.join(_ROOT, 'public')
+    with open(os.path.join(public, 'sub_data.json'), encoding='utf-8') as f:
+        subs = json.load(f)
+    with open(os.path.join(public, 'ingredient_data.json'), encoding='utf-8') as f:
+        ingredients = json.load(f)
+    with open(os.path.join(public, 'site_tips.json'), encoding='utf-8') as f:
+        tips = json.load(f)
+    return subs, ingredients, tips
+
+
+def generate_catalog(sub_count, seed=0):
+    # (subs, ingredients, tips) as parsed JSON, shaped like the real files.
+    # Categories, ingredients and tips grow with the sub count (one category
+    # per 200 subs, one ingredient per 10, one tip per 100); ingredient
+    # popularity is skewed like a real menu's. About 2% of subs are left
+    # incomplete so validation has something to find, and every 50th has an
+    # explicit null image, which a save has to write back as null.
+    rng = random.Random(seed)
+    real_subs, real_ingredients, real_tips = _real_catalog()
+
+    ingredients = dict(real_ingredients)
+    bases = list(real_ingredients.items())
+    n = 0
+    while len(ingredients) < max(len(real_ingredients), sub_count // 10):
+        n += 1
+        name, data = rng.choice(bases)
+        ingredients[f"{name} {rng.choice(_WORDS).title()} {n}"] = dict(data)
+    names = list(ingredients)
+    weights = [1.0 / (rank + 1) for rank in range(len(names))]
+
+    categories = list(real_subs)
+    n = 0
+    while len(categories) < max(len(real_subs), sub_count // 200):
+        n += 1
+        categories.append(f"Regional {n}")
+    real_images = [sub["image"] for cat_subs in real_subs.values() for sub in cat_subs if sub.get("image")]
+    real_tip_texts = [sub["tip"] for cat_subs in real_subs.values() for sub in cat_subs if sub.get("tip")]
+
+    subs = {category: [] for category in categories}
+    for i in range(sub_count):
+        picked = []
+        for name in rng.choices(names, weights, k=rng.randint(4, 9)):
+            if name not in picked:
+                picked.append(name)
+        sub = {"name": f"#{i + 1} The {' '.join(rng.sample(_WORDS, 2)).title()}",
+               "ingredients": picked,
+               "tip": rng.choice(real_tip_texts),
+               "image": rng.choice(real_images)}
+        if rng.random() < 0.02:
+            if rng.random() < 0.5:
+                sub["tip"] = ""
+            else:
+                sub["ingredients"].append("Unknown Ingredient")
+        if i % 50 == 49:
+            sub["image"] = None
+        subs[categories[i % len(categories)]].append(sub)
+
+    tips = list(real_tips)
+    while len(tips) < max(len(real_tips), sub_count // 100):
+        tip = dict(rng.choice(real_tips))
+        tip["text"] = f"{tip['text']} ({len(tips) + 1})"
+        tips.append(tip)
+    return subs, ingredients, tips
+
+
+def write_project(base_dir, subs, ingredients, tips):
+    # A project root DataManager can open: public/ with the four data files,
+    # and this checkout's images so references resolve
+    public = os.path.join(base_dir, 'public')
+    os.makedirs(public, exist_ok=True)
+    shutil.copy2(os.path.join(_ROOT, 'public', 'sorting_config.json'), public)
+    for filename, data in (('sub_data.json', subs), ('ingredient_data.json', ingredients),
+                           ('site_tips.json', tips)):
+        with open(os.path.join(public, filename), 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+    images = os.path.join(public, 'images')
+    try:
+        os.symlink(os.path.join(_ROOT, 'public', 'images'), images, target_is_directory=True)
+    except OSError:
+        shutil.copytree(os.path.join(_ROOT, 'public', 'images'), images)
+
+
+# Measuring
+
+def percentile(samples, p):
+    # Nearest-rank percentile of a list of numbers
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def measure(run, repeat, setup=None):
+    # {"samples_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms", "peak_kb"} for run()
+    samples = []
+    for _ in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    # The first run warms caches (imports, Qt style data); it isn't reported
+    samples = samples[1:]
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"samples_ms": [round(sample, 3) for sample in samples],
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p90_ms": round(percentile(samples, 90), 3),
+            "p99_ms": round(percentile(samples, 99), 3),
+            "max_ms": round(max(samples), 3),
+            "peak_kb": peak // 1024}
+
+
+def _max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def bench_size(app, sub_count, repeat, seed):
+    # [(operation, measurement)] for one catalog size
+    from data_manager import DataManager
+    from main import MainWindow
+
+    base_dir = tempfile.mkdtemp(prefix='subtrainer-bench-')
+    try:
+        subs, ingredients, tips = generate_catalog(sub_count, seed)
+        write_project(base_dir, subs, ingredients, tips)
+        results = []
+
+        def record(operation, run, setup=None):
+            results.append((operation, measure(run, repeat, setup)))
+            print(f"  {operation}: p50 {results[-1][1]['p50_ms']:.1f} ms", file=sys.stderr)
+
+        # Data layer
+        dm = DataManager(base_dir)
+        record("load_data", dm.load_data)
+        data = dm.load_data()
+        record("save_data (all, forced)", lambda: dm.save_data(*data, force=True))
+        # Loading and saving must give back the files as generated, nulls
+        # and all
+        for filename, generated in (('sub_data.json', subs), ('ingredient_data.json', ingredients),
+                                    ('site_tips.json', tips)):
+            with open(os.path.join(base_dir, 'public', filename), encoding='utf-8') as f:
+                if json.load(f) != generated:
+                    raise RuntimeError(f"{filename} changed in a load/save round trip")
+        first_sub = next(sub for cat_subs in data[0].values() for sub in cat_subs)
+
+        def edit_one_sub():
+            first_sub["tip"] = "edited" if first_sub["tip"] != "edited" else "edited again"
+            dm.mark_dirty("subs")
+        record("save_data (one sub edited)", lambda: dm.save_data(*data), setup=edit_one_sub)
+
+        # Editor, with pending layout and paint work included
+        windows = []
+
+        def open_window():
+            windows.append(MainWindow(base_path=base_dir))
+            app.processEvents()
+        record("MainWindow startup", open_window)
+        window = windows[-1]
+        # Opening the catalog must not count as an edit: anything unsaved
+        # here would make outside changes look like conflicts
+        unsaved = window.dm.unsaved_datasets()
+        if unsaved:
+            raise RuntimeError(f"freshly loaded window has unsaved datasets: {sorted(unsaved)}")
+        for other in windows[:-1]:
+            other.dm.stop_save_queue()
+            other.deleteLater()
+        window.show()
+        app.processEvents()
+        sub_editor, ing_editor = window.sub_editor, window.ing_editor
+        all_subs = [sub for cat_subs in window.subs.values() for sub in cat_subs]
+
+        def processed(run):
+            def timed():
+                run()
+                app.processEvents()
+            return timed
+
+        record("SubEditor.refresh_tree", processed(sub_editor.refresh_tree))
+        record("is_sub_incomplete (every sub)",
+               lambda: [sub_editor.is_sub_incomplete(sub) for sub in all_subs])
+        record("IngredientEditor.refresh_list", processed(ing_editor.refresh_list))
+
+        def type_filter(line_edit, text):
+            def run():
+                for i in range(1, len(text) + 1):
+                    line_edit.setText(text[:i])
+                    app.processEvents()
+            return run
+
+        def cleared(editor, line_edit):
+            # Hidden views skip layout and painting, so the filter's list
+            # has to be on screen to be measured
+            def setup():
+                window.tabs.setCurrentWidget(editor)
+                line_edit.clear()
+                app.processEvents()
+            return setup
+        record("ingredient search (type 'bac')", type_filter(ing_editor.search_input, "bac"),
+               setup=cleared(ing_editor, ing_editor.search_input))
+        record("available-ingredient filter (type 'tom')", type_filter(sub_editor.avail_ings_filter, "tom"),
+               setup=cleared(sub_editor, sub_editor.avail_ings_filter))
+        record("command palette search ('pepe')", lambda: window.search.search("pepe"))
+
+        window.dm.stop_save_queue()
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+        return results
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, repeat=5, seed=0):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtCore import QT_VERSION_STR
+    from PyQt6.QtWidgets import QApplication, QMessageBox
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    # Nothing may block on a dialog
+    QMessageBox.information = QMessageBox.warning = QMessageBox.critical = staticmethod(lambda *a, **k: None)
+
+    results = []
+    for size in sizes:
+        print(f"{size} subs", file=sys.stderr)
+        for operation, measurement in bench_size(app, size, repeat, seed):
+            results.append(dict(measurement, size=size, operation=operation))
+    return {"version": RESULTS_VERSION,
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "max_rss_kb": _max_rss_kb(),
+            "results": results}
+
+
+def compare(old, new):
+    # Lines comparing p50 per (size, operation) present in both runs
+    before = {(row["size"], row["operation"]): row for row in old["results"]}
+    lines = [f"{old.get('commit')} -> {new.get('commit')}"]
+    for row in new["results"]:
+        previous = before.get((row["size"], row["operation"]))
+        if previous is None:
+            continue
+        ratio = row["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else float('inf')
+        lines.append(f"{row['size']:>7} {row['operation']:<42} {previous['p50_ms']:>10.1f} -> "
+                     f"{row['p50_ms']:>10.1f} ms  x{ratio:.2f}")
+    return lines
+
+
+def print_table(report):
+    for row in report["results"]:
+        print(f"{row['size']:>7} {row['operation']:<42} p50 {row['p50_ms']:>10.1f}  p90 {row['p90_ms']:>10.1f}  "
+              f"max {row['max_ms']:>10.1f} ms  peak {row['peak_kb']:>8} KB")
+    if report["max_rss_kb"] is not None:
+        print(f"max RSS {report['max_rss_kb']} KB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="editor/benchmark.py", description="Benchmark on generated catalogs")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma separated sub counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results")
+    parser.add_argument("--compare", help="Earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    report = run_benchmarks([int(size) for size in args.sizes.split(",")], args.repeat, args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print_table(report)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            for line in compare(json.load(f), report):
+                print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
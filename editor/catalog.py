@@ -0,0 +1,252 @@
+# Typed records for the catalog: what DataManager.load_data hands the editor
+# in place of the raw dicts json.load returns.
+#
+# Each record keeps its known fields in __slots__ (no per-object dict) and
+# anything else the file held in `extra`, so unknown keys survive a round
+# trip. MISSING stands for "not in the file": an ingredient without "is_lto"
+# is written back without it, while an explicit null stays a null. MISSING
+# is falsy, so `sub.tip or ""` reads either the same. Records also behave
+# as the field-name mappings the rest of the editor was written against
+# (sub['name'], set_fields, journal records), while the hot paths use
+# attributes directly.
+#
+# Ingredient names are interned, so every sub listing "Lettuce" shares one
+# string with the ingredient catalog.
+#
+# Files are written fields first, in FIELDS order, then extras. Files from
+# before SCHEMA_VERSION (no "schema_version" in sorting_config.json) may hold
+# tips as bare strings or keys in another order; migrate() normalizes them
+# once and DataManager writes them back, after which loading is a straight
+# field copy.
+import sys
+from collections.abc import MutableMapping
+
+SCHEMA_VERSION = 1
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "MISSING"
+
+
+# A field the record doesn't have (history.set_fields: a key to remove)
+MISSING = _Missing()
+
+
+class Record(MutableMapping):
+    __slots__ = ('extra',)
+    FIELDS = ()
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, MISSING)
+        self.extra = None
+        for key, value in values.items():
+            self[key] = value
+
+    @classmethod
+    def from_json(cls, data):
+        record = cls.__new__(cls)
+        for field in cls.FIELDS:
+            setattr(record, field, data.get(field, MISSING))
+        extra = {key: value for key, value in data.items() if key not in cls._FIELD_SET}
+        record.extra = extra or None
+        return record
+
+    def to_json(self):
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not MISSING:
+                data[field] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def copy(self):
+        # Structural copy: lists and extras are copied too, like snapshot()
+        record = self.__class__.__new__(self.__class__)
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            setattr(record, field, list(value) if isinstance(value, list) else value)
+        record.extra = _copy_json(self.extra) if self.extra else None
+        return record
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_json()!r})"
+
+    # Mapping access by field name
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if value is MISSING:
+                raise KeyError(key)
+            return value
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def get(self, key, default=None):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            return default if value is MISSING else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return getattr(self, key) is not MISSING
+        return bool(self.extra) and key in self.extra
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELD_SET:
+            if getattr(self, key) is MISSING:
+                raise KeyError(key)
+            setattr(self, key, MISSING)
+        else:
+            if not self.extra:
+                raise KeyError(key)
+            del self.extra[key]
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field) is not MISSING:
+                yield field
+        if self.extra:
+            yield from list(self.extra)
+
+    def __len__(self):
+        return sum(getattr(self, field) is not MISSING for field in self.FIELDS) + len(self.extra or ())
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+
+def _intern_names(names):
+    return [sys.intern(name) if type(name) is str else name for name in names]
+
+
+class Sub(Record):
+    __slots__ = FIELDS = ('name', 'ingredients', 'tip', 'image')
+
+    @classmethod
+    def from_json(cls, data):
+        sub = super().from_json(data)
+        if isinstance(sub.ingredients, list):
+            sub.ingredients = _intern_names(sub.ingredients)
+        return sub
+
+    def __setitem__(self, key, value):
+        if key == 'ingredients' and isinstance(value, list):
+            value = _intern_names(value)
+        super().__setitem__(key, value)
+
+
+class Ingredient(Record):
+    __slots__ = FIELDS = ('category', 'image', 'is_lto')
+
+
+class Tip(Record):
+    __slots__ = FIELDS = ('text', 'icon')
+
+    @classmethod
+    def coerce(cls, tip):
+        # Migration: older files could hold a tip as a bare string, or
+        # leave out (or null) its text or icon
+        if isinstance(tip, str):
+            return cls(text=tip, icon="")
+        tip = cls.from_json(tip)
+        for field in cls.FIELDS:
+            if getattr(tip, field) in (MISSING, None):
+                setattr(tip, field, "")
+        return tip
+
+
+class Config(Record):
+    __slots__ = FIELDS = ('sort_mode', 'ingredient_image_size', 'ui_text_size', 'ingredient_text_size',
+                          'tip_icon', 'schema_version')
+
+
+def _copy_json(data):
+    if isinstance(data, dict):
+        return {key: _copy_json(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_copy_json(value) for value in data]
+    return data
+
+
+def to_json(value):
+    # json.dumps(default=...) hook for data holding records
+    if isinstance(value, Record):
+        return value.to_json()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# Whole datasets, as read from the files
+
+def load_subs(data):
+    intern = sys.intern
+    return {intern(category): [Sub.from_json(sub) for sub in cat_subs] for category, cat_subs in data.items()}
+
+
+def load_ingredients(data):
+    intern = sys.intern
+    return {intern(name): Ingredient.from_json(entry) for name, entry in data.items()}
+
+
+def load_tips(data):
+    return [Tip.from_json(tip) for tip in data]
+
+
+def load_config(data, defaults):
+    return Config.from_json({**defaults, **data})
+
+
+LOADERS = {"subs": load_subs, "ingredients": load_ingredients, "tips": load_tips}
+
+
+def load_dataset(name, data, config_defaults=None):
+    if name == "config":
+        return load_config(data, config_defaults or {})
+    return LOADERS[name](data)
+
+
+def schema_version(config):
+    version = config.get("schema_version")
+    return version if isinstance(version, int) and not isinstance(version, bool) else 0
+
+
+def migrate(raw):
+    # Brings raw datasets ({name: parsed JSON}) from an older schema up to
+    # SCHEMA_VERSION in place. Returns the names whose files need rewriting.
+    changed = set()
+    tips = raw.get("tips")
+    if tips is not None:
+        normalized = [Tip.coerce(tip).to_json() for tip in tips]
+        if normalized != tips:
+            raw["tips"] = normalized
+            changed.add("tips")
+    # Key order only shows in the bytes: records always write theirs
+    for name, record_type in (("subs", Sub), ("ingredients", Ingredient)):
+        data = raw.get(name)
+        if data is None:
+            continue
+        entries = [entry for cat_subs in data.values() for entry in cat_subs] if name == "subs" else data.values()
+        if any(list(entry) != list(record_type.from_json(entry).to_json()) for entry in entries):
+            changed.add(name)
+    changed.add("config")
+    return changed
@@ -0,0 +1,474 @@
+# Headless command-line interface over DataManager (python -m editor).
+# Never imports Qt, so it starts fast and runs on build servers.
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from data_manager import DataManager
+from distractors import numpy_available
+from operations import OperationError, apply_operation
+import profiling
+from publish import publish_site
+from service import serve
+from sub_shards import category_size
+from validation import ERROR
+
+
+def read_operations(sources):
+    # Accepts JSON arrays, {"operations": [...]} objects or JSON Lines,
+    # from files or "-" for stdin.
+    ops = []
+    for source in sources:
+        if source == '-':
+            text = sys.stdin.read()
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                text = f.read()
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            data = [json.loads(line) for line in text.splitlines() if line.strip()]
+        if isinstance(data, dict):
+            data = data.get("operations", [data])
+        ops.extend(data)
+    return ops
+
+
+class Session:
+    # Loaded catalog plus the datasets changed by this invocation
+    def __init__(self, dm):
+        self.dm = dm
+        self.subs, self.ingredients, self.tips, self.config = dm.load_data()
+        self.changed = set()
+
+    def apply(self, ops):
+        for i, op in enumerate(ops):
+            try:
+                self.changed |= apply_operation(self.subs, self.ingredients, self.tips, op,
+                                                      self.dm.ingredient_usage)
+            except OperationError as e:
+                raise OperationError(f"operation {i + 1}: {e}") from None
+        if ops:
+            # Operations don't notify the validator; recheck the edited catalog
+            self.dm.validator.reset(self.subs, self.ingredients, self.tips, self.config)
+
+    def save(self, force=False):
+        if not self.changed and not force:
+            return {}
+        self.dm.mark_dirty(*self.changed)
+        written = self.dm.save_data(self.subs, self.ingredients, self.tips, self.config, force=force)
+        for name in sorted(self.dm.conflicts):
+            if self.dm.store is not None:
+                print(f"warning: {name} changed in {self.dm.db_path} while running; not overwritten",
+                      file=sys.stderr)
+            else:
+                print(f"warning: {self.dm.dataset_paths()[name]} changed on disk while running; not overwritten",
+                      file=sys.stderr)
+        return written
+
+
+def _print_written(written, unit="bytes"):
+    if not written:
+        print("No files changed")
+    for name, size in written.items():
+        print(f"Wrote {name} ({size} {unit})")
+
+
+def _print_saved(session, written):
+    # Saves to catalog.db count rows rather than bytes
+    _print_written(written, "rows" if session.dm.store is not None else "bytes")
+
+
+def cmd_load(session, args):
+    sub_count = sum(category_size(session.subs, category) for category in session.subs)
+    print(f"{len(session.subs)} categories, {sub_count} subs, "
+          f"{len(session.ingredients)} ingredients, {len(session.tips)} tips")
+    recovery = session.dm.recovery
+    if recovery["replayed"]:
+        print(f"Recovered {recovery['replayed']} unsaved edits from the journal")
+    if recovery["rejected"]:
+        print(f"warning: the journal no longer matches the files; kept as {recovery['rejected']}",
+              file=sys.stderr)
+    for path, error in session.dm.load_errors.items():
+        print(f"error: {path}: {error}", file=sys.stderr)
+    return 1 if session.dm.load_errors else 0
+
+
+def _errors(problems, strict=False):
+    return [problem for problem in problems if strict or problem.severity == ERROR]
+
+
+def cmd_validate(session, args):
+    problems = session.dm.validator.report()
+    for problem in problems:
+        print(problem)
+    errors = len(_errors(problems))
+    print(f"{errors} error(s), {len(problems) - errors} warning(s)", file=sys.stderr)
+    return 1 if _errors(problems, args.strict) else 0
+
+
+def cmd_list(session, args):
+    if args.what == "subs" and args.using:
+        if session.dm.store is not None:
+            found = [(cat, session.subs[cat][row]) for cat, row in session.dm.store.subs_using(args.using)]
+        else:
+            found = session.dm.ingredient_usage.users(args.using)
+        rows = [{"category": cat, **sub} for cat, sub in found]
+        lines = [f"{row['category']}\t{row['name']}" for row in rows]
+    elif args.what == "subs":
+        rows = [{"category": cat, **sub} for cat, cat_subs in session.subs.items() for sub in cat_subs]
+        lines = [f"{row['category']}\t{row['name']}" for row in rows]
+    elif args.what == "ingredients":
+        rows = [{"name": name, **data} for name, data in sorted(session.ingredients.items())]
+        lines = [f"{row['name']}\t{row.get('category', '')}\t{row.get('image', '')}" for row in rows]
+    elif args.what == "categories":
+        rows = list(session.subs.keys())
+        lines = rows
+    else:
+        rows = [dict(tip, index=i) for i, tip in enumerate(session.tips)]
+        lines = [f"{row['index']}\t{row['icon']}\t{row['text']}" for row in rows]
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        for line in lines:
+            print(line)
+    return 0
+
+
+def _edit_command(build_op):
+    def run(session, args):
+        session.apply([build_op(args)])
+        if not args.dry_run:
+            _print_saved(session, session.save())
+        return 0
+    return run
+
+
+def cmd_apply(session, args):
+    ops = read_operations(args.files)
+    session.apply(ops)
+    print(f"Applied {len(ops)} operation(s)")
+    if not args.dry_run:
+        _print_saved(session, session.save())
+    return 0
+
+
+def cmd_import_image(session, args):
+    for path in args.paths:
+        relpath = session.dm.import_image(path, kind=args.kind, optimize=not args.no_optimize)
+        if relpath is None:
+            print(f"error: {path}: not found", file=sys.stderr)
+            return 1
+        print(relpath)
+    return 0
+
+
+def cmd_optimize_images(session, args):
+    results, errors = session.dm.optimize_images(webp=args.webp or None, workers=args.workers)
+    before = sum(stats["original_bytes"] for stats in results.values())
+    after = sum(stats["optimized_bytes"] for stats in results.values())
+    print(f"Optimized {len(results)} image(s): {before} -> {after} bytes")
+    for path, error in errors.items():
+        print(f"error: {path}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def cmd_dedupe_images(session, args):
+    replaced = session.dm.dedupe_images(session.subs, session.ingredients)
+    for old, new in sorted(replaced.items()):
+        print(f"{old} -> {new}")
+    _print_saved(session, session.dm.save_data(session.subs, session.ingredients, session.tips, session.config))
+    # The duplicates go only once nothing saved refers to them
+    unsaved = session.dm.unsaved_datasets() & {"subs", "ingredients"}
+    if unsaved:
+        print(f"error: {', '.join(sorted(unsaved))} changed on disk while running; duplicates kept",
+              file=sys.stderr)
+        return 1
+    freed = session.dm.remove_duplicate_images(replaced)
+    print(f"Removed {len(replaced)} duplicate(s), freed {freed} bytes")
+    return 0
+
+
+def cmd_publish(session, args):
+    problems = _errors(session.dm.validator.report())
+    if problems and not args.force:
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        print(f"Refusing to publish with {len(problems)} error(s); use --force to override",
+              file=sys.stderr)
+        return 1
+    _print_saved(session, session.save(force=True))
+    if session.dm.store is not None:
+        _print_written(session.dm.export_json(session.subs, session.ingredients, session.tips, session.config))
+    elif session.dm.sharded:
+        _print_export(session.dm.export_subs(session.subs))
+    # The save above already refreshes an existing bundle; this creates the first one
+    relpath, _ = session.dm.publish_bundle()
+    print(f"Bundle: {relpath}")
+    if numpy_available():
+        _print_distractors(session.dm.build_distractors(session.subs, session.ingredients))
+    else:
+        print("Skipped the quiz distractor bank (needs NumPy)", file=sys.stderr)
+    return 0
+
+
+def _print_export(size):
+    state = "unchanged" if size is None else f"{size} bytes"
+    print(f"Exported sub_data.json ({state})")
+
+
+def cmd_shard_subs(session, args):
+    if session.dm.sharded:
+        print("The subs are already sharded")
+        return 0
+    if session.dm.store is not None:
+        print("error: the SQLite backend exports a single sub_data.json; nothing to shard", file=sys.stderr)
+        return 1
+    _print_written(session.dm.shard_subs(session.subs))
+    return 0
+
+
+def cmd_merge_subs(session, args):
+    if not session.dm.sharded:
+        print("The subs are not sharded")
+        return 0
+    _print_export(session.dm.merge_subs(session.subs))
+    return 0
+
+
+def cmd_export_subs(session, args):
+    _print_export(session.dm.export_subs(session.subs))
+    return 0
+
+
+def cmd_import_json(session, args):
+    # The session was loaded from the JSON files (see the parser)
+    _print_saved(session, session.dm.import_sqlite(session.subs, session.ingredients, session.tips,
+                                                  session.config))
+    print(f"Created {session.dm.db_path}")
+    return 0
+
+
+def cmd_export_json(session, args):
+    if session.dm.store is None:
+        print("error: no catalog.db; the JSON files are already the catalog", file=sys.stderr)
+        return 1
+    _print_written(session.dm.export_json(session.subs, session.ingredients, session.tips, session.config))
+    return 0
+
+
+def cmd_serve(session, args):
+    return serve(session.dm, (session.subs, session.ingredients, session.tips, session.config),
+                 args.host, args.port, args.window)
+
+
+def _print_distractors(result):
+    recomputed, size = result
+    state = "unchanged" if size is None else f"{size} bytes"
+    print(f"Distractor bank: {recomputed} sub(s) recomputed, {state}")
+
+
+def cmd_build_distractors(session, args):
+    _print_distractors(session.dm.build_distractors(session.subs, session.ingredients))
+    return 0
+
+
+def cmd_publish_site(session, args):
+    problems = _errors(session.dm.validator.report())
+    if problems and not args.force:
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        print(f"Refusing to publish with {len(problems)} error(s); use --force to override",
+              file=sys.stderr)
+        return 1
+    summary = publish_site(session.dm, session.subs, session.ingredients, session.tips, session.config,
+                           site_dir=args.site, workers=args.workers,
+                           use_brotli=False if args.no_brotli else None,
+                           host_configs=not args.no_host_configs)
+    print(f"Fingerprinted {summary['images']} image(s)")
+    print(f"Bundle: {summary['bundle']}")
+    print(f"Compressed {summary['compressed']} file(s), {summary['unchanged']} unchanged")
+    for name in summary["host_configs"]:
+        print(f"Updated {name}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m editor", description="Sub Trainer data tools")
+    parser.add_argument("--base", help="Project root containing public/ (default: this checkout)")
+    parser.add_argument("--backend", choices=["json", "sqlite"],
+                        help="Edit public/*.json or catalog.db (default: catalog.db if it exists)")
+    parser.add_argument("--server", help="Work against an editing service (see serve) at this URL")
+    parser.add_argument("--profile", metavar="TRACE", help="Time data file I/O and write a Chrome trace here")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("load", help="Load the data and print a summary")
+    p.set_defaults(func=cmd_load)
+
+    p = commands.add_parser("validate", help="Report catalog problems; exits 1 on errors")
+    p.add_argument("--strict", action="store_true", help="Also fail on warnings")
+    p.set_defaults(func=cmd_validate)
+
+    p = commands.add_parser("list", help="List categories, subs, ingredients or tips")
+    p.add_argument("what", choices=["categories", "subs", "ingredients", "tips"])
+    p.add_argument("--json", action="store_true", help="Print JSON instead of tab separated text")
+    p.add_argument("--using", metavar="INGREDIENT", help="Only the subs listing this ingredient")
+    p.set_defaults(func=cmd_list)
+
+    def edit_parser(name, help_text):
+        sub = commands.add_parser(name, help=help_text)
+        kinds = sub.add_subparsers(dest="kind", required=True)
+        return kinds
+
+    def kind_parser(kinds, kind, build_op):
+        p = kinds.add_parser(kind)
+        p.add_argument("--dry-run", action="store_true", help="Apply in memory only")
+        p.set_defaults(func=_edit_command(build_op))
+        return p
+
+    kinds = edit_parser("add", "Add a category, sub, ingredient or tip")
+    p = kind_parser(kinds, "category", lambda a: {"op": "add", "kind": "category", "name": a.name})
+    p.add_argument("name")
+    p = kind_parser(kinds, "sub", lambda a: {
+        "op": "add", "kind": "sub", "category": a.category, "name": a.name,
+        "ingredients": a.ingredient, "tip": a.tip, "image": a.image})
+    p.add_argument("category")
+    p.add_argument("name")
+    p.add_argument("--ingredient", "-i", action="append", default=[])
+    p.add_argument("--tip", default="")
+    p.add_argument("--image", default="")
+    p = kind_parser(kinds, "ingredient", lambda a: {
+        "op": "add", "kind": "ingredient", "name": a.name, "category": a.category,
+        "image": a.image, "is_lto": a.lto})
+    p.add_argument("name")
+    p.add_argument("--category", default="Meats")
+    p.add_argument("--image", default="")
+    p.add_argument("--lto", action="store_true")
+    p = kind_parser(kinds, "tip", lambda a: {"op": "add", "kind": "tip", "text": a.text, "icon": a.icon})
+    p.add_argument("text")
+    p.add_argument("--icon", default="")
+
+    kinds = edit_parser("rename", "Rename a category, sub or ingredient, or replace a tip's text")
+    p = kind_parser(kinds, "category", lambda a: {
+        "op": "rename", "kind": "category", "name": a.name, "new_name": a.new_name})
+    p.add_argument("name")
+    p.add_argument("new_name")
+    p = kind_parser(kinds, "sub", lambda a: {
+        "op": "rename", "kind": "sub", "category": a.category, "name": a.name, "new_name": a.new_name})
+    p.add_argument("category")
+    p.add_argument("name")
+    p.add_argument("new_name")
+    p = kind_parser(kinds, "ingredient", lambda a: {
+        "op": "rename", "kind": "ingredient", "name": a.name, "new_name": a.new_name})
+    p.add_argument("name")
+    p.add_argument("new_name")
+    p = kind_parser(kinds, "tip", lambda a: {"op": "rename", "kind": "tip", "index": a.index, "text": a.text})
+    p.add_argument("index", type=int)
+    p.add_argument("text")
+
+    kinds = edit_parser("delete", "Delete a category, sub, ingredient or tip")
+    p = kind_parser(kinds, "category", lambda a: {"op": "delete", "kind": "category", "name": a.name})
+    p.add_argument("name")
+    p = kind_parser(kinds, "sub", lambda a: {
+        "op": "delete", "kind": "sub", "category": a.category, "name": a.name})
+    p.add_argument("category")
+    p.add_argument("name")
+    p = kind_parser(kinds, "ingredient", lambda a: {"op": "delete", "kind": "ingredient", "name": a.name})
+    p.add_argument("name")
+    p = kind_parser(kinds, "tip", lambda a: {"op": "delete", "kind": "tip", "index": a.index})
+    p.add_argument("index", type=int)
+
+    p = commands.add_parser("apply", help="Apply a batch of JSON operations with a single save")
+    p.add_argument("files", nargs="+", help="JSON/JSON Lines files, or - for stdin")
+    p.add_argument("--dry-run", action="store_true", help="Validate the batch without saving")
+    p.set_defaults(func=cmd_apply)
+
+    p = commands.add_parser("import-image", help="Import images into public/images")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--kind", choices=["ingredient", "sub"], default="ingredient")
+    p.add_argument("--no-optimize", action="store_true", help="Copy the file as-is")
+    p.set_defaults(func=cmd_import_image)
+
+    p = commands.add_parser("optimize-images", help="Resize and recompress the whole image library")
+    p.add_argument("--webp", action="store_true", help="Also write WebP copies")
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=cmd_optimize_images)
+
+    p = commands.add_parser("dedupe-images", help="Collapse byte-identical images and fix references")
+    p.set_defaults(func=cmd_dedupe_images)
+
+    p = commands.add_parser("publish", help="Validate, write every data file and the data bundle to public/")
+    p.add_argument("--force", action="store_true", help="Publish even if validation fails")
+    p.set_defaults(func=cmd_publish)
+
+    p = commands.add_parser("shard-subs", help="Store the subs as one file per category under public/subs/")
+    p.set_defaults(func=cmd_shard_subs)
+
+    p = commands.add_parser("merge-subs", help="Go back to a single public/sub_data.json")
+    p.set_defaults(func=cmd_merge_subs)
+
+    p = commands.add_parser("export-subs", help="Write the sharded subs to public/sub_data.json for the trainer")
+    p.set_defaults(func=cmd_export_subs)
+
+    p = commands.add_parser("import-json", help="Create catalog.db from public/*.json and edit that from now on")
+    p.set_defaults(func=cmd_import_json, backend="json")
+
+    p = commands.add_parser("export-json", help="Write public/*.json from catalog.db for the trainer")
+    p.set_defaults(func=cmd_export_json)
+
+    p = commands.add_parser("serve", help="Serve the catalog over HTTP so several editors can work on it at once")
+    p.add_argument("--host", default="127.0.0.1", help="Address to listen on (no authentication; keep it local)")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--window", type=float, default=0.02,
+                   help="Seconds a save waits for concurrent edits to join it")
+    p.set_defaults(func=cmd_serve)
+
+    p = commands.add_parser("build-distractors",
+                            help="Rebuild public/quiz_distractors.json from ingredient similarity")
+    p.set_defaults(func=cmd_build_distractors)
+
+    p = commands.add_parser("publish-site", help="Fingerprint, precompress and set cache rules for the built site")
+    p.add_argument("--site", help="Built site directory (default: dist/)")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--no-brotli", action="store_true", help="Only write .gz siblings")
+    p.add_argument("--no-host-configs", action="store_true",
+                   help="Leave netlify.toml, vercel.json, web.config and .htaccess alone")
+    p.add_argument("--force", action="store_true", help="Publish even if validation fails")
+    p.set_defaults(func=cmd_publish_site)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.server and args.func is cmd_serve:
+        print("error: serve works on local data; drop --server", file=sys.stderr)
+        return 2
+    if args.profile:
+        profiling.enable()
+    session = Session(DataManager(args.base, args.backend, args.server))
+    try:
+        status = args.func(session, args)
+        sys.stdout.flush()
+        return status
+    except BrokenPipeError:
+        # The reader went away (`list subs | head`): it has what it wanted.
+        # Point stdout at devnull so the flush at exit can't fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (OperationError, OSError, RuntimeError, json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.profile:
+            profiling.disable().export(args.profile)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# Ctrl+K palette for jumping to any sub, ingredient or tip, backed by a
+# SearchIndex that follows the editor models' row notifications.
+from PyQt6.QtCore import Qt, QObject, QEvent
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem, QLabel
+
+from search_index import SearchIndex
+
+KIND_LABELS = {"sub": "Sub", "ingredient": "Ingredient", "tip": "Tip"}
+
+
+class CatalogSearch(QObject):
+    # Keeps a SearchIndex in step with the ingredient, sub and tip models.
+    # The index is built on first search, then updated row by row.
+    def __init__(self, ingredient_model, sub_model, tip_model, parent=None):
+        super().__init__(parent)
+        self.ingredient_model = ingredient_model
+        self.sub_model = sub_model
+        self.tip_model = tip_model
+        self.index = SearchIndex()
+        self.built = False
+
+        for model in (ingredient_model, sub_model, tip_model):
+            model.modelReset.connect(self.invalidate)
+
+        ingredient_model.rowsInserted.connect(self.on_ingredients_inserted)
+        ingredient_model.rowsAboutToBeRemoved.connect(self.on_ingredients_removed)
+        ingredient_model.dataChanged.connect(self.on_ingredients_changed)
+
+        sub_model.rowsInserted.connect(self.on_subs_inserted)
+        sub_model.rowsAboutToBeRemoved.connect(self.on_subs_removed)
+        sub_model.dataChanged.connect(self.on_subs_changed)
+
+        tip_model.rowsInserted.connect(self.reindex_tips)
+        tip_model.rowsRemoved.connect(self.reindex_tips)
+        tip_model.dataChanged.connect(self.reindex_tips)
+
+    def invalidate(self):
+        self.built = False
+        self.index.clear()
+
+    def search(self, query, limit=50):
+        if not self.built:
+            self.index.index_catalog(self.sub_model.subs, self.ingredient_model.ingredients,
+                                     self.tip_model.tips)
+            self.built = True
+        return self.index.search(query, limit)
+
+    # Ingredients
+
+    def _add_ingredient_rows(self, first, last):
+        model = self.ingredient_model
+        for name in model.names[first:last + 1]:
+            self.index.add_ingredient(name, model.ingredients.get(name, {}))
+
+    def on_ingredients_inserted(self, parent, first, last):
+        if self.built:
+            self._add_ingredient_rows(first, last)
+
+    def on_ingredients_removed(self, parent, first, last):
+        if self.built:
+            for name in self.ingredient_model.names[first:last + 1]:
+                self.index.remove_ingredient(name)
+
+    def on_ingredients_changed(self, top_left, bottom_right, roles=()):
+        if self.built:
+            self._add_ingredient_rows(top_left.row(), bottom_right.row())
+
+    # Subs
+
+    def _category_subs(self, parent):
+        category = parent.data()
+        return category, self.sub_model.subs.get(category, [])
+
+    def on_subs_inserted(self, parent, first, last):
+        # Inserted categories are always empty, so only sub rows matter
+        if self.built and parent.isValid():
+            category, subs = self._category_subs(parent)
+            for sub in subs[first:last + 1]:
+                self.index.add_sub(category, sub)
+
+    def on_subs_removed(self, parent, first, last):
+        if not self.built:
+            return
+        if parent.isValid():
+            _, subs = self._category_subs(parent)
+            for sub in subs[first:last + 1]:
+                self.index.remove_sub(sub)
+        else:
+            for row in range(first, last + 1):
+                _, subs = self._category_subs(self.sub_model.index(row, 0))
+                for sub in subs:
+                    self.index.remove_sub(sub)
+
+    def on_subs_changed(self, top_left, bottom_right, roles=()):
+        if not self.built or list(roles) == [Qt.ItemDataRole.ForegroundRole]:
+            return  # Validation repaint only
+        parent = top_left.parent()
+        if parent.isValid():
+            category, subs = self._category_subs(parent)
+            for sub in subs[top_left.row():bottom_right.row() + 1]:
+                self.index.add_sub(category, sub)
+
+    # Tips (a handful of entries; reindexing them all is cheapest)
+
+    def reindex_tips(self, *args):
+        if self.built:
+            self.index.clear("tip")
+            for tip in self.tip_model.tips:
+                self.index.add_tip(tip)
+
+
+class CommandPalette(QDialog):
+    # Built once and reused. After exec() returns Accepted, selected_entry
+    # holds the chosen SearchEntry.
+    def __init__(self, search, parent=None):
+        super().__init__(parent)
+        self.search = search
+        self.selected_entry = None
+        self.entries = []
+        self.setWindowTitle("Go to...")
+        self.resize(600, 400)
+
+        layout = QVBoxLayout(self)
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Search subs, ingredients and tips...")
+        self.query_edit.textChanged.connect(self.update_results)
+        self.query_edit.returnPressed.connect(self.accept_current)
+        self.query_edit.installEventFilter(self)
+        layout.addWidget(self.query_edit)
+
+        self.results = QListWidget()
+        self.results.itemActivated.connect(self.accept_current)
+        layout.addWidget(self.results)
+
+        hint = QLabel("Enter to open, arrows to move, Esc to close")
+        hint.setStyleSheet("color: gray; font-style: italic; font-size: 10px;")
+        layout.addWidget(hint)
+
+    def eventFilter(self, obj, event):
+        # Let the arrow keys move through results while typing
+        if obj is self.query_edit and event.type() == QEvent.Type.KeyPress:
+            if event.key() in (Qt.Key.Key_Down, Qt.Key.Key_Up):
+                step = 1 if event.key() == Qt.Key.Key_Down else -1
+                row = min(max(self.results.currentRow() + step, 0), self.results.count() - 1)
+                self.results.setCurrentRow(row)
+                return True
+        return super().eventFilter(obj, event)
+
+    def update_results(self):
+        self.results.clear()
+        self.entries = self.search.search(self.query_edit.text(), limit=50)
+        for entry in self.entries:
+            label = entry.label if len(entry.label) < 70 else entry.label[:67] + "..."
+            item = QListWidgetItem(f"{label}    [{KIND_LABELS[entry.kind]} · {entry.detail}]")
+            self.results.addItem(item)
+        if self.entries:
+            self.results.setCurrentRow(0)
+
+    def accept_current(self, *args):
+        row = self.results.currentRow()
+        if 0 <= row < len(self.entries):
+            self.selected_entry = self.entries[row]
+            self.accept()
+
+    def exec(self):
+        self.selected_entry = None
+        self.query_edit.clear()
+        self.query_edit.setFocus()
+        return super().exec()
@@ -1,9 +1,43 @@
+import hashlib
 import json
 import os
 import shutil
+import sqlite3
+import threading
+
+import catalog
+import distractors
+import image_pipeline
+import profiling
+from history import EditHistory
+from image_store import ImageStore, hash_file
+from journal import PENDING, Journal, apply_record, encode, record_datasets
+from ingredient_usage import IngredientUsage
+from validation import CatalogValidator
+from save_queue import SaveQueue, snapshot
+from remote_store import RemoteStore
+from sqlite_store import SqliteStore, StoreError
+from sub_shards import INDEX_VERSION, ShardedSubs, shard_filename
+
+# Dataset names, in the order save_data writes them
+DATASETS = ("subs", "ingredients", "tips", "config")
+
+# sorting_config.json values used where the file leaves them out
+DEFAULT_CONFIG = {
+    "sort_mode": "category",
+    "ingredient_image_size": 64,
+    "ui_text_size": 20,
+    "ingredient_text_size": 15,
+    "tip_icon": "💡"
+}
 
 class DataManager:
-    def __init__(self, base_path=None):
+    def __init__(self, base_path=None, backend=None, server=None):
+        # backend: "json" (edit public/*.json directly) or "sqlite" (edit
+        # catalog.db and export the JSON; see sqlite_store). By default
+        # catalog.db is used once import_sqlite has created it.
+        # server: URL of an editing service (see service.py) holding the
+        # catalog instead; public/ is then only used for images.
         if base_path is None:
             # Assume we are in editor/ and want to go to public/
             self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -16,75 +50,1047 @@ class DataManager:
         self.tips_path = os.path.join(self.public_dir, 'site_tips.json')
         self.config_path = os.path.join(self.public_dir, 'sorting_config.json')
         self.images_dir = os.path.join(self.public_dir, 'images')
+        # Optional sharded layout for the subs (see sub_shards): one file per
+        # category under public/subs/, listed by index.json. sub_data.json is
+        # then a compatibility export that export_subs writes.
+        self.shards_dir = os.path.join(self.public_dir, 'subs')
+        self.shard_index_path = os.path.join(self.shards_dir, 'index.json')
+        self.sharded = os.path.exists(self.shard_index_path)
+        # SQLite backend: the editor's working copy of the catalog, with
+        # public/*.json as its export
+        self.db_path = os.path.join(self.base_dir, 'catalog.db')
+        if backend not in (None, "json", "sqlite"):
+            raise ValueError(f"Unknown backend: {backend}")
+        if backend is None:
+            backend = "sqlite" if os.path.exists(self.db_path) else "json"
+        self.remote = server
+        if server is not None:
+            self.store = RemoteStore(server)
+        else:
+            self.store = SqliteStore(self.db_path) if backend == "sqlite" else None
+        if self.store is not None:
+            # Exports always write the single sub_data.json
+            self.sharded = False
+        # Published bundle: all four datasets in one content-hashed file, plus a
+        # small manifest the trainer revalidates to find the current one
+        self.bundle_dir = os.path.join(self.public_dir, 'data')
+        self.manifest_path = os.path.join(self.bundle_dir, 'manifest.json')
+        # The built trainer (npm run build) that publish-site post-processes
+        self.site_dir = os.path.join(self.base_dir, 'dist')
+        self.image_index_path = os.path.join(self.public_dir, 'image_index.json')
+        # Quiz distractor bank (see distractors.py)
+        self.distractors_path = os.path.join(self.public_dir, 'quiz_distractors.json')
+        self.image_store = ImageStore(self.images_dir, self.image_index_path)
+        # Editor-only scratch data (never deployed)
+        self.cache_dir = os.path.join(self.base_dir, '.cache')
+        self.thumbnail_cache_dir = os.path.join(self.cache_dir, 'thumbnails')
+        self.image_stats_path = os.path.join(self.cache_dir, 'image_stats.json')
+        self.distractor_state_path = os.path.join(self.cache_dir, 'distractor_state.json')
+        # Write-ahead journal of edits not yet consolidated into the JSON files
+        self.journal = Journal(os.path.join(self.base_dir, '.editor_journal'))
 
-    def load_data(self):
-        subs = {}
-        ingredients = {}
-        tips = []
-        config = {
-            "sort_mode": "category",
-            "ingredient_image_size": 64,
-            "ui_text_size": 20,
-            "ingredient_text_size": 15,
-            "tip_icon": "💡"
+        # Config from the last load_data; image sizing reads from it
+        self.config = {}
+        # Subs from the last load_data; journal records locate subs in it
+        self.subs = {}
+
+        # Fingerprint of each dataset as last read from / written to disk,
+        # and the datasets callers have marked as changed since then.
+        self._fingerprints = {}
+        self._dirty = set()
+        # (mtime, size) of each data file when last read or written, so
+        # poll_external only re-reads files that were touched; a stand-in
+        # for the contents of images/ (see poll_images); and datasets that
+        # changed on disk while the editor had unsaved edits to them, which
+        # saves leave alone until the editor resolves them.
+        self._disk_stats = {}
+        # Line ending each data file was read with, so rewrites keep it
+        self._line_endings = {}
+        self._images_seen = None
+        self.conflicts = set()
+        # Shard file -> its index.json entry, as on disk
+        self._shard_entries = {}
+        # path -> parse error for files load_data had to fall back on defaults for
+        self.load_errors = {}
+        # Serializes saves between save_data and the background writer; held
+        # through serializing and staging, so the GUI thread never waits on it
+        # outside an explicit save
+        self._write_lock = threading.RLock()
+        # Held for the short steps that move files into place and update what
+        # the editor knows of them (and for catalog.db, whose connection the
+        # row edits share)
+        self._io_lock = threading.RLock()
+        # Guards the journal file, _journaled and _journal_seq, so journaling
+        # an edit only waits for another append or a checkpoint
+        self._journal_lock = threading.RLock()
+        # Imports share a staging file and the image index
+        self._image_lock = threading.Lock()
+        self.save_queue = None
+        # Which subs use each ingredient; rebuilt by load_data, then kept up
+        # to date by whoever edits the subs (operations, SubTreeModel)
+        self.ingredient_usage = IngredientUsage()
+        # Cached validation report over the loaded catalog; editors notify it
+        # of changes so only the affected entities get rechecked
+        self.validator = CatalogValidator(self.images_dir, self.get_ingredient_categories(),
+                                          self.ingredient_usage, self.load_errors)
+        # Undo/redo log of editor changes; its records point into the
+        # loaded data, so load_data starts it afresh
+        self.history = EditHistory()
+        # Sequence number of the newest journaled edit, the (seq, record)
+        # pairs not yet in the files, and what load_data recovered:
+        # {"replayed": edits, "rejected": path of a journal set aside}
+        self._journal_seq = 0
+        self._journaled = []
+        self.recovery = {"replayed": 0, "rejected": None}
+        # SQLite backend: revision of each dataset as last read from / written
+        # to catalog.db, datasets whose edits since the last save request all
+        # went in as rows, and datasets a row edit failed for (out of step
+        # with the database until a save replaces them whole)
+        self._revisions = {}
+        self._recorded = set()
+        self._stale = set()
+
+    def dataset_paths(self):
+        return {
+            "subs": self.shard_index_path if self.sharded else self.sub_data_path,
+            "ingredients": self.ingredient_data_path,
+            "tips": self.tips_path,
+            "config": self.config_path,
         }
-        
-        if os.path.exists(self.sub_data_path):
+
+    def _fingerprint(self, text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _serialize(self, data):
+        return json.dumps(data, indent=2, default=catalog.to_json)
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _disk_fingerprint(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return self._fingerprint(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _read_json(self, name, path):
+        # Returns parsed JSON (or None if missing/invalid) and records the
+        # fingerprint of the text on disk so unchanged data is never rewritten
+        # and changes made by anyone else are noticed.
+        self._fingerprints.pop(name, None)
+        self.load_errors.pop(path, None)
+        self._disk_stats[name] = self._stat(path)
+        if not os.path.exists(path):
+            return None
+        filename = os.path.relpath(path, self.public_dir)
+        with profiling.span("read", file=filename, bytes=self._disk_stats[name][1]), \
+                open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+            self._line_endings[name] = f.newlines if f.newlines in ('\n', '\r\n') else None
+        self._fingerprints[name] = self._fingerprint(text)
+        try:
+            with profiling.span("parse", file=filename):
+                data = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.load_errors[path] = str(e)
+            return None
+        return data
+
+    def _write_temp(self, path, text, suffix='.tmp', newline=None):
+        tmp_path = path + suffix
+        with open(tmp_path, 'w', encoding='utf-8', newline=newline) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def _write_file(self, path, text):
+        # Write to a temp file next to the target and rename over it, so a
+        # crash mid-write never leaves a truncated JSON file behind.
+        os.replace(self._write_temp(path, text), path)
+
+    @profiling.profiled("DataManager.write_snapshot")
+    def write_snapshot(self, datasets, force=False, seq=None):
+        # datasets: {dataset name: data}. Used by save_data and the save queue.
+        # seq: the newest journaled edit the data includes (default: all).
+        # Returns {dataset name: bytes (rows, for catalog.db) written}.
+        if self.store is not None:
+            return self._store_datasets(datasets, force)
+        return self._write_files(datasets, force, seq)
+
+    def _write_files(self, datasets, force=False, seq=None):
+        # Changed files are staged, committed in the journal and then renamed
+        # into place, so a crash part way leaves a save load_data can finish.
+        # Serializing and the fsync'd staging happen before _io_lock is taken.
+        written = {}
+        paths = self.dataset_paths()
+        with self._write_lock:
+            if seq is None:
+                seq = self._journal_seq
+            staged = {}
+            # Sharded subs: the changed shards, renamed into place before
+            # index.json, and the index entries that go with them
+            shards, index = {}, None
+            for name in DATASETS:
+                if name not in datasets:
+                    continue
+                if not force and self._changed_on_disk(name, paths[name]):
+                    # Someone else rewrote the file since it was read; the
+                    # editor decides who wins (see poll_external)
+                    self.conflicts.add(name)
+                    continue
+                filename = os.path.relpath(paths[name], self.public_dir)
+                with profiling.span("serialize", file=filename):
+                    if isinstance(datasets[name], ShardedSubs):
+                        index, shards = self._stage_shards(datasets[name], force)
+                        text = self._serialize({"version": INDEX_VERSION, "categories": index})
+                    else:
+                        text = self._serialize(datasets[name])
+                    fingerprint = self._fingerprint(text)
+                if force or self._fingerprints.get(name) != fingerprint:
+                    size = len(text.encode('utf-8'))
+                    with profiling.span("write", file=filename, bytes=size):
+                        staged[name] = (self._write_temp(paths[name], text, PENDING,
+                                                         self._line_endings.get(name)), fingerprint, size)
+            with self._io_lock, self._journal_lock:
+                for name in [name for name in staged if not force and name in self.conflicts]:
+                    # poll_external found a competing edit while this staged
+                    os.remove(staged.pop(name)[0])
+                    if name == "subs":
+                        for staged_path, _, _ in shards.values():
+                            os.remove(staged_path)
+                        shards, index = {}, None
+                if len(staged) + len(shards) > 1 or (staged and self.journal.exists()):
+                    commit = {"commit": seq, "files": {name: entry[1] for name, entry in staged.items()}}
+                    if shards:
+                        commit["shards"] = {filename: entry[1] for filename, entry in shards.items()}
+                    self._journal_append([commit])
+                for filename, (staged_path, fingerprint, size) in shards.items():
+                    os.replace(staged_path, os.path.join(self.shards_dir, filename))
+                for name, (staged_path, fingerprint, size) in staged.items():
+                    os.replace(staged_path, paths[name])
+                    self._fingerprints[name] = fingerprint
+                    self._disk_stats[name] = self._stat(paths[name])
+                    written[name] = size
+                if "subs" in staged and index is not None:
+                    written["subs"] += sum(entry[2] for entry in shards.values())
+                    self._remove_old_shards(index)
+                self._checkpoint(seq)
+            # Once a bundle has been published, keep it in step with the
+            # files. Sharded subs go into it through export_subs instead.
+            if written and os.path.exists(self.manifest_path):
+                self.publish_bundle({name: data for name, data in datasets.items()
+                                     if not isinstance(data, ShardedSubs)})
+        return written
+
+    # SQLite backend
+
+    def _store_datasets(self, datasets, force=False):
+        # Replaces whole datasets in catalog.db, except those someone else
+        # has written since the editor last read them (unless forced)
+        with self._io_lock:
+            if not force:
+                datasets = {name: data for name, data in datasets.items() if name not in self.conflicts}
+            with profiling.span("store write", store=self.store_name(), datasets=",".join(datasets)) as span:
+                written, revisions = self.store.replace(datasets, None if force else self._revisions)
+                span.note(rows=sum(written.values()))
+            self.conflicts |= datasets.keys() - written.keys()
+            self._revisions.update(revisions)
+            self._stale -= written.keys()
+        return written
+
+    def store_name(self):
+        # Where the catalog is kept, for messages
+        return self.remote or os.path.basename(self.db_path)
+
+    def _load_store(self):
+        if self.remote is None and self.journal.exists():
+            # Only an interrupted JSON export can have left one
+            self._recover_journal()
+            self.journal.rewrite([])
+        with profiling.span("store read", store=self.store_name()):
+            loaded, self._revisions = self.store.load()
+        config = catalog.load_config(loaded["config"], DEFAULT_CONFIG)
+        return loaded["subs"], loaded["ingredients"], loaded["tips"], config
+
+    def import_sqlite(self, subs, ingredients, tips, config):
+        # Creates catalog.db from the loaded JSON data (replacing whatever it
+        # held) and switches to it. Returns {dataset name: rows written}.
+        store = self.store or SqliteStore(self.db_path)
+        with self._io_lock:
+            written, self._revisions = store.replace(
+                {"subs": dict(subs.items()), "ingredients": ingredients, "tips": tips, "config": config})
+            self.store, self.sharded = store, False
+            self.journal.rewrite([])
+            self._journaled = []
+        self.subs = subs
+        return written
+
+    def export_json(self, subs, ingredients, tips, config):
+        # Writes public/*.json (and the published bundle, if there is one)
+        # from the catalog, for the trainer. Only files whose content changed
+        # are rewritten. Returns {dataset name: bytes written}.
+        data = {"subs": subs, "ingredients": ingredients, "tips": tips, "config": config}
+        paths = self.dataset_paths()
+        with self._write_lock:
+            for name in DATASETS:
+                # Current fingerprints and line endings; the database is
+                # what's authoritative, so any edit to the files is overwritten
+                self._read_json(name, paths[name])
+            return self._write_files(data, force=False, seq=0)
+
+    def _unstored(self):
+        # SQLite backend: dirty datasets that didn't all reach catalog.db as rows
+        return (self._dirty - self._recorded) | self._stale
+
+    # Sharded subs
+
+    def _open_shards(self, index):
+        # ShardedSubs over index.json as read from disk
+        self._shard_entries = {entry["file"]: entry for entry in index.get("categories", ())}
+        return ShardedSubs(index, self._load_shard)
+
+    def _load_shard(self, entry):
+        path = os.path.join(self.shards_dir, entry["file"])
+        self.load_errors.pop(path, None)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            # Reported by validation; saves leave the file alone until it reads
+            self.load_errors[path] = str(e)
+            return []
+        return [catalog.Sub.from_json(sub) for sub in data]
+
+    def _stage_shards(self, subs, force=False):
+        # Stages the shards of loaded categories whose contents changed.
+        # Returns (index entries, {file: (staged path, fingerprint, bytes)}).
+        # Categories that were never loaded can't have changed; they keep
+        # their entry as it is on disk.
+        newline = self._line_endings.get("subs")
+        entries = {category: subs.entry(category) for category in subs}
+        taken = {entry["file"] for entry in entries.values() if entry}
+        index, staged = [], {}
+        for category, entry in entries.items():
+            if entry is not None:
+                path = os.path.join(self.shards_dir, entry["file"])
+                if not subs.is_loaded(category) or (path in self.load_errors and not subs[category]):
+                    index.append(dict(self._shard_entries.get(entry["file"], entry), name=category))
+                    continue
+                filename = entry["file"]
+            else:
+                # New category; reuse the file a previous save gave it
+                filename = next((name for name, old in self._shard_entries.items()
+                                 if old["name"] == category and name not in taken), None)
+                filename = filename or shard_filename(category, taken)
+                taken.add(filename)
+            cat_subs = subs[category]
+            text = self._serialize(cat_subs)
+            fingerprint = self._fingerprint(text)
+            old = self._shard_entries.get(filename)
+            if force or old is None or old.get("hash") != fingerprint:
+                staged[filename] = (self._write_temp(os.path.join(self.shards_dir, filename), text,
+                                                     PENDING, newline), fingerprint,
+                                    len(text.encode('utf-8')))
+            index.append({"name": category, "file": filename, "subs": len(cat_subs), "hash": fingerprint,
+                          "ingredients": sorted({name for sub in cat_subs for name in sub.ingredients or ()},
+                                                key=str)})
+        return index, staged
+
+    def _remove_old_shards(self, index):
+        # After index.json has been replaced: drop shards it no longer lists
+        old, self._shard_entries = self._shard_entries, {entry["file"]: entry for entry in index}
+        for filename in old.keys() - self._shard_entries.keys():
             try:
+                os.remove(os.path.join(self.shards_dir, filename))
+            except FileNotFoundError:
+                pass
+
+    def shard_subs(self, subs):
+        # Switches the subs to the sharded layout. sub_data.json stays as the
+        # compatibility export. Returns {dataset name: bytes written}.
+        sharded = ShardedSubs({}, self._load_shard)
+        sharded.update(subs)
+        with self._write_lock:
+            os.makedirs(self.shards_dir, exist_ok=True)
+            self.sharded = True
+            self._shard_entries = {}
+            self._fingerprints.pop("subs", None)
+            self._disk_stats.pop("subs", None)
+            written = self.write_snapshot({"subs": sharded}, force=True)
+        self.subs = sharded
+        return written
+
+    def merge_subs(self, subs):
+        # Back to the single sub_data.json: exports it and removes public/subs/
+        size = self.export_subs(subs)
+        with self._io_lock:
+            self.sharded = False
+            self._shard_entries = {}
+            shutil.rmtree(self.shards_dir)
+            self._read_json("subs", self.sub_data_path)
+        return size
+
+    def export_subs(self, subs):
+        # Compatibility export of sharded subs: the single sub_data.json the
+        # trainer reads, plus the published bundle if there is one. Saves
+        # don't write it; publishing and force saves call this. Loads every
+        # category. Returns the bytes written, or None if it was current.
+        plain = dict(subs.items())
+        text = self._serialize(plain)
+        with self._io_lock:
+            if os.path.exists(self.sub_data_path):
                 with open(self.sub_data_path, 'r', encoding='utf-8') as f:
-                    subs = json.load(f)
-            except json.JSONDecodeError:
-                subs = {}
-                
-        if os.path.exists(self.ingredient_data_path):
-            try:
-                with open(self.ingredient_data_path, 'r', encoding='utf-8') as f:
-                    ingredients = json.load(f)
-            except json.JSONDecodeError:
-                ingredients = {}
-                
-        if os.path.exists(self.tips_path):
-            try:
-                with open(self.tips_path, 'r', encoding='utf-8') as f:
-                    tips = json.load(f)
-            except json.JSONDecodeError:
-                tips = []
-                
-        if os.path.exists(self.config_path):
-            try:
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    # Update default config with loaded values
-                    config.update(json.load(f))
-            except json.JSONDecodeError:
-                pass # Use defaults
-                
+                    if f.read() == text:
+                        return None
+            self._write_file(self.sub_data_path, text)
+            if os.path.exists(self.manifest_path):
+                self.publish_bundle({"subs": plain})
+        return len(text.encode('utf-8'))
+
+    # Journal
+
+    def _journal_append(self, records):
+        # Starts a journal with the fingerprints of the files it builds on.
+        # Call with _journal_lock held, as for _checkpoint.
+        if not self.journal.exists():
+            records = [{"base": {name: self._fingerprints.get(name) for name in DATASETS}}] + records
+        self.journal.append(records)
+
+    def _checkpoint(self, seq):
+        # The files now hold every edit up to seq; keep only the newer ones
+        # (and those to files held back by a conflict)
+        self._journaled = [(n, record) for n, record in self._journaled
+                           if n > seq or record_datasets(record) & self.conflicts]
+        if not self._journaled:
+            self.journal.rewrite([])
+            return
+        self.journal.rewrite([{"base": {name: self._fingerprints.get(name) for name in DATASETS}}]
+                             + [record for _, record in self._journaled])
+
+    def record_edit(self, label, *changes):
+        # Journals an editor change (see history.py) and makes it undoable.
+        # Call right after applying it to the data from load_data.
+        if not changes:
+            return
+        self._log_edits([encode(change, self.subs) for change in changes])
+        self.history.record(label, *changes)
+
+    def journal_change(self, change):
+        # For undo/redo, which replay changes outside record_edit. Call just
+        # before applying the change.
+        self._log_edits([encode(change, self.subs)])
+
+    @profiling.profiled("DataManager.log_edits")
+    def _log_edits(self, records):
+        if self.store is not None:
+            # Each batch of edits is one transaction on the rows it touches
+            with self._io_lock:
+                self._store_edits(records)
+            return
+        # Only _journal_lock: a save holds it just for its commit and renames
+        with self._journal_lock:
+            for record in records:
+                self._journal_seq += 1
+                record["seq"] = self._journal_seq
+                self._journaled.append((self._journal_seq, record))
+            self._journal_append(records)
+
+    def _store_edits(self, records):
+        touched = set()
+        for record in records:
+            touched |= record_datasets(record)
+        try:
+            revisions = self.store.apply(records)
+        except (StoreError, sqlite3.Error):
+            # The database no longer matches the editor's data; the next save
+            # replaces these datasets whole
+            self._stale |= touched
+            return
+        for name, revision in revisions.items():
+            # Only follow our own writes; a revision someone else moved on
+            # in between is left for poll_external to notice
+            if self._revisions.get(name) == revision - 1:
+                self._revisions[name] = revision
+        self._recorded |= touched
+
+    def _recover_journal(self):
+        # Finishes a save a crash interrupted and returns the edits still to
+        # replay over the files, or None if the journal doesn't belong to them
+        records = self.journal.read()
+        base, commits, edits = {}, [], []
+        for record in records:
+            if "base" in record:
+                base = record["base"]
+            elif "commit" in record:
+                commits.append(record)
+            else:
+                edits.append(record)
+        paths = self.dataset_paths()
+        expected = dict(base)
+        for commit in commits:
+            expected.update(commit["files"])
+        if os.path.isdir(self.shards_dir):
+            shards = commits[-1].get("shards", {}) if commits else {}
+            for filename in os.listdir(self.shards_dir):
+                if not filename.endswith(PENDING):
+                    continue
+                staged_path = os.path.join(self.shards_dir, filename)
+                with open(staged_path, 'r', encoding='utf-8') as f:
+                    staged = self._fingerprint(f.read())
+                if shards.get(filename[:-len(PENDING)]) == staged:
+                    os.replace(staged_path, staged_path[:-len(PENDING)])
+                else:
+                    os.remove(staged_path)
+        for name, path in paths.items():
+            staged_path = path + PENDING
+            if not os.path.exists(staged_path):
+                continue
+            with open(staged_path, 'r', encoding='utf-8') as f:
+                staged = self._fingerprint(f.read())
+            if commits and commits[-1]["files"].get(name) == staged:
+                os.replace(staged_path, path)
+            else:
+                # Staged by a save that never committed
+                os.remove(staged_path)
+        if commits:
+            edits = [edit for edit in edits if edit["seq"] > commits[-1]["commit"]]
+        return expected, edits
+
+    def _replay_journal(self, subs, ingredients, tips, config, expected, edits):
+        # Returns the datasets the replayed edits changed
+        mismatched = [name for name in DATASETS if name in expected and self._fingerprints.get(name) != expected[name]]
+        if mismatched:
+            # The files changed outside the editor since; don't guess
+            rejected = self.journal.path + '.rejected'
+            self.journal.close()
+            os.replace(self.journal.path, rejected)
+            self.recovery["rejected"] = rejected
+            return set()
+        # Replay onto copies so a record that no longer fits leaves the
+        # loaded data untouched
+        data = {"subs": subs, "ingredients": ingredients, "tips": tips, "config": config}
+        copies = {name: snapshot(value) for name, value in data.items()}
+        touched = set()
+        try:
+            for edit in edits:
+                apply_record(edit, copies["subs"], copies["ingredients"], copies["tips"], copies["config"])
+                touched |= record_datasets(edit)
+        except (KeyError, IndexError, TypeError, ValueError):
+            rejected = self.journal.path + '.rejected'
+            self.journal.close()
+            os.replace(self.journal.path, rejected)
+            self.recovery["rejected"] = rejected
+            return set()
+        for name in touched:
+            if name == "tips":
+                tips[:] = copies["tips"]
+            else:
+                data[name].clear()
+                data[name].update(copies[name])
+        self.recovery["replayed"] = len(edits)
+        return touched
+
+    # Changes made outside the editor
+
+    def watched_paths(self):
+        # (files, directories) for a file watcher: the data files, public/
+        # itself (saves replace files, which drops watches on them) and
+        # every directory under images/
+        directories = [self.public_dir]
+        for root, subdirs, _ in os.walk(self.images_dir):
+            subdirs[:] = sorted(d for d in subdirs if not d.startswith('.'))
+            directories.append(root)
+        if self.remote is not None:
+            # Polled instead (see DataWatcher)
+            return [], directories
+        if self.store is not None:
+            return [self.db_path, self.db_path + '-wal'], directories
+        return list(self.dataset_paths().values()), directories
+
+    def _changed_on_disk(self, name, path):
+        if name in self.conflicts:
+            return True
+        if self._stat(path) == self._disk_stats.get(name):
+            return False
+        fingerprint = self._disk_fingerprint(path)
+        # A deleted file isn't a competing edit; the next save recreates it
+        return fingerprint is not None and fingerprint != self._fingerprints.get(name)
+
+    def unsaved_datasets(self):
+        # Datasets with edits that haven't reached their file yet
+        names = (self._unstored() if self.store is not None else self._dirty) | self.conflicts
+        for _, record in self._journaled:
+            names |= record_datasets(record)
+        if self.save_queue is not None:
+            names |= self.save_queue.pending_datasets()
+        return names
+
+    def poll_external(self):
+        # Re-reads the data files rewritten on disk since the editor last read
+        # or wrote them. Returns ({name: (data, fingerprint)} the editor can
+        # take as is, {name: (data, fingerprint)} it has unsaved edits to),
+        # or None while a save holds _io_lock (moving files into place): this
+        # runs on the GUI thread, which asks again shortly instead of waiting.
+        # Files that don't parse (yet) are left for the next change.
+        changed, conflicts = {}, {}
+        paths = self.dataset_paths()
+        if not self._io_lock.acquire(blocking=False):
+            return None
+        try:
+            unsaved = self.unsaved_datasets()
+            if self.store is not None:
+                # catalog.db: the revisions stand in for fingerprints
+                try:
+                    current = self.store.revisions()
+                except StoreError:
+                    # The editing service is unreachable; try again later
+                    return changed, conflicts
+                names = [name for name in DATASETS if current[name] != self._revisions.get(name)]
+                if not names:
+                    return changed, conflicts
+                loaded, revisions = self.store.load(names)
+                for name in names:
+                    data = loaded[name]
+                    if name == "config":
+                        data = catalog.load_config(data, DEFAULT_CONFIG)
+                    if name in unsaved:
+                        self.conflicts.add(name)
+                        conflicts[name] = (data, revisions[name])
+                    else:
+                        changed[name] = (data, revisions[name])
+                return changed, conflicts
+            for name in DATASETS:
+                stat = self._stat(paths[name])
+                if stat is None or stat == self._disk_stats.get(name):
+                    continue
+                self._disk_stats[name] = stat
+                with open(paths[name], 'r', encoding='utf-8') as f:
+                    text = f.read()
+                fingerprint = self._fingerprint(text)
+                if fingerprint == self._fingerprints.get(name):
+                    continue
+                try:
+                    raw = {name: json.loads(text)}
+                except json.JSONDecodeError:
+                    continue
+                if name == "subs" and self.sharded:
+                    # Read every shard now, while they match the index
+                    data = self._open_shards(raw[name])
+                    data.load_all()
+                else:
+                    # Whoever wrote it may not know the current schema
+                    catalog.migrate(raw)
+                    data = catalog.load_dataset(name, raw[name], DEFAULT_CONFIG)
+                if name in unsaved:
+                    self.conflicts.add(name)
+                    conflicts[name] = (data, fingerprint)
+                else:
+                    changed[name] = (data, fingerprint)
+        finally:
+            self._io_lock.release()
+        return changed, conflicts
+
+    def accept_external(self, name, fingerprint):
+        # The editor now holds `name` as poll_external read it. Unsaved edits
+        # to it are gone, and so is the undo history that led to them.
+        with self._io_lock:
+            if self.store is not None:
+                self._revisions[name] = fingerprint
+                self._stale.discard(name)
+            else:
+                self._fingerprints[name] = fingerprint
+            self.conflicts.discard(name)
+            self._dirty.discard(name)
+            with self._journal_lock:
+                self._journaled = [(seq, record) for seq, record in self._journaled
+                                   if name not in record_datasets(record)]
+                # Rebase what's left of the journal on the new file
+                self._checkpoint(0)
+        self.history.forget([name])
+
+    def keep_local(self, name, fingerprint):
+        # Resolves a conflict in favour of the editor: the next save
+        # overwrites the file read as `fingerprint`
+        with self._io_lock:
+            if self.store is not None:
+                self._revisions[name] = fingerprint
+                self._recorded.discard(name)
+            else:
+                self._fingerprints[name] = fingerprint
+            self.conflicts.discard(name)
+            self._dirty.add(name)
+
+    def poll_images(self):
+        # True if files under images/ were added, removed or replaced since
+        # the last call (the first call only takes stock). The validator
+        # rechecks image references when they were.
+        seen = []
+        for path in image_pipeline.list_library_images(self.images_dir):
+            seen.append((path, self._stat(path)))
+        previous, self._images_seen = self._images_seen, seen
+        if previous is None or previous == seen:
+            return False
+        self.validator.images_changed()
+        return True
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def encode_bundle(self, bundle):
+        # Compact UTF-8 JSON and its sha256, shared with publish.publish_site
+        data = json.dumps(bundle, ensure_ascii=False, separators=(',', ':'),
+                          default=catalog.to_json).encode('utf-8')
+        return data, hashlib.sha256(data).hexdigest()
+
+    def publish_bundle(self, datasets=None, keep=2):
+        # Merges the datasets into public/data/bundle.<hash>.json (minified)
+        # and points public/data/manifest.json at it. datasets: {name: data}
+        # overriding the copies on disk. The newest `keep` bundles are kept so
+        # clients holding the previous manifest can still fetch theirs.
+        # Returns (bundle path relative to public/, bytes written or None if
+        # it was already current).
+        datasets = datasets or {}
+        paths = self.dataset_paths()
+        bundle = {}
+        for name in DATASETS:
+            if name in datasets:
+                bundle[name] = datasets[name]
+            else:
+                # Sharded subs are bundled from their export
+                path = self.sub_data_path if name == "subs" else paths[name]
+                with open(path, 'r', encoding='utf-8') as f:
+                    bundle[name] = json.load(f)
+        data, digest = self.encode_bundle(bundle)
+        filename = f"bundle.{digest[:12]}.json"
+        relpath = f"data/{filename}"
+
+        with self._io_lock:
+            manifest = self.read_manifest()
+            if manifest and manifest.get("hash") == digest \
+                    and os.path.exists(os.path.join(self.bundle_dir, filename)):
+                return relpath, None
+
+            os.makedirs(self.bundle_dir, exist_ok=True)
+            bundle_path = os.path.join(self.bundle_dir, filename)
+            tmp_path = bundle_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, bundle_path)
+            # The manifest goes last so it never names a bundle that isn't there
+            self._write_file(self.manifest_path, json.dumps(
+                {"version": 1, "bundle": filename, "hash": digest, "bytes": len(data)}))
+
+            old = [name for name in os.listdir(self.bundle_dir)
+                   if name.startswith("bundle.") and name.endswith(".json") and name != filename]
+            old.sort(key=lambda name: os.path.getmtime(os.path.join(self.bundle_dir, name)), reverse=True)
+            for name in old[keep - 1:]:
+                os.remove(os.path.join(self.bundle_dir, name))
+        return relpath, len(data)
+
+    def build_distractors(self, subs, ingredients):
+        # Brings public/quiz_distractors.json up to date, starting from the
+        # previous build in .cache so only subs whose ingredients changed (and
+        # the neighbour lists they move in or out of) are recomputed.
+        # Returns (subs recomputed, bytes written or None if already current).
+        if not distractors.numpy_available():
+            raise RuntimeError("Building the distractor bank requires NumPy (pip install numpy)")
+        bank = distractors.DistractorBank.load(self.distractor_state_path)
+        recomputed = bank.build(subs, ingredients)
+        text = json.dumps(bank.export(), ensure_ascii=False, separators=(',', ':'))
+        with self._io_lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._write_file(self.distractor_state_path, json.dumps(bank.state(), separators=(',', ':')))
+            if os.path.exists(self.distractors_path):
+                with open(self.distractors_path, 'r', encoding='utf-8') as f:
+                    if f.read() == text:
+                        return recomputed, None
+            self._write_file(self.distractors_path, text)
+        return recomputed, len(text.encode('utf-8'))
+
+    def mark_dirty(self, *names):
+        for name in names:
+            if name not in DATASETS:
+                raise ValueError(f"Unknown dataset: {name}")
+            self._dirty.add(name)
+
+    def is_dirty(self, name):
+        return name in self._dirty
+
+    @profiling.profiled("DataManager.load_data")
+    def load_data(self):
+        # Returns (subs, ingredients, tips, config) as catalog records
+        self.recovery = {"replayed": 0, "rejected": None}
+        self.conflicts = set()
+        self._journal_seq = 0
+        self._journaled = []
+        if self.store is not None:
+            subs, ingredients, tips, config = self._load_store()
+        else:
+            subs, ingredients, tips, config = self._load_files()
+
+        self.config = config
+        self.subs = subs
+        self.ingredient_usage.rebuild(subs)
+        self.validator.reset(subs, ingredients, tips, config)
+        self.history.clear()
+        self._dirty.clear()
+        self._recorded.clear()
+        self._stale.clear()
         return subs, ingredients, tips, config
 
-    def save_data(self, subs, ingredients, tips, config):
-        with open(self.sub_data_path, 'w', encoding='utf-8') as f:
-            json.dump(subs, f, indent=2)
-            
-        with open(self.ingredient_data_path, 'w', encoding='utf-8') as f:
-            json.dump(ingredients, f, indent=2)
-            
-        with open(self.tips_path, 'w', encoding='utf-8') as f:
-            json.dump(tips, f, indent=2)
-            
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
+    def _load_files(self):
+        # Finish the last session's interrupted save, if any, before reading
+        recovered = self._recover_journal() if self.journal.exists() else None
+
+        paths = self.dataset_paths()
+        raw = {}
+        for name in DATASETS:
+            loaded = self._read_json(name, paths[name])
+            if loaded is not None:
+                raw[name] = loaded
+
+        # Sharded subs are read a category at a time, as they're needed
+        index = raw.pop("subs", {}) if self.sharded else None
+
+        # Files from an older schema are normalized once, here, and written
+        # back below; current ones load as they are
+        migrated = set()
+        if catalog.schema_version(raw.get("config", {})) < catalog.SCHEMA_VERSION:
+            migrated = catalog.migrate(raw) & raw.keys()
+
+        if index is not None:
+            subs = self._open_shards(index)
+        else:
+            subs = catalog.load_subs(raw.get("subs", {}))
+        ingredients = catalog.load_ingredients(raw.get("ingredients", {}))
+        tips = catalog.load_tips(raw.get("tips", []))
+        # Defaults fill in whatever the file leaves out
+        config = catalog.load_config(raw.get("config", {}), DEFAULT_CONFIG)
+        if migrated:
+            config.schema_version = catalog.SCHEMA_VERSION
 
-    def import_image(self, source_path):
+        touched = set(migrated)
+        if recovered is not None:
+            touched |= self._replay_journal(subs, ingredients, tips, config, *recovered)
+        if touched or recovered is not None:
+            # Consolidate replayed edits and migrations; this also empties
+            # the journal (unless it was set aside)
+            data = {"subs": subs, "ingredients": ingredients, "tips": tips, "config": config}
+            self.write_snapshot({name: data[name] for name in touched})
+        return subs, ingredients, tips, config
+
+    def rename_ingredient(self, ingredients, old_name, new_name):
+        # Renames the ingredient and every sub's reference to it. Returns the
+        # rewritten subs as [(category, sub)].
+        ingredients[new_name] = ingredients.pop(old_name)
+        affected = self.ingredient_usage.rename_ingredient(old_name, new_name)
+        self.mark_dirty("ingredients", *(["subs"] if affected else []))
+        return affected
+
+    def delete_ingredient(self, ingredients, name):
+        # Deletes the ingredient and drops it from every sub that listed it.
+        # Returns those subs as [(category, sub)].
+        del ingredients[name]
+        affected = self.ingredient_usage.remove_ingredient(name)
+        self.mark_dirty("ingredients", *(["subs"] if affected else []))
+        return affected
+
+    @profiling.profiled("DataManager.save_data")
+    def save_data(self, subs, ingredients, tips, config, force=False):
+        # Only datasets marked dirty are serialized (all of them if nothing was
+        # marked), and only those whose content differs from disk are written.
+        # Returns {dataset name: bytes written} for the files actually written.
+        data = {"subs": subs, "ingredients": ingredients, "tips": tips, "config": config}
+        names = self._save_names(force)
+        return self.write_snapshot({name: data[name] for name in names}, force) if names else {}
+
+    def _save_names(self, force=False):
+        # The datasets a save writes, in order, and starts tracking afresh.
+        # catalog.db already holds those whose edits all went in as rows.
+        if force or not (self._dirty or self._recorded):
+            names = set(DATASETS)
+        elif self.store is not None:
+            names = self._unstored()
+        else:
+            names = set(self._dirty)
+        self._dirty.clear()
+        self._recorded.clear()
+        return [name for name in DATASETS if name in names]
+
+    def start_save_queue(self, on_saved=None, on_error=None, debounce=0.3, max_latency=2.0):
+        # Background writer that coalesces bursts of request_save calls
+        if self.save_queue is None:
+            self.save_queue = SaveQueue(self, on_saved, on_error, debounce, max_latency)
+        return self.save_queue
+
+    def request_save(self, subs, ingredients, tips, config):
+        # Non-blocking save: snapshots the dirty datasets (all if none marked)
+        # and hands them to the save queue. Falls back to save_data without one.
+        # catalog.db is written on the spot: a queued snapshot landing after
+        # later row edits would undo them, and one transaction is quick.
+        if self.save_queue is None or self.store is not None:
+            return self.save_data(subs, ingredients, tips, config)
+        data = {"subs": subs, "ingredients": ingredients, "tips": tips, "config": config}
+        names = self._save_names()
+        if names:
+            self.save_queue.submit({name: snapshot(data[name]) for name in names}, self._journal_seq)
+        return None
+
+    def flush_saves(self, timeout=None):
+        if self.save_queue is not None:
+            return self.save_queue.flush(timeout)
+        return True
+
+    def stop_save_queue(self, timeout=None):
+        if self.save_queue is not None:
+            self.save_queue.close(timeout)
+            self.save_queue = None
+
+    def import_image(self, source_path, kind="ingredient", optimize=True):
+        # Stores an image in public/images, downscaled to what the trainer
+        # displays for `kind` ("ingredient" or "sub") and recompressed.
+        # Files are content addressed: re-importing the same picture returns
+        # the existing path, and a new file never overwrites another one.
+        # Returns the path relative to images/ as used in the JSON data.
+        # Safe to call from a worker thread (the editor's ImageLoader does).
         if not source_path or not os.path.exists(source_path):
             return None
-            
+        with self._image_lock:
+            return self._import_image(source_path, kind, optimize)
+
+    def _import_image(self, source_path, kind, optimize):
+
+        source_path = os.path.abspath(source_path)
+        images_dir = os.path.abspath(self.images_dir)
+        if os.path.commonpath([source_path, images_dir]) == images_dir:
+            # Already in the library
+            return os.path.relpath(source_path, images_dir).replace('\\', '/')
+
+        source_hash = hash_file(source_path)
+        existing = self.image_store.lookup_source(source_hash)
+        if existing:
+            return existing
+
         filename = os.path.basename(source_path)
-        dest_path = os.path.join(self.images_dir, filename)
-        
-        # If file exists, maybe rename or overwrite? For now, overwrite/use existing.
-        if os.path.abspath(source_path) != os.path.abspath(dest_path):
-            shutil.copy2(source_path, dest_path)
-            
-        return filename
+        ext = os.path.splitext(filename)[1].lower()
+        staged_path = os.path.join(self.images_dir, '.import.tmp' + ext)
+        staged_webp = os.path.join(self.images_dir, '.import.tmp.webp')
+        stats = None
+        if optimize and image_pipeline.pillow_available():
+            max_size = image_pipeline.max_image_size(self.config, kind)
+            stats = image_pipeline.optimize_image(source_path, staged_path, max_size,
+                                                  webp=self.config.get("image_webp", False))
+        else:
+            shutil.copy2(source_path, staged_path)
+
+        subdir = "subs" if kind == "sub" else ""
+        relpath, reused = self.image_store.add(staged_path, filename, source_hash, subdir)
+        if os.path.exists(staged_webp):
+            if reused:
+                os.remove(staged_webp)
+            else:
+                os.replace(staged_webp, os.path.join(self.images_dir, os.path.splitext(relpath)[0] + '.webp'))
+        if stats and not reused:
+            self.record_image_stats({relpath: stats})
+        return relpath
+
+    def dedupe_images(self, subs, ingredients):
+        # Migration: collapse byte-identical images into one file and point
+        # every ingredient/sub at it. The most referenced copy is kept.
+        # Returns {duplicate relpath: kept relpath}; subs and ingredients are
+        # updated in place and marked dirty when changed. The duplicates stay
+        # on disk until remove_duplicate_images, which callers run once the
+        # rewritten references are saved, so the data never points at a
+        # deleted file.
+        refs = {}
+        for data in ingredients.values():
+            refs[data.get('image')] = refs.get(data.get('image'), 0) + 1
+        for cat_subs in subs.values():
+            for sub in cat_subs:
+                refs[sub.get('image')] = refs.get(sub.get('image'), 0) + 1
+
+        replaced = {}
+        for group in self.image_store.find_duplicates():
+            keep = max(group, key=lambda p: (refs.get(p, 0), -group.index(p)))
+            for path in group:
+                if path != keep:
+                    replaced[path] = keep
+        if not replaced:
+            return {}
+
+        for data in ingredients.values():
+            if data.get('image') in replaced:
+                data['image'] = replaced[data['image']]
+                self.mark_dirty("ingredients")
+        for cat_subs in subs.values():
+            for sub in cat_subs:
+                if sub.get('image') in replaced:
+                    sub['image'] = replaced[sub['image']]
+                    self.mark_dirty("subs")
+        return replaced
+
+    def remove_duplicate_images(self, replaced):
+        # Deletes the duplicates dedupe_images redirected (and their WebP
+        # copies). Returns the bytes freed.
+        freed = 0
+        for path in replaced:
+            full_path = os.path.join(self.images_dir, path)
+            freed += os.path.getsize(full_path)
+            self.image_store.remove(path)
+            webp_path = os.path.splitext(full_path)[0] + '.webp'
+            if not path.lower().endswith('.webp') and os.path.exists(webp_path):
+                freed += os.path.getsize(webp_path)
+                os.remove(webp_path)
+        self.image_store.rebuild()
+        self.validator.images_changed()
+        return freed
+
+    def optimize_images(self, webp=None, workers=None):
+        # Batch mode: reprocess the whole image library in place
+        if not image_pipeline.pillow_available():
+            raise RuntimeError("Image optimization requires Pillow (pip install Pillow)")
+        if webp is None:
+            webp = self.config.get("image_webp", False)
+        results, errors = image_pipeline.optimize_library(self.images_dir, self.config, webp, workers)
+        self.record_image_stats(results)
+        # Recompressed files have new content hashes
+        self.image_store.rebuild()
+        return results, errors
+
+    def load_image_stats(self):
+        if not os.path.exists(self.image_stats_path):
+            return {}
+        try:
+            with open(self.image_stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+    def record_image_stats(self, stats):
+        # Keeps the first-seen original size so repeated runs still show
+        # the total savings against what was originally imported.
+        if not stats:
+            return
+        recorded = self.load_image_stats()
+        for name, entry in stats.items():
+            previous = recorded.get(name)
+            if previous:
+                entry = dict(entry, original_bytes=max(previous["original_bytes"], entry["original_bytes"]))
+            recorded[name] = entry
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._write_file(self.image_stats_path, json.dumps(recorded, indent=2))
 
     def get_ingredient_categories(self):
         # Could be dynamic, but let's stick to the known ones for now + allow custom?
@@ -0,0 +1,75 @@
+# Notices the data files and images being changed outside the editor (a git
+# pull, a script, a second editor). QFileSystemWatcher sits on inotify /
+# FSEvents / ReadDirectoryChangesW; where it can't watch a path (network
+# drives, exhausted inotify watches) DataWatcher polls instead.
+import os
+
+from PyQt6.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+
+class DataWatcher(QObject):
+    # Signals once a burst of writes has settled. What actually changed is
+    # worked out by DataManager.poll_external and poll_images.
+    data_changed = pyqtSignal()
+    images_changed = pyqtSignal()
+
+    def __init__(self, data_manager, parent=None, settle_ms=300, poll_ms=2000):
+        super().__init__(parent)
+        self.dm = data_manager
+        self.polling = False
+        self._data_touched = False
+        self._images_touched = False
+
+        self._settle = QTimer(self)
+        self._settle.setSingleShot(True)
+        self._settle.setInterval(settle_ms)
+        self._settle.timeout.connect(self._settled)
+        self._poll = QTimer(self)
+        self._poll.setInterval(poll_ms)
+        self._poll.timeout.connect(self.poll)
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self.dm.poll_images()
+        self._watch()
+        if self.dm.remote is not None:
+            # Nothing on disk to watch; ask the editing service every poll_ms
+            self.polling = True
+            self._poll.start()
+
+    def _watch(self):
+        # (Re)adds whatever isn't watched: replacing a file drops its watch,
+        # and new directories can appear under images/
+        files, directories = self.dm.watched_paths()
+        watched = set(self._watcher.files()) | set(self._watcher.directories())
+        missing = [path for path in files + directories if path not in watched and os.path.exists(path)]
+        failed = self._watcher.addPaths(missing) if missing else []
+        if failed and not self.polling:
+            self.polling = True
+            self._poll.start()
+
+    def _on_file_changed(self, path):
+        self._data_touched = True
+        self._settle.start()
+
+    def _on_directory_changed(self, path):
+        if os.path.normcase(path) == os.path.normcase(self.dm.public_dir):
+            self._data_touched = True
+        else:
+            self._images_touched = True
+        self._settle.start()
+
+    def poll(self):
+        # Both checks are cheap when nothing changed: file stats only
+        self._data_touched = self._images_touched = True
+        self._settled()
+
+    def _settled(self):
+        self._watch()
+        data, images = self._data_touched, self._images_touched
+        self._data_touched = self._images_touched = False
+        if data:
+            self.data_changed.emit()
+        if images:
+            self.images_changed.emit()
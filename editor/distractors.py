@@ -0,0 +1,209 @@
+# Quiz distractor bank: for every sub, the subs it is most easily confused
+# with and the ingredients most plausibly "missing" from it.
+#
+# Subs are rows of a sub x ingredient incidence matrix and their similarity is
+# the Jaccard index of their ingredient sets, computed a block of rows at a
+# time so memory stays O(block x subs) however large the catalog gets. Each
+# sub keeps its top neighbours; its decoys are the ingredients those
+# neighbours use and it doesn't, weighted by similarity. A rebuild only
+# recomputes the subs whose ingredients changed plus the neighbour lists they
+# enter or leave. NumPy is optional for the editor and imported lazily.
+import hashlib
+import json
+from importlib.util import find_spec
+
+VERSION = 1
+TOP_SUBS = 8
+TOP_DECOYS = 8
+BLOCK_ROWS = 512
+
+
+def numpy_available():
+    return find_spec("numpy") is not None
+
+
+def _signature(names):
+    return hashlib.sha1("\n".join(sorted(set(names))).encode('utf-8')).hexdigest()[:16]
+
+
+def catalog_rows(subs):
+    # {sub name: ingredient list} in catalog order. The trainer tells subs
+    # apart by name, so a repeated name (flagged by validation) counts once.
+    rows = {}
+    for cat_subs in subs.values():
+        for sub in cat_subs:
+            name = sub.get('name', '')
+            if name and name not in rows:
+                rows[name] = sub.get('ingredients', [])
+    return rows
+
+
+class DistractorBank:
+    def __init__(self, top_subs=TOP_SUBS, top_decoys=TOP_DECOYS, block_rows=BLOCK_ROWS):
+        self.top_subs = top_subs
+        self.top_decoys = top_decoys
+        self.block_rows = block_rows
+        self.order = []
+        # sub name -> ingredient signature / [(score, name)] best first / [ingredient]
+        self.signatures = {}
+        self.neighbours = {}
+        self.decoys = {}
+        # Signature of the ingredient names decoys were drawn from
+        self.ingredients_key = None
+
+    # Persistence (the editor keeps the last build in .cache)
+
+    @classmethod
+    def load(cls, path, **params):
+        bank = cls(**params)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return bank
+        if state.get("version") != VERSION or state.get("top_subs") != bank.top_subs \
+                or state.get("top_decoys") != bank.top_decoys:
+            return bank
+        bank.ingredients_key = state.get("ingredients_key")
+        for name, (signature, neighbours, decoys) in state.get("subs", {}).items():
+            bank.order.append(name)
+            bank.signatures[name] = signature
+            bank.neighbours[name] = [(score, other) for score, other in neighbours]
+            bank.decoys[name] = decoys
+        return bank
+
+    def state(self):
+        return {
+            "version": VERSION,
+            "top_subs": self.top_subs,
+            "top_decoys": self.top_decoys,
+            "ingredients_key": self.ingredients_key,
+            "subs": {name: [self.signatures[name], self.neighbours[name], self.decoys[name]]
+                     for name in self.order},
+        }
+
+    def export(self):
+        # What the trainer downloads: names only, best first
+        return {
+            "version": VERSION,
+            "subs": {name: {"similar": [other for _, other in self.neighbours[name]],
+                            "decoys": self.decoys[name]}
+                     for name in self.order},
+        }
+
+    # Building
+
+    def build(self, subs, ingredients):
+        # Brings the bank up to date with the catalog. Returns the number of
+        # subs whose neighbours or decoys were recomputed.
+        import numpy as np
+
+        rows = catalog_rows(subs)
+        names = list(rows)
+        index = {name: i for i, name in enumerate(names)}
+        columns = sorted(set(ingredients).union(*map(set, rows.values())) if rows else set(ingredients))
+        column = {ing: j for j, ing in enumerate(columns)}
+
+        matrix = np.zeros((len(names), len(columns)), dtype=np.float32)
+        for i, name in enumerate(names):
+            matrix[i, [column[ing] for ing in set(rows[name])]] = 1
+        sizes = matrix.sum(axis=1, dtype=np.float64)
+        # Decoys must be ingredients the trainer can show
+        valid = np.array([ing in ingredients for ing in columns], dtype=bool)
+        rank = np.empty(len(names), dtype=np.float64)
+        rank[[index[name] for name in sorted(names)]] = np.arange(len(names))
+
+        signatures = {name: _signature(rows[name]) for name in names}
+        ingredients_key = _signature(ingredients)
+        if ingredients_key != self.ingredients_key:
+            recompute = set(range(len(names)))
+            redecoy = set()
+        else:
+            recompute, redecoy = self._affected(matrix, sizes, names, index, signatures)
+
+        for name in set(self.signatures) - set(rows):
+            del self.signatures[name], self.neighbours[name], self.decoys[name]
+        self.order = names
+        self.signatures = signatures
+        self.ingredients_key = ingredients_key
+
+        recompute = sorted(recompute)
+        self._compute_neighbours(matrix, sizes, rank, names, recompute)
+        redecoy = sorted(redecoy.union(recompute))
+        self._compute_decoys(matrix, valid, columns, names, index, redecoy)
+        return len(redecoy)
+
+    def _jaccard(self, matrix, sizes, rows):
+        # Similarity of `rows` to every sub: |A & B| / |A | B|
+        import numpy as np
+        inter = (matrix[rows] @ matrix.T).astype(np.float64)
+        union = sizes[rows, None] + sizes[None, :] - inter
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(union > 0, inter / union, 0.0)
+
+    def _better(self, entries):
+        # Best first; equal scores fall back to name order so full and
+        # incremental builds agree
+        return sorted(entries, key=lambda entry: (-entry[0], entry[1]))[:self.top_subs]
+
+    def _affected(self, matrix, sizes, names, index, signatures):
+        # Rows to recompute from scratch, and rows whose neighbour list was
+        # patched in place (so only their decoys need redoing)
+        changed = [i for i, name in enumerate(names) if self.signatures.get(name) != signatures[name]]
+        gone = {names[i] for i in changed} | (set(self.signatures) - set(names))
+        recompute = set(changed)
+        redecoy = set()
+        # A list that held a changed or deleted sub may now need a
+        # replacement from outside it
+        for i, name in enumerate(names):
+            if i not in recompute and any(other in gone for _, other in self.neighbours.get(name, ())):
+                recompute.add(i)
+        # Everyone else can only gain changed subs that now rank high enough
+        for start in range(0, len(changed), self.block_rows):
+            block = changed[start:start + self.block_rows]
+            sim = self._jaccard(matrix, sizes, block)
+            for r, t in zip(*sim.nonzero()):
+                c = block[r]
+                if t == c or t in recompute:
+                    continue
+                name = names[t]
+                merged = self._better(self.neighbours[name] + [(float(sim[r, t]), names[c])])
+                if merged != self.neighbours[name]:
+                    self.neighbours[name] = merged
+                    redecoy.add(t)
+        return recompute, redecoy
+
+    def _compute_neighbours(self, matrix, sizes, rank, names, rows):
+        import numpy as np
+        k = min(self.top_subs, len(names) - 1)
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            sim = self._jaccard(matrix, sizes, block)
+            sim[np.arange(len(block)), block] = 0  # Not its own neighbour
+            if k <= 0:
+                top = np.zeros((len(block), 0), dtype=np.intp)
+            else:
+                # Unique keys so the cut at k is deterministic
+                key = sim - rank[None, :] * 1e-12
+                top = np.argpartition(-key, k - 1, axis=1)[:, :k]
+            for r, i in enumerate(block):
+                self.neighbours[names[i]] = self._better(
+                    (float(sim[r, t]), names[t]) for t in top[r] if sim[r, t] > 0)
+
+    def _compute_decoys(self, matrix, valid, columns, names, index, rows):
+        # Ingredients the neighbours use and this sub doesn't, weighted by
+        # how similar each neighbour is
+        import numpy as np
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            weights = np.zeros((len(block), len(names)), dtype=np.float64)
+            for r, i in enumerate(block):
+                for score, other in self.neighbours[names[i]]:
+                    weights[r, index[other]] = score
+            scores = weights @ matrix
+            scores[matrix[block] > 0] = 0
+            scores[:, ~valid] = 0
+            for r, i in enumerate(block):
+                candidates = np.flatnonzero(scores[r] > 0)
+                best = candidates[np.lexsort((candidates, -scores[r, candidates]))][:self.top_decoys]
+                self.decoys[names[i]] = [columns[j] for j in best]
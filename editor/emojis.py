@@ -27,3 +27,69 @@ EMOJI_DATA = {
     ]
 }
 
+
+
+# Search index over EMOJI_DATA, built once on first use.
+# Each entry is (category, emoji, lowercase search text); the search text is
+# the Unicode name(s) of the emoji plus its category, e.g.
+# "cheese wedge food & drink".
+
+_INDEX = None
+
+# Code points that only modify a neighbouring emoji and add nothing to its name
+_NAMELESS = {"\u200d", "\ufe0f", "\ufe0e", "\u20e3"}
+
+
+def is_emoji(text):
+    # Filters out the stray letters that crept into the data ("mV", "ox", " ढाई")
+    if not text or text != text.strip() or text.isascii():
+        return False
+    import unicodedata
+    return not any(unicodedata.category(ch) in ("Lo", "Mc") for ch in text)
+
+
+def emoji_name(emoji):
+    import unicodedata
+    names = []
+    for ch in emoji:
+        if ch in _NAMELESS:
+            continue
+        name = unicodedata.name(ch, "")
+        if name and name not in names:
+            names.append(name)
+    return " ".join(names).lower()
+
+
+def emoji_index():
+    global _INDEX
+    if _INDEX is None:
+        index = []
+        for category, emojis in EMOJI_DATA.items():
+            seen = set()
+            for emoji in emojis:
+                if emoji in seen or not is_emoji(emoji):
+                    continue
+                seen.add(emoji)
+                index.append((category, emoji, f"{emoji_name(emoji)} {category.lower()}"))
+        _INDEX = index
+    return _INDEX
+
+
+def emojis_in(category):
+    return [emoji for cat, emoji, _ in emoji_index() if cat == category]
+
+
+def search_emojis(query):
+    # Every word of the query must appear in the emoji's name or category;
+    # emojis whose name starts with the first word are listed first.
+    words = query.lower().split()
+    if not words:
+        return []
+    prefix, rest = [], []
+    seen = set()
+    for _, emoji, text in emoji_index():
+        if emoji in seen or not all(word in text for word in words):
+            continue
+        seen.add(emoji)
+        (prefix if text.startswith(words[0]) else rest).append(emoji)
+    return prefix + rest
@@ -0,0 +1,288 @@
+# Undo/redo for the editor as a log of small change records.
+#
+# Each undoable step is a label plus a tuple of changes. A change holds only
+# what it touched: the changed fields' old and new values, the row it was
+# inserted at or removed from, the positions an ingredient cascade rewrote.
+# Subs are referenced, not copied, so the record of a deleted sub costs a
+# pointer. The undo stack is bounded, so memory stays flat however long the
+# session runs; redo entries only ever come off that stack.
+#
+#   ("sub_set", category, sub, before, after)       before/after: {field: value}
+#   ("sub_insert", category, row, sub)
+#   ("sub_remove", category, row, sub)
+#   ("sub_move", sub, from_category, from_row, to_category, to_row)
+#   ("category_insert", name, position, cat_subs)
+#   ("category_remove", name, position, cat_subs)
+#   ("ingredient_set", name, before, after)
+#   ("ingredient_insert", name, position, data, cascade)
+#   ("ingredient_remove", name, position, data, cascade)
+#   ("ingredient_rename", old, new, old_position, new_position, cascade)
+#   ("tip_insert", row, tip)
+#   ("tip_remove", row, tip)
+#   ("tip_set", row, before, after)
+#   ("config_set", key, before, after)
+#
+# cascade is [(category, sub, positions)]: where the ingredient's name sat in
+# each sub's ingredient list. Positions in the catalog dicts are kept so undo
+# puts keys back where they were and the JSON files round-trip unchanged.
+from collections import deque
+from difflib import SequenceMatcher
+from itertools import islice
+
+import catalog
+from sub_shards import ShardedSubs
+
+HISTORY_LIMIT = 1000
+
+_INVERSE_KIND = {
+    "sub_insert": "sub_remove",
+    "sub_remove": "sub_insert",
+    "category_insert": "category_remove",
+    "category_remove": "category_insert",
+    "ingredient_insert": "ingredient_remove",
+    "ingredient_remove": "ingredient_insert",
+    "tip_insert": "tip_remove",
+    "tip_remove": "tip_insert",
+}
+
+
+def invert(change):
+    kind = change[0]
+    if kind in _INVERSE_KIND:
+        return (_INVERSE_KIND[kind],) + change[1:]
+    if kind == "sub_set":
+        return (kind, change[1], change[2], change[4], change[3])
+    if kind == "sub_move":
+        return (kind, change[1], change[4], change[5], change[2], change[3])
+    if kind == "ingredient_rename":
+        return (kind, change[2], change[1], change[4], change[3], change[5])
+    # ingredient_set, tip_set, config_set
+    return (kind, change[1], change[3], change[2])
+
+
+def touched_datasets(changes):
+    # Dataset names (see data_manager.DATASETS) the changes rewrite
+    names = set()
+    for change in changes:
+        kind = change[0]
+        if kind.startswith(("sub_", "category_")):
+            names.add("subs")
+        elif kind.startswith("ingredient_"):
+            names.add("ingredients")
+            if kind != "ingredient_set" and change[-1]:
+                names.add("subs")
+        elif kind.startswith("tip_"):
+            names.add("tips")
+        else:
+            names.add("config")
+    return names
+
+
+# Field value in a before/after dict for a key that wasn't there (the same
+# marker Records use for an absent field)
+MISSING = catalog.MISSING
+
+
+def changed_fields(before, after):
+    # The (before, after) pair of just the fields that differ
+    keys = [key for key in after if before.get(key, MISSING) != after[key]]
+    return {key: before.get(key, MISSING) for key in keys}, {key: after[key] for key in keys}
+
+
+def field_changes(old, new):
+    # Like changed_fields, but keys only `old` has count too (after: MISSING)
+    keys = [key for key in {**old, **new} if old.get(key, MISSING) != new.get(key, MISSING)]
+    return {key: old.get(key, MISSING) for key in keys}, {key: new.get(key, MISSING) for key in keys}
+
+
+def set_fields(target, values):
+    # Lists are copied in, so in-place cascades never reach the record
+    for key, value in values.items():
+        if value is MISSING:
+            target.pop(key, None)
+        else:
+            target[key] = list(value) if isinstance(value, list) else value
+
+
+def ingredient_cascade(usage, name):
+    # Where `name` sits in each sub using it, before a rename or delete
+    return [(category, sub, tuple(i for i, ing in enumerate(sub['ingredients']) if ing == name))
+            for category, sub in usage.users(name)]
+
+
+def insert_key(mapping, key, value, position):
+    # dicts only append: a key that belongs further up goes in at the end
+    # and the keys after its place move back behind it. That is O(keys after
+    # position), so putting back a key from near the top of a large dict
+    # (undoing a delete or rename there) still costs about O(len(mapping)).
+    # ShardedSubs keeps its own order and inserts in place.
+    if position >= len(mapping):
+        mapping[key] = value
+        return
+    if isinstance(mapping, ShardedSubs):
+        mapping.insert(key, value, position)
+        return
+    tail = list(islice(mapping, position, None))
+    mapping[key] = value
+    for other in tail:
+        mapping[other] = mapping.pop(other)
+
+
+def rename_key(mapping, key, new_key):
+    # Renames in place, keeping the key's position; like insert_key, moves
+    # the keys after it
+    if isinstance(mapping, ShardedSubs):
+        mapping.rename(key, new_key)
+        return
+    tail = list(islice(mapping, key_position(mapping, key) + 1, None))
+    mapping[new_key] = mapping.pop(key)
+    for other in tail:
+        mapping[other] = mapping.pop(other)
+
+
+def key_position(mapping, key):
+    for position, candidate in enumerate(mapping):
+        if candidate == key:
+            return position
+    return len(mapping)
+
+
+def _same_order(current, loaded):
+    return [key for key in current if key in loaded] == [key for key in loaded if key in current]
+
+
+def _list_changes(current, loaded, key, changed, inserted, removed):
+    # Edits turning the list `current` into `loaded`, matched up by key().
+    # Listed back to front so every row is still valid when it's applied.
+    changes = []
+    matcher = SequenceMatcher(None, [key(item) for item in current], [key(item) for item in loaded],
+                              autojunk=False)
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal" or (tag == "replace" and i2 - i1 == j2 - j1):
+            for i, j in reversed(list(zip(range(i1, i2), range(j1, j2)))):
+                changes.extend(changed(i, current[i], loaded[j]))
+            continue
+        for i in reversed(range(i1, i2)):
+            changes.append(removed(i, current[i]))
+        for offset, j in enumerate(range(j1, j2)):
+            changes.append(inserted(i1 + offset, loaded[j]))
+    return changes
+
+
+def external_changes(name, current, loaded):
+    # The change records (see above) that turn the in-memory dataset into
+    # `loaded`, as re-read from a file edited outside the editor, or None
+    # when keys were reordered and only a full reload reproduces the file.
+    # Ingredient changes never cascade here: sub_data.json is diffed on its own.
+    if name == "subs":
+        if not _same_order(current, loaded):
+            return None
+        changes = [("category_remove", category, position, current[category])
+                   for position, category in reversed(list(enumerate(current))) if category not in loaded]
+
+        def changed(row, sub, new):
+            before, after = field_changes(sub, new)
+            return [("sub_set", category, sub, before, after)] if after else []
+
+        for position, category in enumerate(loaded):
+            if category not in current:
+                changes.append(("category_insert", category, position, loaded[category]))
+                continue
+            changes.extend(_list_changes(
+                current[category], loaded[category], lambda sub: sub.get('name', ''), changed,
+                lambda row, sub: ("sub_insert", category, row, sub),
+                lambda row, sub: ("sub_remove", category, row, sub)))
+        return changes
+    if name == "ingredients":
+        if not _same_order(current, loaded):
+            return None
+        changes = [("ingredient_remove", ingredient, position, data, [])
+                   for position, (ingredient, data) in reversed(list(enumerate(current.items())))
+                   if ingredient not in loaded]
+        for position, (ingredient, data) in enumerate(loaded.items()):
+            if ingredient not in current:
+                changes.append(("ingredient_insert", ingredient, position, data, []))
+                continue
+            before, after = field_changes(current[ingredient], data)
+            if after:
+                changes.append(("ingredient_set", ingredient, before, after))
+        return changes
+    if name == "tips":
+        return _list_changes(
+            current, loaded, lambda tip: tip.get('text', ''),
+            lambda row, tip, new: [("tip_set", row, tip, new)] if tip != new else [],
+            lambda row, tip: ("tip_insert", row, tip),
+            lambda row, tip: ("tip_remove", row, tip))
+    if not _same_order(current, loaded):
+        return None
+    before, after = field_changes(current, loaded)
+    return [("config_set", key, before[key], after[key]) for key in after]
+
+
+class EditHistory:
+    def __init__(self, limit=HISTORY_LIMIT):
+        # (label, changes) entries, oldest dropped first
+        self._undo = deque(maxlen=limit)
+        self._redo = []
+        # Whether the newest entry may absorb the next one (see record)
+        self._open = False
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._open = False
+
+    def record(self, label, *changes):
+        # One undoable step; a new edit forgets anything that was undone
+        if not changes:
+            return
+        self._redo.clear()
+        setting = len(changes) == 1 and changes[0][0] == "config_set"
+        if setting and self._open and self._undo[-1][1][0][1] == changes[0][1]:
+            # Typing in a settings field records one step, not one per key
+            first = self._undo[-1][1][0]
+            self._undo[-1] = (label, ((first[0], first[1], first[2], changes[0][3]),))
+            return
+        self._undo.append((label, changes))
+        self._open = setting
+
+    def forget(self, names):
+        # Drops the steps a reload of these datasets from disk invalidated:
+        # every step touching them and every older step sharing a dataset
+        # with one of those, since undoing it would need them undone first.
+        # A reload counts as a new edit, so redo goes too.
+        blocked = set(names)
+        kept = []
+        for label, changes in reversed(self._undo):
+            touched = touched_datasets(changes)
+            if touched & blocked:
+                blocked |= touched
+            else:
+                kept.append((label, changes))
+        self._undo.clear()
+        self._undo.extend(reversed(kept))
+        self._redo.clear()
+        self._open = False
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo(self):
+        # Returns (label, changes to apply in order) or None
+        if not self._undo:
+            return None
+        self._open = False
+        label, changes = self._undo.pop()
+        self._redo.append((label, changes))
+        return label, [invert(change) for change in reversed(changes)]
+
+    def redo(self):
+        if not self._redo:
+            return None
+        self._open = False
+        label, changes = self._redo.pop()
+        self._undo.append((label, changes))
+        return label, list(changes)
@@ -0,0 +1,216 @@
+# Keeps image work off the GUI thread. Previews are decoded (or read from the
+# thumbnail disk cache) and imports copied/recompressed on a QThreadPool;
+# results come back to the GUI thread through a queued signal.
+#
+# Each request belongs to a slot (the widget that will show it). A new
+# request for a slot supersedes the old one: if the old one hasn't started
+# it never runs, and if it has, its result is dropped on arrival. So
+# clicking through a list only ever shows the current item's image.
+#
+# InlineThumbnails builds on it for the row icons in the item views.
+import os
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+
+
+class _Signals(QObject):
+    # slot, generation, result (or the exception the work raised)
+    finished = pyqtSignal(object, int, object)
+
+
+class _Task(QRunnable):
+    def __init__(self, loader, slot, generation, work):
+        super().__init__()
+        self.loader = loader
+        self.slot = slot
+        self.generation = generation
+        self.work = work
+
+    def run(self):
+        if not self.loader.is_current(self.slot, self.generation):
+            return  # Superseded while queued
+        try:
+            result = self.work()
+        except Exception as e:
+            result = e
+        self.loader.signals.finished.emit(self.slot, self.generation, result)
+
+
+class ImageLoader(QObject):
+    def __init__(self, thumbnails, parent=None, threads=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        self.pool = QThreadPool(self)
+        if threads is not None:
+            self.pool.setMaxThreadCount(threads)
+        # Imports go one at a time: they share the staging file and the
+        # image index (see DataManager.import_image)
+        self.import_pool = QThreadPool(self)
+        self.import_pool.setMaxThreadCount(1)
+        self.signals = _Signals(self)
+        self.signals.finished.connect(self._finished)
+        self._generations = {}
+        self._callbacks = {}
+
+    def is_current(self, slot, generation):
+        return self._generations.get(slot) == generation
+
+    def _submit(self, pool, slot, work, callback):
+        generation = self._generations.get(slot, 0) + 1
+        self._generations[slot] = generation
+        self._callbacks[slot] = callback
+        pool.start(_Task(self, slot, generation, work))
+
+    def cancel(self, slot):
+        # Drops whatever slot was waiting for
+        self._generations[slot] = self._generations.get(slot, 0) + 1
+        self._callbacks.pop(slot, None)
+
+    def _finished(self, slot, generation, result):
+        if not self.is_current(slot, generation):
+            return
+        self._callbacks.pop(slot)(result)
+
+    def preview(self, slot, path, width, height, callback):
+        # callback(QPixmap or None) on the GUI thread, unless slot asks for
+        # something else first. Answers from memory straight away (returning
+        # True) when it can; otherwise returns False, so the caller can show
+        # a placeholder.
+        key = self.thumbnails.key(path, width, height)
+        pixmap = self.thumbnails.cached(key) if key is not None else None
+        if key is None or pixmap is not None:
+            self.cancel(slot)
+            callback(pixmap)
+            return True
+
+        def loaded(image):
+            if isinstance(image, Exception) or image.isNull():
+                callback(None)
+            else:
+                callback(self.thumbnails.remember(key, image))
+        self._submit(self.pool, slot, lambda: self.thumbnails.load(key, path, width, height), loaded)
+        return False
+
+    def import_image(self, slot, dm, source_path, kind, callback):
+        # callback(relpath or None, error message or None) once
+        # dm.import_image has stored the file, unless slot moved on first.
+        # An import already under way still finishes; its file goes unused.
+        def imported(result):
+            if isinstance(result, Exception):
+                callback(None, f"{os.path.basename(source_path)}: {result}")
+            else:
+                callback(result, None)
+        self._submit(self.import_pool, slot, lambda: dm.import_image(source_path, kind=kind), imported)
+
+    def wait(self, msecs=-1):
+        # Lets running work finish (imports in particular) before exiting
+        self.pool.clear()
+        self.pool.waitForDone(msecs)
+        self.import_pool.waitForDone(msecs)
+
+
+class _ThumbnailSignals(QObject):
+    # key, QImage (null if it couldn't be decoded), or None if skipped
+    finished = pyqtSignal(str, object)
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, rows, key, path):
+        super().__init__()
+        self.rows = rows
+        self.key = key
+        self.path = path
+
+    def run(self):
+        rows = self.rows
+        if self.key not in rows.wanted:
+            # Scrolled past before its turn came
+            rows.signals.finished.emit(self.key, None)
+            return
+        try:
+            image = rows.thumbnails.load(self.key, self.path, rows.size, rows.size)
+        except Exception:
+            image = QImage()
+        rows.signals.finished.emit(self.key, image)
+
+
+class InlineThumbnails(QObject):
+    # Row icons for the sub tree and ingredient lists. Models call get() from
+    # data(), which views only do for the rows they paint, so only visible
+    # rows are ever decoded; a scroll forgets requests for rows that went
+    # by before their turn. Pixmaps live in the shared ThumbnailCache, whose
+    # byte budget evicts those not painted lately; models keep none.
+    def __init__(self, loader, images_dir, size=32, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.thumbnails = loader.thumbnails
+        self.images_dir = images_dir
+        self.size = size
+        self.signals = _ThumbnailSignals(self)
+        self.signals.finished.connect(self._finished)
+        # Keys of the rows painted since the last scroll; read by workers
+        self.wanted = set()
+        # key -> image path, for requests queued or running
+        self._pending = {}
+        self._failed = set()
+        # image name -> cache key (None if missing); saves a stat per paint
+        self._keys = {}
+        self._views = []
+        # Shown until the thumbnail arrives, so row text never shifts
+        self.placeholder = QPixmap(size, size)
+        self.placeholder.fill(Qt.GlobalColor.transparent)
+
+    def attach(self, view):
+        view.setIconSize(QSize(self.size, self.size))
+        view.verticalScrollBar().valueChanged.connect(self._scrolled)
+        self._views.append(view)
+
+    def get(self, image_name):
+        # The row icon for image_name; the placeholder while it loads or if
+        # there is none
+        if not image_name:
+            return None
+        if image_name in self._keys:
+            key = self._keys[image_name]
+        else:
+            key = self._keys[image_name] = self.thumbnails.key(os.path.join(self.images_dir, image_name),
+                                                               self.size, self.size)
+        if key is None or key in self._failed:
+            return self.placeholder
+        pixmap = self.thumbnails.cached(key)
+        if pixmap is not None:
+            return pixmap
+        self.wanted.add(key)
+        if key not in self._pending:
+            self._request(key, os.path.join(self.images_dir, image_name))
+        return self.placeholder
+
+    def _request(self, key, path):
+        self._pending[key] = path
+        # Behind the editors' previews, which someone is waiting on
+        self.loader.pool.start(_ThumbnailTask(self, key, path), -1)
+
+    def _finished(self, key, image):
+        path = self._pending.pop(key, None)
+        if image is None:
+            if key in self.wanted and path is not None:
+                # Scrolled back to it meanwhile
+                self._request(key, path)
+            return
+        if image.isNull():
+            self._failed.add(key)
+            return
+        self.thumbnails.remember(key, image)
+        for view in self._views:
+            view.viewport().update()
+
+    def _scrolled(self):
+        self.wanted.clear()
+
+    def images_changed(self):
+        # Files under images/ changed; look them up again
+        self._keys.clear()
+        self._failed.clear()
+        for view in self._views:
+            view.viewport().update()
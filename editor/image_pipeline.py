@@ -0,0 +1,137 @@
+import importlib.util
+import os
+import shutil
+
+# Pillow is optional (without it images are copied as-is) and is imported on
+# first use so headless tools that never touch images start quickly.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def pillow_available():
+    return importlib.util.find_spec("PIL") is not None
+
+
+def max_image_size(config, kind="ingredient"):
+    # Largest edge we ever need: the size the trainer renders at times the
+    # HiDPI multiplier. Sub images are shown in a ~300px card.
+    scale = config.get("image_hidpi_scale", 2)
+    if kind == "sub":
+        base = config.get("sub_image_size", 300)
+    else:
+        base = config.get("ingredient_image_size", 64)
+    return max(1, int(base * scale))
+
+
+def image_kind(relative_path):
+    # Sub pictures live in images/subs/, everything else is an ingredient
+    parts = relative_path.replace('\\', '/').split('/')
+    return "sub" if len(parts) > 1 and parts[0] == "subs" else "ingredient"
+
+
+def _save_optimized(image, dest_path):
+    ext = os.path.splitext(dest_path)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        image.convert('RGB').save(dest_path, 'JPEG', quality=85, optimize=True, progressive=True)
+    elif ext == '.webp':
+        image.save(dest_path, 'WEBP', quality=85, method=6)
+    else:
+        image.save(dest_path, 'PNG', optimize=True)
+
+
+def optimize_image(source_path, dest_path, max_size, webp=False):
+    # Resize to fit max_size, drop metadata and recompress. The original bytes
+    # are kept whenever recompressing would not make the file smaller.
+    # Returns a stats dict with original and optimized byte counts.
+    original_bytes = os.path.getsize(source_path)
+    stats = {
+        "original_bytes": original_bytes,
+        "optimized_bytes": original_bytes,
+        "resized": False,
+        "webp": None,
+    }
+    if not pillow_available():
+        if os.path.abspath(source_path) != os.path.abspath(dest_path):
+            shutil.copy2(source_path, dest_path)
+        return stats
+
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    stats["original_size"] = list(image.size)
+    if max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        stats["resized"] = True
+    stats["size"] = list(image.size)
+
+    # Drop EXIF/ICC/text chunks; only transparency affects how it renders
+    transparency = image.info.get('transparency')
+    image.info = {} if transparency is None else {'transparency': transparency}
+
+    tmp_path = dest_path + '.tmp' + os.path.splitext(dest_path)[1]
+    _save_optimized(image, tmp_path)
+    optimized_bytes = os.path.getsize(tmp_path)
+    if stats["resized"] or optimized_bytes < original_bytes:
+        os.replace(tmp_path, dest_path)
+        stats["optimized_bytes"] = optimized_bytes
+    else:
+        os.remove(tmp_path)
+        if os.path.abspath(source_path) != os.path.abspath(dest_path):
+            shutil.copy2(source_path, dest_path)
+
+    if webp:
+        webp_path = os.path.splitext(dest_path)[0] + '.webp'
+        if os.path.abspath(webp_path) != os.path.abspath(dest_path):
+            _save_optimized(image, webp_path)
+            stats["webp"] = os.path.basename(webp_path)
+            stats["webp_bytes"] = os.path.getsize(webp_path)
+    return stats
+
+
+def _optimize_job(job):
+    path, max_size, webp = job
+    try:
+        return path, optimize_image(path, path, max_size, webp), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def is_webp_sibling(path):
+    # True for the .webp copies written next to a PNG/JPEG original
+    stem, ext = os.path.splitext(path)
+    return ext.lower() == '.webp' and any(os.path.exists(stem + e) for e in IMAGE_EXTENSIONS[:3])
+
+
+def list_library_images(images_dir):
+    found = []
+    for root, _, files in os.walk(images_dir):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS) and '.tmp' not in name:
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def optimize_library(images_dir, config, webp=False, workers=None):
+    # Reprocess every image under images_dir in place across a process pool.
+    # Returns ({relative path: stats}, {relative path: error message}).
+    jobs = []
+    for path in list_library_images(images_dir):
+        rel = os.path.relpath(path, images_dir).replace('\\', '/')
+        if is_webp_sibling(path):
+            continue  # Generated sibling, not a source image
+        jobs.append((path, max_image_size(config, image_kind(rel)), webp))
+
+    results, errors = {}, {}
+    if not jobs:
+        return results, errors
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, stats, error in pool.map(_optimize_job, jobs, chunksize=4):
+            rel = os.path.relpath(path, images_dir).replace('\\', '/')
+            if error:
+                errors[rel] = error
+            else:
+                results[rel] = stats
+    return results, errors
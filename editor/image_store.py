@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+
+import image_pipeline
+
+INDEX_VERSION = 1
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageStore:
+    # Content-addressed view of public/images. The index maps
+    #   blobs:   sha256 of a stored file -> its path relative to images/
+    #   sources: sha256 of an imported source file -> stored path
+    # so importing the same picture twice (even after it was recompressed)
+    # reuses the stored file, and new files never overwrite an existing name.
+    def __init__(self, images_dir, index_path):
+        self.images_dir = images_dir
+        self.index_path = index_path
+        self._blobs = None
+        self._sources = {}
+
+    def _relpath(self, path):
+        return os.path.relpath(path, self.images_dir).replace('\\', '/')
+
+    def _abspath(self, relpath):
+        return os.path.join(self.images_dir, *relpath.split('/'))
+
+    def _ensure_loaded(self):
+        if self._blobs is not None:
+            return
+        index = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            except json.JSONDecodeError:
+                index = None
+        if not index or index.get("version") != INDEX_VERSION:
+            self.rebuild()
+            return
+        self._blobs = {h: p for h, p in index.get("blobs", {}).items()
+                       if os.path.exists(self._abspath(p))}
+        self._sources = {h: p for h, p in index.get("sources", {}).items()
+                         if os.path.exists(self._abspath(p))}
+
+    def save(self):
+        index = {
+            "version": INDEX_VERSION,
+            "blobs": dict(sorted(self._blobs.items())),
+            "sources": dict(sorted(self._sources.items())),
+        }
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def rebuild(self):
+        # Re-hash everything on disk. For duplicate content the first path
+        # (in sorted order) becomes the blob; see find_duplicates for the rest.
+        self._blobs = {}
+        for path in image_pipeline.list_library_images(self.images_dir):
+            self._blobs.setdefault(hash_file(path), self._relpath(path))
+        self._sources = {h: p for h, p in self._sources.items()
+                         if os.path.exists(self._abspath(p))}
+        self.save()
+
+    def lookup(self, content_hash):
+        self._ensure_loaded()
+        relpath = self._blobs.get(content_hash)
+        if relpath and os.path.exists(self._abspath(relpath)):
+            return relpath
+        return None
+
+    def lookup_source(self, source_hash):
+        self._ensure_loaded()
+        relpath = self._sources.get(source_hash)
+        if relpath and os.path.exists(self._abspath(relpath)):
+            return relpath
+        return None
+
+    def blob_name(self, filename, content_hash):
+        # "Mustard.png" -> "Mustard.3f9a1c2b7d.png": readable, collision free
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}.{content_hash[:10]}{ext.lower()}"
+
+    def add(self, staged_path, filename, source_hash=None, subdir=""):
+        # Moves a staged file into the store. Returns (relpath, reused); if the
+        # content is already stored the staged file is discarded.
+        self._ensure_loaded()
+        content_hash = hash_file(staged_path)
+        existing = self.lookup(content_hash)
+        if existing:
+            os.remove(staged_path)
+            relpath, reused = existing, True
+        else:
+            relpath = self.blob_name(filename, content_hash)
+            if subdir:
+                relpath = f"{subdir}/{relpath}"
+            os.makedirs(os.path.dirname(self._abspath(relpath)), exist_ok=True)
+            os.replace(staged_path, self._abspath(relpath))
+            self._blobs[content_hash] = relpath
+            reused = False
+        if source_hash:
+            self._sources[source_hash] = relpath
+        self.save()
+        return relpath, reused
+
+    def find_duplicates(self):
+        # Groups (lists of relpaths, sorted) of byte-identical files
+        groups = {}
+        for path in image_pipeline.list_library_images(self.images_dir):
+            if image_pipeline.is_webp_sibling(path):
+                continue
+            groups.setdefault(hash_file(path), []).append(self._relpath(path))
+        return [paths for paths in groups.values() if len(paths) > 1]
+
+    def remove(self, relpath):
+        self._ensure_loaded()
+        path = self._abspath(relpath)
+        if os.path.exists(path):
+            os.remove(path)
+        self._blobs = {h: p for h, p in self._blobs.items() if p != relpath}
+        self._sources = {h: p for h, p in self._sources.items() if p != relpath}
@@ -0,0 +1,107 @@
+# Reverse index from ingredient name to the subs that list it, so renaming or
+# deleting an ingredient rewrites only those subs instead of rescanning the
+# whole catalog. Subs are tracked by identity (like search_index) because
+# their list positions shift as subs are added, moved and removed; the
+# category is kept alongside so callers can still locate the row.
+#
+# Over sharded subs (see sub_shards) only loaded categories are indexed; a
+# lookup first loads the categories whose index entry lists the name.
+from sub_shards import ShardedSubs, loaded_items
+
+
+class IngredientUsage:
+    def __init__(self):
+        # ingredient name -> {id(sub): sub}
+        self._users = {}
+        # id(sub) -> [category, sub, names indexed for it]
+        self._subs = {}
+        self._sharded = None
+
+    def rebuild(self, subs):
+        self._users.clear()
+        self._subs.clear()
+        self._sharded = subs if isinstance(subs, ShardedSubs) else None
+        for category, cat_subs in loaded_items(subs, self, self._category_loaded):
+            self._category_loaded(category, cat_subs)
+
+    def _category_loaded(self, category, cat_subs):
+        for sub in cat_subs:
+            self.add_sub(category, sub)
+
+    def _load_users(self, name):
+        if self._sharded is not None:
+            for category in self._sharded.categories_using(name):
+                self._sharded[category]
+
+    # Keeping the index in step with sub edits
+
+    def add_sub(self, category, sub):
+        names = set(sub.ingredients or ())
+        self._subs[id(sub)] = [category, sub, names]
+        for name in names:
+            self._users.setdefault(name, {})[id(sub)] = sub
+
+    def remove_sub(self, sub):
+        entry = self._subs.pop(id(sub), None)
+        if entry is None:
+            return
+        for name in entry[2]:
+            users = self._users.get(name)
+            if users is not None:
+                users.pop(id(sub), None)
+                if not users:
+                    del self._users[name]
+
+    def update_sub(self, category, sub):
+        # Re-reads sub.ingredients after an edit, and the category if it moved
+        self.remove_sub(sub)
+        self.add_sub(category, sub)
+
+    def set_category(self, category, cat_subs):
+        # After a category rename
+        for sub in cat_subs:
+            entry = self._subs.get(id(sub))
+            if entry is not None:
+                entry[0] = category
+
+    # Lookup
+
+    def users(self, name):
+        # [(category, sub)] for every sub listing `name`
+        self._load_users(name)
+        return [(self._subs[key][0], sub) for key, sub in self._users.get(name, {}).items()]
+
+    def count(self, name):
+        self._load_users(name)
+        return len(self._users.get(name, ()))
+
+    # Cascades; both return the subs they rewrote as [(category, sub)]
+
+    def rename_ingredient(self, old_name, new_name):
+        self._load_users(old_name)
+        users = self._users.pop(old_name, None)
+        if not users or old_name == new_name:
+            if users:
+                self._users[old_name] = users
+            return []
+        merged = self._users.setdefault(new_name, {})
+        affected = []
+        for key, sub in users.items():
+            sub.ingredients[:] = [new_name if ing == old_name else ing for ing in sub.ingredients]
+            entry = self._subs[key]
+            entry[2].discard(old_name)
+            entry[2].add(new_name)
+            merged[key] = sub
+            affected.append((entry[0], sub))
+        return affected
+
+    def remove_ingredient(self, name):
+        self._load_users(name)
+        users = self._users.pop(name, None) or {}
+        affected = []
+        for key, sub in users.items():
+            sub.ingredients[:] = [ing for ing in sub.ingredients if ing != name]
+            entry = self._subs[key]
+            entry[2].discard(name)
+            affected.append((entry[0], sub))
+        return affected
@@ -0,0 +1,226 @@
+# Write-ahead journal for editor sessions.
+#
+# Every edit is appended as one small fsync'd record before the JSON files
+# are rewritten. A crash between auto-saves, or halfway through writing the
+# four files, then loses nothing: load_data replays the journal over the
+# files it started from.
+#
+# Records are JSON framed by a 4-byte length and a CRC32, so a write torn by
+# a power cut is recognized and dropped. A journal holds
+#   {"base": {dataset: fingerprint}}                 the files the edits apply to
+#   {"seq": n, "k": kind, ...}                       one edit, see encode()
+#   {"commit": n, "files": {dataset: fingerprint}}   a save covering edits <= n
+# A save stages its files next to the old ones (*.pending), appends a commit
+# record and only then renames them into place, so recovery can finish an
+# interrupted save instead of mixing old and new files. Once the files are
+# in place the journal is rewritten with a new base and only the newer edits.
+import json
+import os
+import struct
+import zlib
+
+from catalog import Ingredient, Sub, Tip, to_json
+from history import MISSING, insert_key
+
+PENDING = '.pending'
+
+_FRAME = struct.Struct(">II")
+
+
+def _frame(record):
+    payload = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=to_json).encode('utf-8')
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def read(self):
+        # Every intact record, stopping at the first torn or corrupt one
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        records = []
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, offset)
+            start = offset + _FRAME.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            try:
+                records.append(json.loads(payload))
+            except ValueError:
+                break
+            offset = start + length
+        return records
+
+    def append(self, records):
+        # One fsync for the lot
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        self._file.write(b"".join(_frame(record) for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def rewrite(self, records):
+        # Atomically replaces the journal (an empty list deletes it)
+        self.close()
+        if not records:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(_frame(record) for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Edits. History changes (see history.py) point at live sub dicts; in the
+# journal a sub is its category and row at the time the record is written.
+
+def _row(subs, category, sub):
+    for row, candidate in enumerate(subs.get(category, ())):
+        if candidate is sub:
+            return row
+    raise ValueError(f"sub '{sub.get('name', '')}' is not in '{category}'")
+
+
+def _split(values):
+    return ({key: value for key, value in values.items() if value is not MISSING},
+            [key for key, value in values.items() if value is MISSING])
+
+
+def _cascade(subs, cascade):
+    return [[category, _row(subs, category, sub), list(positions)] for category, sub, positions in cascade]
+
+
+def encode(change, subs):
+    # JSON form of a history change, located against `subs` as it is now
+    kind = change[0]
+    record = {"k": kind}
+    if kind == "sub_set":
+        _, category, sub, _, after = change
+        record["set"], record["drop"] = _split(after)
+        record.update(c=category, r=_row(subs, category, sub))
+    elif kind == "sub_insert":
+        _, category, row, sub = change
+        record.update(c=category, r=row, sub=sub)
+    elif kind == "sub_remove":
+        record.update(c=change[1], r=change[2])
+    elif kind == "sub_move":
+        _, _, category, row, to_category, to_row = change
+        record.update(c=category, r=row, to=to_category, tr=to_row)
+    elif kind == "category_insert":
+        _, name, position, cat_subs = change
+        record.update(name=name, pos=position, subs=cat_subs)
+    elif kind == "category_remove":
+        record.update(name=change[1])
+    elif kind == "ingredient_set":
+        _, name, _, after = change
+        record["set"], record["drop"] = _split(after)
+        record.update(name=name)
+    elif kind == "ingredient_insert":
+        _, name, position, data, cascade = change
+        record.update(name=name, pos=position, data=data, cascade=_cascade(subs, cascade))
+    elif kind == "ingredient_remove":
+        record.update(name=change[1], cascade=_cascade(subs, change[4]))
+    elif kind == "ingredient_rename":
+        _, old_name, new_name, _, new_position, cascade = change
+        record.update(old=old_name, new=new_name, pos=new_position, cascade=_cascade(subs, cascade))
+    elif kind in ("tip_insert", "tip_set"):
+        record.update(r=change[1], tip=change[-1])
+    elif kind == "tip_remove":
+        record.update(r=change[1])
+    elif kind == "config_set":
+        _, key, _, after = change
+        record.update(key=key)
+        if after is MISSING:
+            record["drop"] = True
+        else:
+            record["value"] = after
+    else:
+        raise ValueError(f"Unknown change '{kind}'")
+    return record
+
+
+def record_datasets(record):
+    # Dataset names a journaled edit changes
+    kind = record["k"]
+    if kind.startswith(("sub_", "category_")):
+        return {"subs"}
+    if kind.startswith("ingredient_"):
+        return {"ingredients", "subs"} if record.get("cascade") else {"ingredients"}
+    if kind.startswith("tip_"):
+        return {"tips"}
+    return {"config"}
+
+
+def apply_record(record, subs, ingredients, tips, config):
+    # Replays one journaled edit onto freshly loaded data
+    kind = record["k"]
+    if kind == "sub_set":
+        sub = subs[record["c"]][record["r"]]
+        for key in record["drop"]:
+            sub.pop(key, None)
+        sub.update(record["set"])
+    elif kind == "sub_insert":
+        subs[record["c"]].insert(record["r"], Sub.from_json(record["sub"]))
+    elif kind == "sub_remove":
+        del subs[record["c"]][record["r"]]
+    elif kind == "sub_move":
+        subs[record["to"]].insert(record["tr"], subs[record["c"]].pop(record["r"]))
+    elif kind == "category_insert":
+        insert_key(subs, record["name"], [Sub.from_json(sub) for sub in record["subs"]], record["pos"])
+    elif kind == "category_remove":
+        del subs[record["name"]]
+    elif kind == "ingredient_set":
+        data = ingredients[record["name"]]
+        for key in record["drop"]:
+            data.pop(key, None)
+        data.update(record["set"])
+    elif kind == "ingredient_insert":
+        insert_key(ingredients, record["name"], Ingredient.from_json(record["data"]), record["pos"])
+        for category, row, positions in record["cascade"]:
+            names = subs[category][row]['ingredients']
+            for i in positions:
+                names.insert(i, record["name"])
+    elif kind == "ingredient_remove":
+        del ingredients[record["name"]]
+        for category, row, positions in record["cascade"]:
+            names = subs[category][row]['ingredients']
+            for i in reversed(positions):
+                del names[i]
+    elif kind == "ingredient_rename":
+        insert_key(ingredients, record["new"], ingredients.pop(record["old"]), record["pos"])
+        for category, row, positions in record["cascade"]:
+            names = subs[category][row]['ingredients']
+            for i in positions:
+                names[i] = record["new"]
+    elif kind == "tip_insert":
+        tips.insert(record["r"], Tip.from_json(record["tip"]))
+    elif kind == "tip_remove":
+        del tips[record["r"]]
+    elif kind == "tip_set":
+        tips[record["r"]] = Tip.from_json(record["tip"])
+    elif kind == "config_set":
+        if record.get("drop"):
+            config.pop(record["key"], None)
+        else:
+            config[record["key"]] = record["value"]
+    else:
+        raise ValueError(f"Unknown journal record '{kind}'")
@@ -1,15 +1,27 @@
+import argparse
 import sys
 import os
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QTabWidget, QListWidget, QLabel, QLineEdit, QTextEdit, 
                              QPushButton, QComboBox, QCheckBox, QFileDialog, QSplitter,
-                             QTreeWidget, QTreeWidgetItem, QMessageBox, QGroupBox, QScrollArea,
-                             QGridLayout, QDialog)
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtGui import QIcon, QPixmap, QPalette, QColor, QAction, QFont
+                             QTreeView, QMessageBox, QGroupBox, QScrollArea,
+                             QGridLayout, QDialog, QTabBar, QListView)
+from PyQt6.QtCore import Qt, QSize, QObject, QTimer, pyqtSignal, QAbstractListModel, QModelIndex
+from PyQt6.QtGui import QIcon, QPixmap, QPalette, QColor, QAction, QFont, QKeySequence, QShortcut
 
 from data_manager import DataManager
-from emojis import EMOJI_DATA
+from data_watcher import DataWatcher
+from command_palette import CatalogSearch, CommandPalette
+from models import (IngredientListModel, SubTreeModel, TipListModel, CatalogValidation, NameFilterProxy,
+                    ITEM_TYPE_ROLE, SUB_INDEX_ROLE)
+from emojis import EMOJI_DATA, emoji_name, emojis_in, search_emojis
+from catalog import Ingredient, Sub, Tip
+from history import (MISSING, changed_fields, external_changes, ingredient_cascade, insert_key,
+                     key_position, set_fields, touched_datasets)
+from validation import ERROR
+from thumbnail_cache import ThumbnailCache
+from image_loader import ImageLoader, InlineThumbnails
+import profiling
 
 class DarkPalette(QPalette):
     def __init__(self):
@@ -28,53 +40,107 @@ class DarkPalette(QPalette):
         self.setColor(QPalette.ColorRole.Highlight, QColor(42, 130, 218))
         self.setColor(QPalette.ColorRole.HighlightedText, Qt.GlobalColor.black)
 
+class SaveSignals(QObject):
+    # Bridges DataManager's background save queue back onto the GUI thread
+    saved = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+class EmojiListModel(QAbstractListModel):
+    # One flat list of emoji strings; the view asks only for visible rows,
+    # so switching categories or filtering never creates per-item widgets.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.emojis = []
+        self.font = QFont()
+        self.font.setPointSize(24)
+        self.size_hint = QSize(50, 50)
+
+    def set_emojis(self, emojis):
+        self.beginResetModel()
+        self.emojis = emojis
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.emojis)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.emojis[index.row()]
+        if role == Qt.ItemDataRole.FontRole:
+            return self.font
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return Qt.AlignmentFlag.AlignCenter
+        if role == Qt.ItemDataRole.SizeHintRole:
+            return self.size_hint
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return emoji_name(self.emojis[index.row()])
+        return None
+
 class EmojiPickerDialog(QDialog):
+    # Built once per owner and reused; call exec() each time it is needed.
+    # Category rows are looked up from the emoji index when a tab is first shown.
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Select Emoji")
         self.resize(800, 600)
         self.selected_emoji = None
+        self.category_cache = {}
         
         layout = QVBoxLayout(self)
         
-        self.tabs = QTabWidget()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search emojis (e.g. cheese, light bulb)...")
+        self.search_edit.textChanged.connect(self.refresh_view)
+        layout.addWidget(self.search_edit)
         
-        font = QFont()
-        font.setPointSize(24)
-        
-        for category, emojis in EMOJI_DATA.items():
-            tab = QWidget()
-            tab_layout = QVBoxLayout(tab)
-            
-            list_widget = QListWidget()
-            list_widget.setViewMode(QListWidget.ViewMode.IconMode)
-            list_widget.setResizeMode(QListWidget.ResizeMode.Adjust)
-            list_widget.setSpacing(5)
-            list_widget.setIconSize(QSize(40, 40)) # Dummy size for spacing
-            
-            for emoji in emojis:
-                from PyQt6.QtWidgets import QListWidgetItem
-                item = QListWidgetItem(emoji)
-                item.setFont(font)
-                item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                item.setSizeHint(QSize(50, 50))
-                list_widget.addItem(item)
-                
-            list_widget.itemDoubleClicked.connect(self.on_item_double_clicked)
-            tab_layout.addWidget(list_widget)
-            
-            self.tabs.addTab(tab, category)
-            
+        self.tabs = QTabBar()
+        for category in EMOJI_DATA:
+            self.tabs.addTab(category)
+        self.tabs.currentChanged.connect(self.refresh_view)
         layout.addWidget(self.tabs)
         
+        self.model = EmojiListModel(self)
+        self.list_view = QListView()
+        self.list_view.setViewMode(QListView.ViewMode.IconMode)
+        self.list_view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.list_view.setMovement(QListView.Movement.Static)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setSpacing(5)
+        self.list_view.setModel(self.model)
+        self.list_view.doubleClicked.connect(self.on_item_double_clicked)
+        layout.addWidget(self.list_view)
+        
         btn_layout = QHBoxLayout()
         self.cancel_btn = QPushButton("Cancel")
         self.cancel_btn.clicked.connect(self.reject)
         btn_layout.addWidget(self.cancel_btn)
         layout.addLayout(btn_layout)
         
-    def on_item_double_clicked(self, item):
-        self.selected_emoji = item.text()
+        self.refresh_view()
+        
+    @profiling.profiled("EmojiPickerDialog.refresh_view")
+    def refresh_view(self):
+        query = self.search_edit.text().strip()
+        # While searching, results span every category
+        self.tabs.setEnabled(not query)
+        if query:
+            self.model.set_emojis(search_emojis(query))
+            return
+        category = self.tabs.tabText(self.tabs.currentIndex())
+        if category not in self.category_cache:
+            self.category_cache[category] = emojis_in(category)
+        self.model.set_emojis(self.category_cache[category])
+        
+    def exec(self):
+        self.selected_emoji = None
+        self.search_edit.clear()
+        self.search_edit.setFocus()
+        return super().exec()
+        
+    def on_item_double_clicked(self, index):
+        self.selected_emoji = self.model.emojis[index.row()]
         self.accept()
 
 class TipsEditor(QWidget):
@@ -85,6 +151,10 @@ class TipsEditor(QWidget):
         self.tips = []
         self.config = {}
         self.current_index = -1
+        self._emoji_picker = None
+        # Set while the icon field is filled in from the data, so that isn't
+        # recorded as an edit
+        self._loading = False
         
         layout = QHBoxLayout(self)
         
@@ -93,9 +163,13 @@ class TipsEditor(QWidget):
         
         left_layout.addWidget(QLabel("Site Tips:"))
         
-        self.list_widget = QListWidget()
-        self.list_widget.currentRowChanged.connect(self.on_selection_changed)
-        left_layout.addWidget(self.list_widget)
+        self.model = TipListModel(self)
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.selectionModel().currentRowChanged.connect(
+            lambda current, previous: self.on_selection_changed(current.row()))
+        left_layout.addWidget(self.list_view)
         
         btn_layout = QHBoxLayout()
         self.add_btn = QPushButton("Add New Tip")
@@ -171,51 +245,51 @@ class TipsEditor(QWidget):
         
         layout.addWidget(splitter)
 
+    def emoji_picker(self):
+        # The picker is built on first use and kept for later picks
+        if self._emoji_picker is None:
+            self._emoji_picker = EmojiPickerDialog(self)
+        return self._emoji_picker
+
     def pick_default_emoji(self):
-        dialog = EmojiPickerDialog(self)
+        dialog = self.emoji_picker()
         if dialog.exec():
             if dialog.selected_emoji:
                 self.icon_edit.setText(dialog.selected_emoji)
 
     def pick_tip_emoji(self):
-        dialog = EmojiPickerDialog(self)
+        dialog = self.emoji_picker()
         if dialog.exec():
             if dialog.selected_emoji:
                 self.tip_icon_edit.setText(dialog.selected_emoji)
 
     def load_data(self, tips, config):
-        # Normalize tips to objects IN PLACE to maintain reference with MainWindow
+        # Shared with MainWindow; DataManager already normalized the tips
         self.tips = tips
-        for i in range(len(self.tips)):
-            t = self.tips[i]
-            if isinstance(t, str):
-                self.tips[i] = {"text": t, "icon": ""}
-            elif isinstance(t, dict):
-                # Ensure keys exist
-                if "text" not in t: self.tips[i]["text"] = ""
-                if "icon" not in t: self.tips[i]["icon"] = ""
-                
         self.config = config
+        self._loading = True
         self.icon_edit.setText(self.config.get("tip_icon", "💡"))
+        self._loading = False
         self.refresh_list()
 
+    def default_icon_changed(self):
+        # Undo/redo changed the default icon; show it without recording it
+        self._loading = True
+        self.icon_edit.setText(self.config.get("tip_icon", "💡"))
+        self._loading = False
+        self.model.icons_changed()
+
+    def reload_current(self):
+        # Re-read the selected tip after undo/redo changed the list
+        self.on_selection_changed(self.list_view.currentIndex().row())
+
+    @profiling.profiled("TipsEditor.refresh_list")
     def refresh_list(self):
-        self.list_widget.clear()
-        for tip in self.tips:
-            # Handle potential string if data corruption occurred or incomplete normalization
-            if isinstance(tip, str):
-                text = tip
-                icon = ""
-            else:
-                text = tip.get("text", "")
-                icon = tip.get("icon", "")
-                
-            # Truncate long tips for display
-            display_text = text if len(text) < 50 else text[:47] + "..."
-            
-            if not icon:
-                icon = self.config.get("tip_icon", "💡")
-            self.list_widget.addItem(f"{icon} {display_text}")
+        # Full rebuild; edits below update single rows instead
+        self.model.reset(self.tips, self.config)
+
+    def select_row(self, row):
+        self.list_view.setCurrentIndex(self.model.index(row, 0))
 
     def on_selection_changed(self, row):
         if row < 0:
@@ -228,38 +302,41 @@ class TipsEditor(QWidget):
         self.current_index = row
         self.form_group.setEnabled(True)
         tip = self.tips[row]
-        if isinstance(tip, str):
-            self.tip_edit.setText(tip)
-            self.tip_icon_edit.clear()
-        else:
-            self.tip_edit.setText(tip.get("text", ""))
-            self.tip_icon_edit.setText(tip.get("icon", ""))
+        self.tip_edit.setText(tip.text or "")
+        self.tip_icon_edit.setText(tip.icon or "")
         
     def on_config_changed(self):
-        self.config["tip_icon"] = self.icon_edit.text()
-        self.refresh_list() # Update list icons
+        before, after = self.config.get("tip_icon", MISSING), self.icon_edit.text()
+        if not self._loading and before != after:
+            self.dm.record_edit("default tip icon", ("config_set", "tip_icon", before, after))
+            self.dm.mark_dirty("config")
+        self.config["tip_icon"] = after
+        self.model.icons_changed() # Update list icons
         if self.save_callback:
             pass
 
     def add_tip(self):
-        self.tips.append({"text": "New Tip", "icon": ""})
-        self.refresh_list()
-        self.list_widget.setCurrentRow(len(self.tips) - 1)
+        tip = Tip(text="New Tip", icon="")
+        self.model.append_tip(tip)
+        self.dm.record_edit("add tip", ("tip_insert", len(self.tips) - 1, tip))
+        self.dm.mark_dirty("tips")
+        self.select_row(len(self.tips) - 1)
         self.tip_edit.setFocus()
         self.tip_edit.selectAll()
 
     def delete_tip(self):
-        row = self.list_widget.currentRow()
+        row = self.list_view.currentIndex().row()
         if row < 0:
             return
             
         confirm = QMessageBox.question(self, "Delete", "Are you sure you want to delete this tip?", 
                                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if confirm == QMessageBox.StandardButton.Yes:
-            self.tips.pop(row)
-            self.refresh_list()
-            self.save_callback()
+            self.dm.record_edit("delete tip", ("tip_remove", row, self.tips[row]))
+            self.model.remove_tip(row)
+            self.save_callback("tips")
 
+    @profiling.profiled("TipsEditor.save_current")
     def save_current(self):
         if self.current_index < 0:
             return
@@ -271,24 +348,32 @@ class TipsEditor(QWidget):
             QMessageBox.warning(self, "Error", "Tip cannot be empty")
             return
             
-        self.tips[self.current_index] = {
-            "text": new_text,
-            "icon": new_icon
-        }
-        self.refresh_list()
-        # Reselect the item
-        self.list_widget.setCurrentRow(self.current_index)
+        tip = Tip(text=new_text, icon=new_icon)
+        if tip != self.tips[self.current_index]:
+            self.dm.record_edit("edit tip", ("tip_set", self.current_index, self.tips[self.current_index], tip))
+        self.model.set_tip(self.current_index, tip)
         
         if self.save_callback:
-            self.save_callback()
+            self.save_callback("tips")
         
         QMessageBox.information(self, "Saved", "Tip updated!")
 
 class IngredientEditor(QWidget):
-    def __init__(self, data_manager, save_callback=None, parent=None):
+    def __init__(self, data_manager, save_callback=None, parent=None, thumbnails=None,
+                 ingredient_model=None, cascade_callback=None, images=None, row_icons=None):
         super().__init__(parent)
         self.dm = data_manager
         self.save_callback = save_callback
+        # Called as (affected subs, old name, new name or None) after a rename
+        # or delete rewrote the subs using an ingredient
+        self.cascade_callback = cascade_callback
+        self.thumbnails = thumbnails or ThumbnailCache(self.dm.thumbnail_cache_dir)
+        # Decodes previews and imports images off the GUI thread
+        self.images = images or ImageLoader(self.thumbnails, self)
+        # Thumbnails beside each row name, decoded as rows come into view
+        self.row_icons = row_icons or InlineThumbnails(self.images, self.dm.images_dir, parent=self)
+        # Shared with SubEditor's "Available" list when given
+        self.model = ingredient_model or IngredientListModel(parent=self, icon=self.row_icons.get)
         self.ingredients = {}
         self.current_ingredient_name = None
         
@@ -301,9 +386,13 @@ class IngredientEditor(QWidget):
         self.search_input.textChanged.connect(self.filter_list)
         left_layout.addWidget(self.search_input)
         
-        self.list_widget = QListWidget()
-        self.list_widget.currentItemChanged.connect(self.on_selection_changed)
-        left_layout.addWidget(self.list_widget)
+        self.proxy = NameFilterProxy(self.model, self)
+        self.list_view = QListView()
+        self.list_view.setModel(self.proxy)
+        self.list_view.setUniformItemSizes(True)
+        self.row_icons.attach(self.list_view)
+        self.list_view.selectionModel().currentChanged.connect(self.on_selection_changed)
+        left_layout.addWidget(self.list_view)
         
         btn_layout = QHBoxLayout()
         self.add_btn = QPushButton("Add New")
@@ -349,12 +438,16 @@ class IngredientEditor(QWidget):
         self.lto_check = QCheckBox("Is Limited Time Offer (LTO)?")
         form_layout.addWidget(self.lto_check, 4, 1)
         
+        form_layout.addWidget(QLabel("Usage:"), 5, 0)
+        self.usage_label = QLabel()
+        form_layout.addWidget(self.usage_label, 5, 1)
+        
         self.save_btn = QPushButton("Save Changes")
         self.save_btn.clicked.connect(self.save_current)
-        form_layout.addWidget(self.save_btn, 5, 1)
+        form_layout.addWidget(self.save_btn, 6, 1)
         
         # Spacer
-        form_layout.setRowStretch(6, 1)
+        form_layout.setRowStretch(7, 1)
         
         self.form_group.setLayout(form_layout)
         self.form_group.setEnabled(False)
@@ -370,23 +463,28 @@ class IngredientEditor(QWidget):
         self.ingredients = ingredients
         self.refresh_list()
         
+    @profiling.profiled("IngredientEditor.refresh_list")
     def refresh_list(self):
-        self.list_widget.clear()
-        search = self.search_input.text().lower()
-        for name in sorted(self.ingredients.keys()):
-            if search in name.lower():
-                self.list_widget.addItem(name)
-                
+        # Full rebuild; edits below update single rows instead
+        self.model.reset(self.ingredients)
+        
     def filter_list(self):
-        self.refresh_list()
+        self.proxy.set_filter(self.search_input.text())
+        
+    def select_name(self, name):
+        index = self.proxy.mapFromSource(self.model.index_of(name))
+        if index.isValid():
+            self.list_view.setCurrentIndex(index)
+        return index.isValid()
         
     def on_selection_changed(self, current, previous):
-        if not current:
+        if not current.isValid():
             self.form_group.setEnabled(False)
             self.current_ingredient_name = None
+            self.images.cancel(self.image_preview)
             return
             
-        name = current.text()
+        name = current.data()
         self.current_ingredient_name = name
         data = self.ingredients[name]
         
@@ -401,17 +499,38 @@ class IngredientEditor(QWidget):
         self.lto_check.setChecked(data.get('is_lto', False))
         
         self.update_preview(data.get('image', ''))
+        self.refresh_usage()
+        
+    @profiling.profiled("IngredientEditor.refresh_usage")
+    def refresh_usage(self):
+        if not self.current_ingredient_name:
+            self.usage_label.clear()
+            return
+        count = self.dm.ingredient_usage.count(self.current_ingredient_name)
+        self.usage_label.setText(f"Used by {count} sub{'' if count == 1 else 's'}")
         
+    def reload_current(self):
+        # Re-read the selected ingredient after undo/redo changed the data
+        self.on_selection_changed(self.list_view.currentIndex(), QModelIndex())
+        
+    @profiling.profiled("IngredientEditor.update_preview")
     def update_preview(self, image_name):
         if not image_name:
+            self.images.cancel(self.image_preview)
             self.image_preview.clear()
             self.image_preview.setText("No Image")
             return
             
         path = os.path.join(self.dm.images_dir, image_name)
-        if os.path.exists(path):
-            pixmap = QPixmap(path)
-            self.image_preview.setPixmap(pixmap.scaled(128, 128, Qt.AspectRatioMode.KeepAspectRatio))
+        # Decoded on a worker unless it's in memory; selecting something
+        # else meanwhile drops the result
+        if not self.images.preview(self.image_preview, path, 128, 128, self.show_preview):
+            self.image_preview.clear()
+            self.image_preview.setText("Loading...")
+
+    def show_preview(self, pixmap):
+        if pixmap is not None:
+            self.image_preview.setPixmap(pixmap)
         else:
             self.image_preview.clear()
             self.image_preview.setText("Not Found")
@@ -419,10 +538,18 @@ class IngredientEditor(QWidget):
     def browse_image(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Image", "", "Images (*.png *.jpg *.jpeg)")
         if file_path:
-            filename = self.dm.import_image(file_path)
-            if filename:
-                self.image_edit.setText(filename)
-                self.update_preview(filename)
+            # Copied and recompressed on a worker; see image_imported
+            self.image_preview.clear()
+            self.image_preview.setText("Importing...")
+            self.images.import_image(self.image_preview, self.dm, file_path, "ingredient", self.image_imported)
+
+    def image_imported(self, filename, error):
+        # Only called if the same ingredient is still selected
+        if error:
+            QMessageBox.critical(self, "Error", f"Failed to import image: {error}")
+        if filename:
+            self.image_edit.setText(filename)
+        self.update_preview(self.image_edit.text())
                 
     def add_ingredient(self):
         name = "New Ingredient"
@@ -431,33 +558,39 @@ class IngredientEditor(QWidget):
             name = f"New Ingredient {count}"
             count += 1
             
-        self.ingredients[name] = {
-            "category": "Meats",
-            "image": "",
-            "is_lto": False
-        }
-        self.refresh_list()
+        self.ingredients[name] = Ingredient(category="Meats", image="", is_lto=False)
+        self.dm.record_edit(f"add ingredient '{name}'", (
+            "ingredient_insert", name, len(self.ingredients) - 1, self.ingredients[name], ()))
+        self.dm.mark_dirty("ingredients")
+        self.model.ingredient_added(name)
         # Select the new item
-        items = self.list_widget.findItems(name, Qt.MatchFlag.MatchExactly)
-        if items:
-            self.list_widget.setCurrentItem(items[0])
+        if self.select_name(name):
             self.name_edit.setFocus()
             
     def delete_ingredient(self):
-        item = self.list_widget.currentItem()
-        if not item:
+        index = self.list_view.currentIndex()
+        if not index.isValid():
             return
             
-        name = item.text()
-        reply = QMessageBox.question(self, "Confirm Delete", 
-                                     f"Are you sure you want to delete '{name}'?",
+        name = index.data()
+        message = f"Are you sure you want to delete '{name}'?"
+        count = self.dm.ingredient_usage.count(name)
+        if count:
+            message += f"\nIt will be removed from {count} sub{'' if count == 1 else 's'}."
+        reply = QMessageBox.question(self, "Confirm Delete", message,
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         
         if reply == QMessageBox.StandardButton.Yes:
-            del self.ingredients[name]
-            self.refresh_list()
-            self.form_group.setEnabled(False)
+            self.dm.record_edit(f"delete ingredient '{name}'", (
+                "ingredient_remove", name, key_position(self.ingredients, name), self.ingredients[name],
+                ingredient_cascade(self.dm.ingredient_usage, name)))
+            affected = self.dm.delete_ingredient(self.ingredients, name)
+            self.model.ingredient_removed(name)
+            if self.cascade_callback:
+                self.cascade_callback(affected, name, None)
+            self.list_view.setCurrentIndex(QModelIndex())
             
+    @profiling.profiled("IngredientEditor.save_current")
     def save_current(self):
         if not self.current_ingredient_name:
             return
@@ -472,45 +605,70 @@ class IngredientEditor(QWidget):
             return
             
         # Update data
-        data = {
-            "category": self.category_combo.currentText(),
-            "image": self.image_edit.text(),
-            "is_lto": self.lto_check.isChecked()
-        }
+        data = Ingredient(category=self.category_combo.currentText(), image=self.image_edit.text(),
+                          is_lto=self.lto_check.isChecked())
         
+        changes = []
         if new_name != self.current_ingredient_name:
-            del self.ingredients[self.current_ingredient_name]
+            old_name = self.current_ingredient_name
+            old_position = key_position(self.ingredients, old_name)
+            cascade = ingredient_cascade(self.dm.ingredient_usage, old_name)
+            # Also rewrites every sub that lists the old name
+            affected = self.dm.rename_ingredient(self.ingredients, old_name, new_name)
+            changes.append(("ingredient_rename", old_name, new_name, old_position,
+                            key_position(self.ingredients, new_name), cascade))
+            before, after = changed_fields(self.ingredients[new_name], data)
             self.ingredients[new_name] = data
             self.current_ingredient_name = new_name
-            self.refresh_list()
-            items = self.list_widget.findItems(new_name, Qt.MatchFlag.MatchExactly)
-            if items:
-                self.list_widget.setCurrentItem(items[0])
+            self.model.ingredient_renamed(old_name, new_name)
+            self.select_name(new_name)
+            if self.cascade_callback:
+                self.cascade_callback(affected, old_name, new_name)
         else:
+            before, after = changed_fields(self.ingredients[new_name], data)
             self.ingredients[new_name] = data
+            self.model.ingredient_changed(new_name)
+        if after:
+            changes.append(("ingredient_set", new_name, before, after))
+        self.dm.record_edit(f"edit ingredient '{new_name}'", *changes)
             
-        # Signal that data changed
+        # Signal that data changed (rename_ingredient marks subs dirty if it touched any)
         if self.save_callback:
-            self.save_callback()
+            self.save_callback("ingredients")
 
 class SubEditor(QWidget):
-    def __init__(self, data_manager, save_callback=None, parent=None):
+    def __init__(self, data_manager, save_callback=None, parent=None, thumbnails=None,
+                 ingredient_model=None, images=None, row_icons=None):
         super().__init__(parent)
         self.dm = data_manager
         self.save_callback = save_callback
+        self.thumbnails = thumbnails or ThumbnailCache(self.dm.thumbnail_cache_dir)
+        self.images = images or ImageLoader(self.thumbnails, self)
+        self.row_icons = row_icons or InlineThumbnails(self.images, self.dm.images_dir, parent=self)
         self.subs = {} # dict[category] -> list[sub]
         self.all_ingredients = {}
         self.current_sub = None # Reference to the sub dict
         self.current_category = None
         self.current_index = -1
         
+        self.sub_model = SubTreeModel(self.is_sub_incomplete, self, usage=self.dm.ingredient_usage,
+                                      problems=self.sub_problems, icon=self.row_icons.get)
+        self.ingredient_model = ingredient_model or IngredientListModel(parent=self, icon=self.row_icons.get)
+        # Ingredient edits can make subs (in)complete; repaint the markers of
+        # the subs that reference them
+        self.ingredient_model.rowsInserted.connect(self.on_ingredients_inserted)
+        self.ingredient_model.rowsAboutToBeRemoved.connect(self.on_ingredients_removed)
+        self.ingredient_model.modelReset.connect(self.sub_model.validation_changed)
+        
         layout = QHBoxLayout(self)
         
         # Left: Tree
         left_layout = QVBoxLayout()
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabel("Subs by Category")
-        self.tree.currentItemChanged.connect(self.on_selection_changed)
+        self.tree = QTreeView()
+        self.tree.setModel(self.sub_model)
+        self.tree.setUniformRowHeights(True)
+        self.row_icons.attach(self.tree)
+        self.tree.selectionModel().currentChanged.connect(self.on_selection_changed)
         left_layout.addWidget(self.tree)
         
         btn_layout = QHBoxLayout()
@@ -550,10 +708,17 @@ class SubEditor(QWidget):
         img_layout.addWidget(self.browse_btn)
         form_layout.addLayout(img_layout, 2, 1)
         
-        form_layout.addWidget(QLabel("Category:"), 3, 0)
+        form_layout.addWidget(QLabel("Preview:"), 3, 0)
+        self.image_preview = QLabel()
+        self.image_preview.setFixedSize(128, 128)
+        self.image_preview.setStyleSheet("border: 1px solid gray;")
+        self.image_preview.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        form_layout.addWidget(self.image_preview, 3, 1)
+        
+        form_layout.addWidget(QLabel("Category:"), 4, 0)
         self.cat_combo = QComboBox()
         # We populate this dynamically
-        form_layout.addWidget(self.cat_combo, 3, 1)
+        form_layout.addWidget(self.cat_combo, 4, 1)
         
         # Ingredients Editor
         ing_group = QGroupBox("Ingredients")
@@ -577,8 +742,12 @@ class SubEditor(QWidget):
         self.avail_ings_filter.textChanged.connect(self.filter_avail_ings)
         v2.addWidget(self.avail_ings_filter)
         
-        self.avail_ings_list = QListWidget()
-        self.avail_ings_list.itemDoubleClicked.connect(self.add_ingredient_from_list)
+        self.avail_proxy = NameFilterProxy(self.ingredient_model, self)
+        self.avail_ings_list = QListView()
+        self.avail_ings_list.setModel(self.avail_proxy)
+        self.avail_ings_list.setUniformItemSizes(True)
+        self.row_icons.attach(self.avail_ings_list)
+        self.avail_ings_list.doubleClicked.connect(self.add_ingredient_from_list)
         v2.addWidget(self.avail_ings_list)
         self.add_ing_btn = QPushButton("Add <<")
         self.add_ing_btn.clicked.connect(self.add_ingredient_btn)
@@ -588,11 +757,11 @@ class SubEditor(QWidget):
         ing_layout.addLayout(v2)
         ing_group.setLayout(ing_layout)
         
-        form_layout.addWidget(ing_group, 4, 0, 1, 2)
+        form_layout.addWidget(ing_group, 5, 0, 1, 2)
         
         self.save_btn = QPushButton("Save Sub Changes")
         self.save_btn.clicked.connect(self.save_current)
-        form_layout.addWidget(self.save_btn, 5, 1)
+        form_layout.addWidget(self.save_btn, 6, 1)
         
         self.form_group.setLayout(form_layout)
         self.form_group.setEnabled(False)
@@ -610,83 +779,107 @@ class SubEditor(QWidget):
         self.refresh_tree()
         self.refresh_avail_ingredients()
         
+    @profiling.profiled("SubEditor.refresh_tree")
     def refresh_tree(self):
-        self.tree.clear()
+        # Full rebuild; edits below update single rows instead
+        self.sub_model.reset(self.subs)
+        self.refresh_categories()
+        # Sharded categories stay collapsed until opened, so only those get read
+        categories = self.sub_model.categories()
+        if all(self.sub_model.is_loaded(category) for category in categories):
+            self.tree.expandAll()
+        else:
+            for category in categories:
+                if self.sub_model.is_loaded(category):
+                    self.tree.expand(self.sub_model.category_index(category))
+
+    @profiling.profiled("SubEditor.refresh_categories")
+    def refresh_categories(self):
         self.cat_combo.clear()
-        
-        categories = sorted(self.subs.keys())
-        self.cat_combo.addItems(categories)
-        
-        for cat in categories:
-            cat_item = QTreeWidgetItem(self.tree)
-            cat_item.setText(0, cat)
-            cat_item.setData(0, Qt.ItemDataRole.UserRole, "category")
-            
-            for i, sub in enumerate(self.subs[cat]):
-                sub_item = QTreeWidgetItem(cat_item)
-                sub_item.setText(0, sub['name'])
-                sub_item.setData(0, Qt.ItemDataRole.UserRole, "sub")
-                sub_item.setData(0, Qt.ItemDataRole.UserRole + 1, i) # Index in list
-                
-                if self.is_sub_incomplete(sub):
-                    sub_item.setForeground(0, QColor("red"))
-                
-        self.tree.expandAll()
+        self.cat_combo.addItems(self.sub_model.categories())
+        if self.current_sub is not None:
+            self.cat_combo.setCurrentText(self.current_category)
 
     def is_sub_incomplete(self, sub):
-        # Check name
-        name = sub.get('name', '')
-        if not name or name == "New Sub":
-            return True
-        # Check ingredients (ignore tips as requested)
-        ingredients = sub.get('ingredients')
-        if not ingredients:
-            return True
-        
-        # Check for invalid ingredients (references to non-existent ingredients)
-        if self.all_ingredients:
-            for ing in ingredients:
-                if ing not in self.all_ingredients:
-                    return True
-
-        # Check image
-        if not sub.get('image'):
-            return True
-        return False
+        # Read from the shared validation report, which only rechecks subs
+        # that changed (see validation.py)
+        return self.dm.validator.has_errors(sub)
 
+    def sub_problems(self, sub):
+        return [message if severity == ERROR else f"{severity}: {message}"
+                for severity, message in self.dm.validator.sub_problems(sub)]
+
+    @profiling.profiled("SubEditor.refresh_avail_ingredients")
     def refresh_avail_ingredients(self):
-        self.avail_ings_list.clear()
-        search = self.avail_ings_filter.text().lower()
-        for name in sorted(self.all_ingredients.keys()):
-            if search in name.lower():
-                self.avail_ings_list.addItem(name)
+        self.ingredient_model.reset(self.all_ingredients)
+
+    def revalidate_users(self, names):
+        usage = self.dm.ingredient_usage
+        for name in names:
+            self.sub_model.subs_revalidated(usage.users(name))
 
+    def on_ingredients_inserted(self, parent, first, last):
+        self.revalidate_users(self.ingredient_model.names[first:last + 1])
+
+    def on_ingredients_removed(self, parent, first, last):
+        self.revalidate_users(self.ingredient_model.names[first:last + 1])
+
+    def ingredients_cascaded(self, affected, old_name, new_name=None):
+        # The ingredient editor renamed old_name (or deleted it when new_name
+        # is None) in the subs listed in `affected`
+        self.sub_model.subs_revalidated(affected)
+        if self.current_sub is None:
+            return
+        # Apply the same change to the open form without losing unsaved edits
+        for i in reversed(range(self.current_ings_list.count())):
+            item = self.current_ings_list.item(i)
+            if item.text() == old_name:
+                if new_name is None:
+                    self.current_ings_list.takeItem(i)
+                else:
+                    item.setText(new_name)
+        self.validate_fields()
+
+    def reload_current(self):
+        # After undo/redo: follow the open sub to wherever it now sits and
+        # re-read it, or fall back to whatever Qt selected instead
+        sub = self.current_sub
+        for category in self.sub_model.categories():
+            index = self.sub_model.index_of_sub(category, sub) if sub is not None else QModelIndex()
+            if index.isValid():
+                self.tree.setCurrentIndex(index)
+                break
+        self.on_selection_changed(self.tree.currentIndex(), QModelIndex())
+
+    @profiling.profiled("SubEditor.refresh_ui")
     def refresh_ui(self):
         self.refresh_tree()
         self.refresh_avail_ingredients()
         
     def filter_avail_ings(self):
-        self.refresh_avail_ingredients()
+        self.avail_proxy.set_filter(self.avail_ings_filter.text())
         
     def on_selection_changed(self, current, previous):
-        if not current:
+        if not current.isValid():
             self.form_group.setEnabled(False)
             self.form_group.setStyleSheet("")
+            self.current_sub = None
+            self.images.cancel(self.image_preview)
             return
             
-        item_type = current.data(0, Qt.ItemDataRole.UserRole)
+        item_type = current.data(ITEM_TYPE_ROLE)
         
         if item_type == "sub":
             self.form_group.setEnabled(True)
-            cat_item = current.parent()
-            self.current_category = cat_item.text(0)
-            self.current_index = current.data(0, Qt.ItemDataRole.UserRole + 1)
+            self.current_category = current.parent().data()
+            self.current_index = current.data(SUB_INDEX_ROLE)
             
             self.current_sub = self.subs[self.current_category][self.current_index]
             
             self.name_edit.setText(self.current_sub['name'])
             self.tip_edit.setText(self.current_sub['tip'])
             self.image_edit.setText(self.current_sub['image'])
+            self.update_preview(self.current_sub['image'])
             self.cat_combo.setCurrentText(self.current_category)
             
             self.current_ings_list.clear()
@@ -701,7 +894,32 @@ class SubEditor(QWidget):
             self.name_edit.setStyleSheet("")
             self.image_edit.setStyleSheet("")
             self.current_ings_list.setStyleSheet("")
+            self.images.cancel(self.image_preview)
+            self.image_preview.clear()
 
+    @profiling.profiled("SubEditor.update_preview")
+    def update_preview(self, image_name):
+        if not image_name:
+            self.images.cancel(self.image_preview)
+            self.image_preview.clear()
+            self.image_preview.setText("No Image")
+            return
+            
+        path = os.path.join(self.dm.images_dir, image_name)
+        # Decoded on a worker unless it's in memory; selecting something
+        # else meanwhile drops the result
+        if not self.images.preview(self.image_preview, path, 128, 128, self.show_preview):
+            self.image_preview.clear()
+            self.image_preview.setText("Loading...")
+
+    def show_preview(self, pixmap):
+        if pixmap is not None:
+            self.image_preview.setPixmap(pixmap)
+        else:
+            self.image_preview.clear()
+            self.image_preview.setText("Not Found")
+
+    @profiling.profiled("SubEditor.validate_fields")
     def validate_fields(self):
         if not self.current_sub:
              return
@@ -744,19 +962,20 @@ class SubEditor(QWidget):
     def browse_image(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Image", "", "Images (*.png *.jpg *.jpeg)")
         if file_path:
-            filename = self.dm.import_image(file_path)
-            if filename:
-                # Store relative path expected by frontend (e.g., subs/Filename.png)
-                # But frontend uses /images/ + sub.image.
-                # sub definitions usually have "subs/Beach.png" or just "Ham.png"
-                # Let's check sub_data.json: "subs/Pepe.png".
-                # So we should prepend subs/ if it's a sub image? 
-                # Or just put it in the root of images?
-                # The existing structure has a subs/ folder inside images/.
-                # My DataManager puts everything in images root.
-                # Let's simple check if we want to organize into subs/ folder.
-                # For now, let's just use the filename.
-                self.image_edit.setText(filename)
+            # Copied and recompressed on a worker; see image_imported
+            self.image_preview.clear()
+            self.image_preview.setText("Importing...")
+            self.images.import_image(self.image_preview, self.dm, file_path, "sub", self.image_imported)
+
+    def image_imported(self, filename, error):
+        # Only called if the same sub is still selected
+        if error:
+            QMessageBox.critical(self, "Error", f"Failed to import image: {error}")
+        if filename:
+            # DataManager now stores sub pictures under subs/ and returns
+            # the path relative to images/, so it can be used directly.
+            self.image_edit.setText(filename)
+        self.update_preview(self.image_edit.text())
                 
     def add_category(self):
         # Using a dialog would be better but input dialog is quick
@@ -764,19 +983,23 @@ class SubEditor(QWidget):
         name, ok = QInputDialog.getText(self, "New Category", "Category Name:")
         if ok and name:
             if name not in self.subs:
-                self.subs[name] = []
-                self.refresh_tree()
+                self.sub_model.add_category(name)
+                self.dm.record_edit(f"add category '{name}'", (
+                    "category_insert", name, len(self.subs) - 1, self.subs[name]))
+                self.dm.mark_dirty("subs")
+                self.refresh_categories()
+                self.tree.expand(self.sub_model.category_index(name))
             else:
                 QMessageBox.warning(self, "Error", "Category already exists")
 
     def add_sub(self):
-        cat_item = self.tree.currentItem()
+        cat_item = self.tree.currentIndex()
         target_cat = "Originals"
-        if cat_item:
-            if cat_item.data(0, Qt.ItemDataRole.UserRole) == "category":
-                target_cat = cat_item.text(0)
-            elif cat_item.parent():
-                target_cat = cat_item.parent().text(0)
+        if cat_item.isValid():
+            if cat_item.data(ITEM_TYPE_ROLE) == "category":
+                target_cat = cat_item.data()
+            elif cat_item.parent().isValid():
+                target_cat = cat_item.parent().data()
         
         if target_cat not in self.subs:
             # Fallback
@@ -785,55 +1008,59 @@ class SubEditor(QWidget):
             else:
                 return # Should not happen if at least one category
 
-        new_sub = {
-            "name": "New Sub",
-            "ingredients": [],
-            "tip": "",
-            "image": ""
-        }
-        self.subs[target_cat].append(new_sub)
-        self.refresh_tree()
+        new_sub = Sub(name="New Sub", ingredients=[], tip="", image="")
+        index = self.sub_model.append_sub(target_cat, new_sub)
+        self.dm.record_edit("add sub", ("sub_insert", target_cat, index.row(), new_sub))
+        self.dm.mark_dirty("subs")
+        self.tree.expand(index.parent())
         
     def delete_item(self):
-        item = self.tree.currentItem()
-        if not item:
+        item = self.tree.currentIndex()
+        if not item.isValid():
             return
             
-        item_type = item.data(0, Qt.ItemDataRole.UserRole)
-        name = item.text(0)
+        item_type = item.data(ITEM_TYPE_ROLE)
+        name = item.data()
         
         confirm = QMessageBox.question(self, "Delete", f"Delete {name}?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if confirm != QMessageBox.StandardButton.Yes:
             return
             
         if item_type == "category":
-            del self.subs[name]
+            self.dm.record_edit(f"delete category '{name}'", (
+                "category_remove", name, key_position(self.subs, name), self.subs[name]))
+            self.sub_model.remove_category(name)
+            self.refresh_categories()
         elif item_type == "sub":
-            cat = item.parent().text(0)
-            idx = item.data(0, Qt.ItemDataRole.UserRole + 1)
-            del self.subs[cat][idx]
+            cat = item.parent().data()
+            idx = item.data(SUB_INDEX_ROLE)
+            self.dm.record_edit(f"delete sub '{name}'", ("sub_remove", cat, idx, self.subs[cat][idx]))
+            self.sub_model.remove_sub(cat, idx)
             
-        self.refresh_tree()
+        self.dm.mark_dirty("subs")
         
     def add_ingredient_btn(self):
-        item = self.avail_ings_list.currentItem()
-        if item:
-            self.current_ings_list.addItem(item.text())
+        index = self.avail_ings_list.currentIndex()
+        if index.isValid():
+            self.current_ings_list.addItem(index.data())
             
-    def add_ingredient_from_list(self, item):
-        self.current_ings_list.addItem(item.text())
+    def add_ingredient_from_list(self, index):
+        self.current_ings_list.addItem(index.data())
         
     def remove_ingredient(self):
         row = self.current_ings_list.currentRow()
         if row >= 0:
             self.current_ings_list.takeItem(row)
             
+    @profiling.profiled("SubEditor.save_current")
     def save_current(self):
         if not self.current_sub:
             return
             
         new_name = self.name_edit.text()
         new_cat = self.cat_combo.currentText()
+        fields = ('name', 'tip', 'image', 'ingredients')
+        before = {field: self.current_sub[field] for field in fields}
         
         # Update details
         self.current_sub['name'] = new_name
@@ -845,36 +1072,55 @@ class SubEditor(QWidget):
             ingredients.append(self.current_ings_list.item(i).text())
         self.current_sub['ingredients'] = ingredients
         
+        before, after = changed_fields(before, {field: self.current_sub[field] for field in fields})
+        # Copies, so cascades that rewrite the live list in place can't reach them
+        for values in (before, after):
+            if 'ingredients' in values:
+                values['ingredients'] = list(values['ingredients'])
+        changes = []
+        
         # Handle Category Change
         if new_cat != self.current_category:
-            # Remove from old
-            self.subs[self.current_category].pop(self.current_index)
-            # Add to new
-            self.subs[new_cat].append(self.current_sub)
-            
-            # Refresh tree to reflect move
-            self.refresh_tree()
+            # The move is recorded first and the field edit against the new
+            # category, so the journal can replay them in order
+            changes.append(("sub_move", self.current_sub, self.current_category, self.current_index,
+                            new_cat, len(self.subs[new_cat])))
+            # Move to the end of the new category and follow it in the tree
+            index = self.sub_model.move_sub(self.current_category, self.current_index, new_cat)
+            self.tree.expand(index.parent())
+            self.tree.setCurrentIndex(index)
         else:
-            # Just update text in tree
-            self.tree.currentItem().setText(0, new_name)
+            # Just update the row (name and red marker)
+            self.sub_model.sub_changed(self.current_category, self.current_index)
+        if after:
+            changes.append(("sub_set", new_cat, self.current_sub, before, after))
+        self.dm.record_edit(f"edit sub '{new_name}'", *changes)
             
         if self.save_callback:
-            self.save_callback()
+            self.save_callback("subs")
             
         self.validate_fields()
-        self.refresh_tree() # Refresh tree to update the red text in the list
         QMessageBox.information(self, "Saved", "Changes saved to disk!")
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, server=None, base_path=None, trace_path=None):
+        # base_path: project root holding public/ (default: this checkout)
+        # trace_path: where the profiling trace goes on exit (see profiling.py)
         super().__init__()
-        self.setWindowTitle("Sub Trainer Editor")
+        self.setWindowTitle("Sub Trainer Editor" if server is None else f"Sub Trainer Editor - {server}")
         self.resize(1000, 700)
         
-        self.dm = DataManager()
+        self.dm = DataManager(base_path, server=server)
         self.subs, self.ingredients, self.tips, self.config = self.dm.load_data()
         
+        # Auto-saves go through a background writer; results come back as signals
+        self.save_signals = SaveSignals(self)
+        self.save_signals.saved.connect(self.on_saved)
+        self.save_signals.failed.connect(self.on_save_failed)
+        self.dm.start_save_queue(on_saved=self.save_signals.saved.emit,
+                                 on_error=lambda e: self.save_signals.failed.emit(str(e)))
+        
         # Main Layout
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -882,8 +1128,19 @@ class MainWindow(QMainWindow):
         
         # Tabs
         self.tabs = QTabWidget()
-        self.sub_editor = SubEditor(self.dm, self.save_data_silent)
-        self.ing_editor = IngredientEditor(self.dm, self.save_data_silent)
+        # One preview cache shared by both editors
+        self.thumbnails = ThumbnailCache(self.dm.thumbnail_cache_dir)
+        self.images = ImageLoader(self.thumbnails, self)
+        self.row_icons = InlineThumbnails(self.images, self.dm.images_dir, parent=self)
+        # Both editors list ingredients from the same model
+        self.ingredient_model = IngredientListModel(parent=self, icon=self.row_icons.get)
+        self.sub_editor = SubEditor(self.dm, self.save_data_silent, thumbnails=self.thumbnails,
+                                    ingredient_model=self.ingredient_model, images=self.images,
+                                    row_icons=self.row_icons)
+        self.ing_editor = IngredientEditor(self.dm, self.save_data_silent, thumbnails=self.thumbnails,
+                                           ingredient_model=self.ingredient_model,
+                                           cascade_callback=self.sub_editor.ingredients_cascaded,
+                                           images=self.images, row_icons=self.row_icons)
         self.tips_editor = TipsEditor(self.dm, self.save_data_silent)
         
         self.tabs.addTab(self.sub_editor, "Subs & Wraps")
@@ -903,43 +1160,375 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(action_layout)
         
+        # Ctrl+K: jump to any sub, ingredient or tip
+        self.search = CatalogSearch(self.ingredient_model, self.sub_editor.sub_model,
+                                    self.tips_editor.model, self)
+        self.command_palette = None
+        QShortcut(QKeySequence("Ctrl+K"), self, self.show_command_palette)
+        # Catalog undo/redo. Text fields keep their own Ctrl+Z while focused.
+        QShortcut(QKeySequence("Ctrl+Z"), self, self.undo)
+        QShortcut(QKeySequence("Ctrl+Y"), self, self.redo)
+        
+        # Keeps the validation report in step with edits
+        self.validation = CatalogValidation(self.dm.validator, self.ingredient_model,
+                                            self.sub_editor.sub_model, self.tips_editor.model, self)
+        
         # Initial Load
         self.sub_editor.load_data(self.subs, self.ingredients)
         self.ing_editor.load_data(self.ingredients)
         self.tips_editor.load_data(self.tips, self.config)
+        self.report_recovery()
+        
+        # Follow changes other programs make to the data files and images
+        self._resolving = False
+        self.watcher = DataWatcher(self.dm, self)
+        self.watcher.data_changed.connect(self.check_external)
+        self.watcher.images_changed.connect(self.check_images)
+        
+        # Profiling readout; Ctrl+Alt+P starts profiling, and again stops it
+        # and saves the trace
+        self.trace_path = trace_path
+        self.profile_label = QLabel()
+        self.statusBar().addPermanentWidget(self.profile_label)
+        self.profile_timer = QTimer(self)
+        self.profile_timer.timeout.connect(self.update_profile_readout)
+        QShortcut(QKeySequence("Ctrl+Alt+P"), self, self.toggle_profiling)
+        if profiling.active() is not None:
+            self.profile_timer.start(500)
+        
+    def report_recovery(self):
+        # What load_data did with the journal of a session that didn't exit cleanly
+        recovery = self.dm.recovery
+        if recovery["replayed"]:
+            self.statusBar().showMessage(f"Recovered {recovery['replayed']} unsaved edits", 5000)
+        if recovery["rejected"]:
+            QMessageBox.warning(self, "Unsaved edits not restored",
+                                "The data files changed since the last session's unsaved edits were "
+                                f"recorded, so they were not replayed.\nThey are kept in {recovery['rejected']}")
         
     def on_tab_changed(self, index):
         # Refresh the current tab to ensure data consistency (especially shared ingredients)
         current_widget = self.tabs.widget(index)
+        # The lists are live models over the shared data, so only the
+        # selected sub's ingredient markers need rechecking.
         if current_widget == self.sub_editor:
-            self.sub_editor.refresh_avail_ingredients()
             self.sub_editor.validate_fields()
-            # We don't necessarily need to refresh tree unless subs changed elsewhere, 
-            # but currently subs are only changed in SubEditor.
         elif current_widget == self.ing_editor:
+            # Sub edits may have changed how many subs use the selected ingredient
+            self.ing_editor.refresh_usage()
+
+    def show_command_palette(self):
+        if self.command_palette is None:
+            self.command_palette = CommandPalette(self.search, self)
+        if self.command_palette.exec() and self.command_palette.selected_entry:
+            self.jump_to(self.command_palette.selected_entry)
+
+    def jump_to(self, entry):
+        if entry.kind == "ingredient":
+            self.tabs.setCurrentWidget(self.ing_editor)
+            self.ing_editor.search_input.clear()
+            self.ing_editor.select_name(entry.payload)
+            self.ing_editor.list_view.scrollTo(self.ing_editor.list_view.currentIndex())
+        elif entry.kind == "sub":
+            # Subs are found by identity; their list position may have shifted
+            for category, cat_subs in self.subs.items():
+                for i, sub in enumerate(cat_subs):
+                    if sub is entry.payload:
+                        self.tabs.setCurrentWidget(self.sub_editor)
+                        index = self.sub_editor.sub_model.sub_index(category, i)
+                        self.sub_editor.tree.setCurrentIndex(index)
+                        self.sub_editor.tree.scrollTo(index)
+                        return
+        elif entry.kind == "tip":
+            for row, tip in enumerate(self.tips):
+                if tip is entry.payload:
+                    self.tabs.setCurrentWidget(self.tips_editor)
+                    self.tips_editor.select_row(row)
+                    return
+
+    def undo(self):
+        self.replay(self.dm.history.undo(), "Undid", "undo")
+
+    def redo(self):
+        self.replay(self.dm.history.redo(), "Redid", "redo")
+
+    def replay(self, step, verb, noun):
+        if step is None:
+            self.statusBar().showMessage(f"Nothing to {noun}", 3000)
+            return
+        label, changes = step
+        for change in changes:
+            self.apply_change(change)
+        self.sub_editor.reload_current()
+        self.ing_editor.reload_current()
+        self.tips_editor.reload_current()
+        # Only the files these changes touch get rewritten
+        self.save_data_silent(*touched_datasets(changes))
+        self.statusBar().showMessage(f"{verb} {label}", 3000)
+
+    def apply_change(self, change, journal=True):
+        # Replays one history record (see history.py) through the models, so
+        # the views, the usage index and the validation report follow along
+        if journal:
+            self.dm.journal_change(change)
+        kind = change[0]
+        sub_model = self.sub_editor.sub_model
+        if kind == "sub_set":
+            _, category, sub, _, after = change
+            set_fields(sub, after)
+            sub_model.sub_changed(category, sub_model.index_of_sub(category, sub).row())
+        elif kind == "sub_insert":
+            _, category, row, sub = change
+            sub_model.insert_sub(category, row, sub)
+        elif kind == "sub_remove":
+            sub_model.remove_sub(change[1], change[2])
+        elif kind == "sub_move":
+            _, sub, from_category, from_row, to_category, to_row = change
+            sub_model.remove_sub(from_category, from_row)
+            sub_model.insert_sub(to_category, to_row, sub)
+        elif kind == "category_insert":
+            _, name, position, cat_subs = change
+            sub_model.insert_category(name, cat_subs, position)
+            self.sub_editor.refresh_categories()
+            self.sub_editor.tree.expand(sub_model.category_index(name))
+        elif kind == "category_remove":
+            sub_model.remove_category(change[1])
+            self.sub_editor.refresh_categories()
+        elif kind == "ingredient_set":
+            _, name, _, after = change
+            data = self.ingredients[name].copy()
+            set_fields(data, after)
+            self.ingredients[name] = data
+            self.ingredient_model.ingredient_changed(name)
+        elif kind == "ingredient_insert":
+            _, name, position, data, cascade = change
+            insert_key(self.ingredients, name, data, position)
+            for _, sub, positions in cascade:
+                for i in positions:
+                    sub['ingredients'].insert(i, name)
+            self.ingredient_model.ingredient_added(name)
+            self.subs_rewritten(cascade)
+        elif kind == "ingredient_remove":
+            _, name, _, _, cascade = change
+            del self.ingredients[name]
+            for _, sub, positions in cascade:
+                for i in reversed(positions):
+                    del sub['ingredients'][i]
+            self.ingredient_model.ingredient_removed(name)
+            self.subs_rewritten(cascade)
+        elif kind == "ingredient_rename":
+            _, old_name, new_name, _, new_position, cascade = change
+            insert_key(self.ingredients, new_name, self.ingredients.pop(old_name), new_position)
+            for _, sub, positions in cascade:
+                for i in positions:
+                    sub['ingredients'][i] = new_name
+            self.ingredient_model.ingredient_renamed(old_name, new_name)
+            self.subs_rewritten(cascade)
+        elif kind == "tip_insert":
+            self.tips_editor.model.insert_tip(change[1], change[2])
+        elif kind == "tip_remove":
+            self.tips_editor.model.remove_tip(change[1])
+        elif kind == "tip_set":
+            self.tips_editor.model.set_tip(change[1], change[3])
+        elif kind == "config_set":
+            _, key, _, after = change
+            if after is MISSING:
+                self.config.pop(key, None)
+            else:
+                self.config[key] = after
+            self.tips_editor.default_icon_changed()
+
+    def check_external(self):
+        # A data file changed on disk: bring the changes in through the
+        # models, and ask when they collide with edits not yet saved
+        if self._resolving:
+            return
+        polled = self.dm.poll_external()
+        if polled is None:
+            # A save is renaming files into place; look once it's through
+            QTimer.singleShot(100, self.check_external)
+            return
+        changed, conflicts = polled
+        self._resolving = True
+        try:
+            for name, (data, fingerprint) in changed.items():
+                self.load_external(name, data)
+                self.dm.accept_external(name, fingerprint)
+            if conflicts:
+                # Saves of these files are held back; let the rest land first
+                self.dm.flush_saves()
+            for name, (data, fingerprint) in conflicts.items():
+                if self.resolve_conflict(name):
+                    self.load_external(name, data)
+                    self.dm.accept_external(name, fingerprint)
+                    changed[name] = (data, fingerprint)
+                else:
+                    self.dm.keep_local(name, fingerprint)
+                    self.save_data_silent(name)
+        finally:
+            self._resolving = False
+        if not changed:
+            return
+        if changed.keys() & {"subs", "ingredients"}:
+            self.sub_editor.reload_current()
+        if "ingredients" in changed:
+            self.ing_editor.reload_current()
+        if changed.keys() & {"tips", "config"}:
+            self.tips_editor.reload_current()
+        if self.dm.store is not None:
+            self.statusBar().showMessage(f"Reloaded {', '.join(changed)} (changed in {self.dm.store_name()})", 5000)
+            return
+        files = ", ".join(os.path.basename(self.dm.dataset_paths()[name]) for name in changed)
+        self.statusBar().showMessage(f"Reloaded {files} (changed on disk)", 5000)
+
+    def resolve_conflict(self, name):
+        # True to take the file from disk, False to keep the editor's version
+        filename = os.path.basename(self.dm.dataset_paths()[name])
+        answer = QMessageBox.question(
+            self, "Changed on disk",
+            f"{filename} was changed outside the editor while you had unsaved edits to it.\n\n"
+            "Reload it from disk? Your unsaved edits to it will be lost.\n"
+            "Choose No to keep your version and overwrite the file.")
+        return answer == QMessageBox.StandardButton.Yes
+
+    def load_external(self, name, data):
+        # Applies a dataset re-read from disk as row-level changes, or swaps
+        # it in whole when its keys were reordered
+        current = {"subs": self.subs, "ingredients": self.ingredients,
+                   "tips": self.tips, "config": self.config}[name]
+        changes = external_changes(name, current, data)
+        if changes is not None:
+            for change in changes:
+                self.apply_change(change, journal=False)
+            return
+        if name == "tips":
+            current[:] = data
+        else:
+            current.clear()
+            current.update(data)
+        if name == "subs":
+            self.sub_editor.refresh_tree()
+        elif name == "ingredients":
             self.ing_editor.refresh_list()
-        elif current_widget == self.tips_editor:
-            self.tips_editor.refresh_list()
+        else:
+            self.tips_editor.load_data(self.tips, self.config)
+
+    def check_images(self):
+        # Files under images/ came or went: recheck references, redraw previews
+        if not self.dm.poll_images():
+            return
+        self.row_icons.images_changed()
+        self.sub_editor.sub_model.validation_changed()
+        for editor in (self.sub_editor, self.ing_editor):
+            if editor.form_group.isEnabled():
+                editor.update_preview(editor.image_edit.text())
+
+    def subs_rewritten(self, cascade):
+        # Subs whose ingredient lists an undone/redone cascade changed
+        sub_model = self.sub_editor.sub_model
+        for category, sub, _ in cascade:
+            sub_model.sub_changed(category, sub_model.index_of_sub(category, sub).row())
 
-    def save_data_silent(self):
+    def save_data_silent(self, *datasets):
+        # Editors name the datasets they changed so only those files get rewritten
         try:
-            self.dm.save_data(self.subs, self.ingredients, self.tips, self.config)
+            self.dm.mark_dirty(*datasets)
+            self.dm.request_save(self.subs, self.ingredients, self.tips, self.config)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to auto-save: {str(e)}")
 
+    def on_saved(self, written):
+        if written and self.dm.store is not None:
+            self.statusBar().showMessage(f"Saved {', '.join(written)} to {self.dm.store_name()}", 3000)
+        elif written:
+            paths = self.dm.dataset_paths()
+            files = ", ".join(os.path.relpath(paths[name], self.dm.public_dir) for name in written)
+            self.statusBar().showMessage(f"Saved {files}", 3000)
+
+    def on_save_failed(self, message):
+        QMessageBox.critical(self, "Error", f"Failed to auto-save: {message}")
+
+    def toggle_profiling(self):
+        if profiling.active() is None:
+            profiling.enable()
+            self.profile_timer.start(500)
+            self.update_profile_readout()
+            self.statusBar().showMessage("Profiling; press Ctrl+Alt+P again to save the trace", 5000)
+            return
+        path = self.trace_path
+        if path is None:
+            path, _ = QFileDialog.getSaveFileName(self, "Save Trace", "editor_trace.json",
+                                                  "Chrome trace (*.json)")
+        self.stop_profiling(path)
+
+    def stop_profiling(self, path):
+        # Stops profiling and writes the trace to path (discarded if empty)
+        profiler = profiling.disable()
+        self.profile_timer.stop()
+        self.profile_label.clear()
+        if profiler is None or not path:
+            return
+        try:
+            profiler.export(path)
+            self.statusBar().showMessage(f"Saved trace to {path}", 5000)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to save trace: {str(e)}")
+
+    def update_profile_readout(self):
+        profiler = profiling.active()
+        if profiler is None:
+            return
+        parts = []
+        if profiler.last is not None:
+            name, duration = profiler.last
+            parts.append(f"{name} {duration / 1e6:.1f} ms")
+        memory = profiler.memory_usage()
+        if memory is not None:
+            parts.append(f"{memory[0] / 2**20:.1f} MB (peak {memory[1] / 2**20:.1f} MB)")
+        self.profile_label.setText("Profiling: " + (" | ".join(parts) or "waiting"))
+        self.profile_label.setToolTip("\n".join(f"{name}: {calls} calls, {total:.1f} ms total, {longest:.1f} ms max"
+                                                for name, calls, total, longest, _ in profiler.summary()[:15]))
+
+    def closeEvent(self, event):
+        # Make sure queued auto-saves and running imports reach the disk
+        # before exiting
+        self.images.wait()
+        self.dm.stop_save_queue()
+        if profiling.active() is not None:
+            self.stop_profiling(self.trace_path or os.path.join(self.dm.base_dir, "editor_trace.json"))
+        super().closeEvent(event)
+
     def save_data(self):
         try:
-            self.dm.save_data(self.subs, self.ingredients, self.tips, self.config)
+            # Let pending auto-saves land first so they can't overwrite this one
+            self.dm.flush_saves()
+            self.dm.save_data(self.subs, self.ingredients, self.tips, self.config, force=True)
+            if self.dm.store is not None and self.dm.remote is None:
+                # The editing service writes public/ on its own machine
+                self.dm.export_json(self.subs, self.ingredients, self.tips, self.config)
+            elif self.dm.sharded:
+                self.dm.export_subs(self.subs)
             QMessageBox.information(self, "Success", "Data saved successfully to public/ folder!")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save data: {str(e)}")
 
 def main():
-    app = QApplication(sys.argv)
+    # --server URL edits the catalog held by `python -m editor serve`;
+    # --profile times editor operations (see profiling.py)
+    parser = argparse.ArgumentParser(prog="editor/main.py")
+    parser.add_argument("--server", help="URL of an editing service to work against")
+    parser.add_argument("--profile", nargs="?", const="editor_trace.json", metavar="TRACE",
+                        help="Time editor operations and write a Chrome trace here on exit")
+    parser.add_argument("--profile-memory", action="store_true", help="Also trace memory (slower)")
+    args, qt_args = parser.parse_known_args()
+    if args.profile or args.profile_memory:
+        # Before the window, so loading the data is in the trace
+        profiling.enable(memory=args.profile_memory)
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle("Fusion")
     app.setPalette(DarkPalette())
     
-    window = MainWindow()
+    window = MainWindow(args.server, trace_path=args.profile)
     window.show()
     
     sys.exit(app.exec())
@@ -0,0 +1,602 @@
+# Qt item models over the shared subs/ingredients/tips data.
+# Views are never rebuilt: each edit emits the row-level insert/remove/
+# dataChanged notification for exactly the rows it touched, and the
+# ingredient lists are filtered by NameFilterProxy on top.
+from bisect import bisect_left, bisect_right
+
+from PyQt6.QtCore import Qt, QObject, QAbstractItemModel, QAbstractListModel, QAbstractProxyModel, QModelIndex
+from PyQt6.QtGui import QColor
+
+from history import insert_key
+from sub_shards import category_size, is_loaded
+
+# Tree item roles, as used by SubEditor
+ITEM_TYPE_ROLE = Qt.ItemDataRole.UserRole
+SUB_INDEX_ROLE = Qt.ItemDataRole.UserRole + 1
+
+
+class NameFilterProxy(QAbstractProxyModel):
+    # Case-insensitive substring filter over an IngredientListModel, matching
+    # the old `search in name.lower()`. QSortFilterProxyModel asks the model
+    # for every row's text on each keystroke (about 45 ms at 10k
+    # ingredients); this keeps the lowercased names in one newline-joined
+    # string, so a keystroke is a str.find scan plus a bisect per match.
+    # Views keep their selection across filter changes and edits through
+    # layoutChanged, as with QSortFilterProxyModel.
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.text = ""
+        # Source rows shown, ascending; None while unfiltered
+        self._rows = None
+        # Lowercased names joined by newlines, and where each one starts;
+        # rebuilt on the first filter after the source changes
+        self._joined = None
+        self._starts = None
+        self._persistent = None
+        self.setSourceModel(source)
+        source.modelAboutToBeReset.connect(self._source_about_to_be_reset)
+        source.modelReset.connect(self._source_reset)
+        source.rowsAboutToBeInserted.connect(self._rows_about_to_be_inserted)
+        source.rowsInserted.connect(self._rows_inserted)
+        source.rowsAboutToBeRemoved.connect(self._rows_about_to_be_removed)
+        source.rowsRemoved.connect(self._rows_removed)
+        source.dataChanged.connect(self._source_data_changed)
+
+    def set_filter(self, text):
+        text = text.lower()
+        if text == self.text:
+            return
+        self._begin_layout()
+        self.text = text
+        self._end_layout()
+
+    def _match(self):
+        # Source rows whose name contains self.text
+        if not self.text:
+            return None
+        if self._joined is None:
+            names = [name.lower() for name in self.sourceModel().names]
+            self._joined = "\n".join(names)
+            starts, at = [], 0
+            for name in names:
+                starts.append(at)
+                at += len(name) + 1
+            # Past the end, so the last row's search stops there
+            starts.append(at)
+            self._starts = starts
+        find, starts = self._joined.find, self._starts
+        rows = []
+        at = find(self.text)
+        while at >= 0:
+            row = bisect_right(starts, at) - 1
+            rows.append(row)
+            at = find(self.text, starts[row + 1])
+        return rows
+
+    # Keeping views' current and selected rows through a change of rows
+
+    def _name(self, index):
+        row = index.row() if self._rows is None else self._rows[index.row()]
+        return self.sourceModel().names[row]
+
+    def _begin_layout(self):
+        self.layoutAboutToBeChanged.emit()
+        self._persistent = [(index, self._name(index)) for index in self.persistentIndexList()]
+
+    def _end_layout(self):
+        self._rows = self._match()
+        source = self.sourceModel()
+        old, new = [], []
+        for index, name in self._persistent:
+            old.append(index)
+            new.append(self.mapFromSource(source.index_of(name)))
+        self._persistent = None
+        self.changePersistentIndexList(old, new)
+        self.layoutChanged.emit()
+
+    # Source notifications; passed through row for row while unfiltered
+
+    def _source_about_to_be_reset(self):
+        self.beginResetModel()
+
+    def _source_reset(self):
+        self._joined = None
+        self._rows = self._match()
+        self.endResetModel()
+
+    def _rows_about_to_be_inserted(self, parent, first, last):
+        self._joined = None
+        if self._rows is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+        else:
+            self._begin_layout()
+
+    def _rows_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.endInsertRows()
+        else:
+            self._end_layout()
+
+    def _rows_about_to_be_removed(self, parent, first, last):
+        self._joined = None
+        if self._rows is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+        else:
+            self._begin_layout()
+
+    def _rows_removed(self, parent, first, last):
+        if self._rows is None:
+            self.endRemoveRows()
+        else:
+            self._end_layout()
+
+    def _source_data_changed(self, top_left, bottom_right, roles=()):
+        # Names only change by remove and insert, so the rows shown stay put
+        first, last = top_left.row(), bottom_right.row()
+        if self._rows is not None:
+            first, last = bisect_left(self._rows, first), bisect_right(self._rows, last) - 1
+            if first > last:
+                return
+        self.dataChanged.emit(self.index(first, 0), self.index(last, 0), roles)
+
+    # QAbstractProxyModel
+
+    def mapToSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        row = index.row() if self._rows is None else self._rows[index.row()]
+        return self.sourceModel().index(row, 0)
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        row = index.row()
+        if self._rows is not None:
+            position = bisect_left(self._rows, row)
+            if position == len(self._rows) or self._rows[position] != row:
+                return QModelIndex()
+            row = position
+        return self.index(row, 0)
+
+    def index(self, row, column, parent=QModelIndex()):
+        # Called for every row a view lays out, hence no hasIndex()
+        if column != 0 or parent.isValid() or not 0 <= row < self.rowCount():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.sourceModel().rowCount() if self._rows is None else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+
+class IngredientListModel(QAbstractListModel):
+    # Sorted ingredient names. Keeps its own sorted name list so a single
+    # add/rename/delete is one bisect plus one row notification.
+    def __init__(self, ingredients=None, parent=None, icon=None):
+        super().__init__(parent)
+        self.ingredients = {}
+        self.names = []
+        # Optional image name -> QPixmap for the row icon
+        self.icon = icon
+        if ingredients is not None:
+            self.reset(ingredients)
+
+    def reset(self, ingredients):
+        self.beginResetModel()
+        self.ingredients = ingredients
+        self.names = sorted(ingredients.keys())
+        self.endResetModel()
+
+    def row_of(self, name):
+        row = bisect_left(self.names, name)
+        if row < len(self.names) and self.names[row] == name:
+            return row
+        return -1
+
+    def index_of(self, name):
+        row = self.row_of(name)
+        return self.index(row, 0) if row >= 0 else QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.UserRole):
+            return self.names[index.row()]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            data = self.ingredients.get(self.names[index.row()])
+            return (data.category or '') if data is not None else ''
+        if role == Qt.ItemDataRole.DecorationRole and self.icon is not None:
+            data = self.ingredients.get(self.names[index.row()])
+            return self.icon(data.image) if data is not None else None
+        return None
+
+    # Call these after changing the ingredients dict
+
+    def ingredient_added(self, name):
+        row = bisect_left(self.names, name)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.names.insert(row, name)
+        self.endInsertRows()
+
+    def ingredient_removed(self, name):
+        row = self.row_of(name)
+        if row < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.names[row]
+        self.endRemoveRows()
+
+    def ingredient_renamed(self, old_name, new_name):
+        self.ingredient_removed(old_name)
+        self.ingredient_added(new_name)
+
+    def ingredient_changed(self, name):
+        index = self.index_of(name)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+
+class _CategoryNode:
+    # Parent pointer for sub rows; stays valid while categories are inserted
+    # or removed around it.
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class SubTreeModel(QAbstractItemModel):
+    # Categories (sorted) with their subs (in list order) underneath. Sub rows
+    # read straight from the shared subs dict, so edits go through the
+    # mutation methods below to keep views (and the optional IngredientUsage
+    # index) in sync.
+    def __init__(self, is_incomplete=None, parent=None, usage=None, problems=None, icon=None):
+        super().__init__(parent)
+        self.subs = {}
+        self.nodes = []
+        self.is_incomplete = is_incomplete
+        # Optional sub -> [str] for the row tooltip
+        self.problems = problems
+        # Optional image name -> QPixmap for the row icon
+        self.icon = icon
+        self.usage = usage
+
+    def reset(self, subs):
+        self.beginResetModel()
+        self.subs = subs
+        self.nodes = [_CategoryNode(cat) for cat in sorted(subs.keys())]
+        if self.usage is not None:
+            self.usage.rebuild(subs)
+        self.endResetModel()
+
+    def categories(self):
+        return [node.name for node in self.nodes]
+
+    def is_loaded(self, category):
+        return is_loaded(self.subs, category)
+
+    def _category_row(self, category):
+        row = bisect_left(self.categories(), category)
+        if row < len(self.nodes) and self.nodes[row].name == category:
+            return row
+        return -1
+
+    def category_index(self, category):
+        row = self._category_row(category)
+        return self.index(row, 0) if row >= 0 else QModelIndex()
+
+    def sub_index(self, category, sub_index):
+        parent = self.category_index(category)
+        if not parent.isValid():
+            return QModelIndex()
+        return self.index(sub_index, 0, parent)
+
+    def index_of_sub(self, category, sub):
+        # Subs are matched by identity; equal-looking subs are distinct rows
+        for row, candidate in enumerate(self.subs.get(category, [])):
+            if candidate is sub:
+                return self.sub_index(category, row)
+        return QModelIndex()
+
+    # QAbstractItemModel interface
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column)
+        return self.createIndex(row, column, self.nodes[parent.row()])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer()
+        if node is None:
+            return QModelIndex()
+        return self.createIndex(self.nodes.index(node), 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.nodes)
+        if parent.internalPointer() is None:
+            return category_size(self.subs, self.nodes[parent.row()].name)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return "Subs by Category"
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if node is None:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return self.nodes[index.row()].name
+            if role == ITEM_TYPE_ROLE:
+                return "category"
+            return None
+
+        # Over sharded subs this is what loads a category, once it's expanded
+        cat_subs = self.subs[node.name]
+        if index.row() >= len(cat_subs):
+            return None
+        sub = cat_subs[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return sub.name
+        if role == ITEM_TYPE_ROLE:
+            return "sub"
+        if role == SUB_INDEX_ROLE:
+            return index.row()
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if self.is_incomplete and self.is_incomplete(sub):
+                return QColor("red")
+        if role == Qt.ItemDataRole.ToolTipRole and self.problems:
+            return "\n".join(self.problems(sub)) or None
+        if role == Qt.ItemDataRole.DecorationRole and self.icon is not None:
+            return self.icon(sub.image)
+        return None
+
+    # Mutations
+
+    def add_category(self, category):
+        self.insert_category(category, [], len(self.subs))
+
+    def insert_category(self, category, cat_subs, position):
+        # Puts a category (and its subs) back at `position` in the subs dict,
+        # so the file keeps its order when a delete is undone
+        row = bisect_left(self.categories(), category)
+        self.beginInsertRows(QModelIndex(), row, row)
+        insert_key(self.subs, category, cat_subs, position)
+        self.nodes.insert(row, _CategoryNode(category))
+        if self.usage is not None:
+            for sub in cat_subs:
+                self.usage.add_sub(category, sub)
+        self.endInsertRows()
+
+    def remove_category(self, category):
+        row = self._category_row(category)
+        if row < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        if self.usage is not None:
+            for sub in self.subs[category]:
+                self.usage.remove_sub(sub)
+        del self.subs[category]
+        del self.nodes[row]
+        self.endRemoveRows()
+
+    def append_sub(self, category, sub):
+        return self.insert_sub(category, len(self.subs[category]), sub)
+
+    def insert_sub(self, category, row, sub):
+        parent = self.category_index(category)
+        self.beginInsertRows(parent, row, row)
+        self.subs[category].insert(row, sub)
+        if self.usage is not None:
+            self.usage.add_sub(category, sub)
+        self.endInsertRows()
+        return self.index(row, 0, parent)
+
+    def remove_sub(self, category, sub_index):
+        parent = self.category_index(category)
+        self.beginRemoveRows(parent, sub_index, sub_index)
+        sub = self.subs[category].pop(sub_index)
+        if self.usage is not None:
+            self.usage.remove_sub(sub)
+        self.endRemoveRows()
+        return sub
+
+    def move_sub(self, category, sub_index, new_category):
+        # Moves to the end of new_category, like the editor always did
+        sub = self.remove_sub(category, sub_index)
+        return self.append_sub(new_category, sub)
+
+    def sub_changed(self, category, sub_index):
+        index = self.sub_index(category, sub_index)
+        if index.isValid():
+            if self.usage is not None:
+                self.usage.update_sub(category, self.subs[category][sub_index])
+            self.dataChanged.emit(index, index)
+
+    def subs_revalidated(self, located):
+        # Repaints the red marker of just these subs, given as [(category, sub)]
+        for category, sub in located:
+            index = self.index_of_sub(category, sub)
+            if index.isValid():
+                self.dataChanged.emit(index, index, [Qt.ItemDataRole.ForegroundRole])
+
+    def validation_changed(self):
+        # After a full ingredient reload any sub's red marker may flip;
+        # repaint sub rows without rebuilding them. Sharded categories not
+        # loaded yet have nothing on screen.
+        for row, node in enumerate(self.nodes):
+            count = category_size(self.subs, node.name) if self.is_loaded(node.name) else 0
+            if count:
+                parent = self.index(row, 0)
+                self.dataChanged.emit(self.index(0, 0, parent), self.index(count - 1, 0, parent),
+                                      [Qt.ItemDataRole.ForegroundRole])
+
+
+class TipListModel(QAbstractListModel):
+    # Site tips shown as "<icon> <text>", with the config's default icon for
+    # tips that don't set one.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tips = []
+        self.config = {}
+
+    def reset(self, tips, config):
+        self.beginResetModel()
+        self.tips = tips
+        self.config = config
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.tips)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        tip = self.tips[index.row()]
+        text = tip.text or ""
+        icon = tip.icon
+
+        # Truncate long tips for display
+        display_text = text if len(text) < 50 else text[:47] + "..."
+
+        if not icon:
+            icon = self.config.get("tip_icon", "💡")
+        return f"{icon} {display_text}"
+
+    def append_tip(self, tip):
+        self.insert_tip(len(self.tips), tip)
+
+    def insert_tip(self, row, tip):
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.tips.insert(row, tip)
+        self.endInsertRows()
+
+    def remove_tip(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.tips.pop(row)
+        self.endRemoveRows()
+
+    def set_tip(self, row, tip):
+        self.tips[row] = tip
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, index)
+
+    def icons_changed(self):
+        # The default icon shows on every tip without its own icon
+        if self.tips:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.tips) - 1, 0))
+
+
+class CatalogValidation(QObject):
+    # Forwards the models' row notifications to a validation.CatalogValidator
+    # so it only rechecks what changed. Must be connected before edits start.
+    def __init__(self, validator, ingredient_model, sub_model, tip_model, parent=None):
+        super().__init__(parent)
+        self.validator = validator
+        self.ingredient_model = ingredient_model
+        self.sub_model = sub_model
+        self.tip_model = tip_model
+
+        ingredient_model.modelReset.connect(self.on_ingredients_reset)
+        ingredient_model.rowsInserted.connect(self.on_ingredients_inserted)
+        ingredient_model.rowsAboutToBeRemoved.connect(self.on_ingredients_removed)
+        ingredient_model.dataChanged.connect(self.on_ingredients_changed)
+
+        sub_model.modelReset.connect(self.on_subs_reset)
+        sub_model.rowsInserted.connect(self.on_subs_inserted)
+        sub_model.rowsAboutToBeRemoved.connect(self.on_subs_removed)
+        sub_model.rowsRemoved.connect(self.on_subs_rows_removed)
+        sub_model.dataChanged.connect(self.on_subs_changed)
+
+        tip_model.modelReset.connect(self.on_tips_reset)
+        tip_model.rowsInserted.connect(validator.tips_changed)
+        tip_model.rowsRemoved.connect(validator.tips_changed)
+        tip_model.dataChanged.connect(validator.tips_changed)
+
+    # Ingredients
+
+    def on_ingredients_reset(self):
+        self.validator.set_ingredients(self.ingredient_model.ingredients)
+
+    def on_ingredients_inserted(self, parent, first, last):
+        for name in self.ingredient_model.names[first:last + 1]:
+            self.validator.ingredient_changed(name)
+
+    def on_ingredients_removed(self, parent, first, last):
+        for name in self.ingredient_model.names[first:last + 1]:
+            self.validator.ingredient_removed(name)
+
+    def on_ingredients_changed(self, top_left, bottom_right, roles=()):
+        for name in self.ingredient_model.names[top_left.row():bottom_right.row() + 1]:
+            self.validator.ingredient_changed(name)
+
+    # Subs. ForegroundRole-only changes still count: subs_revalidated sends
+    # them when an ingredient cascade rewrote those subs.
+
+    def on_subs_reset(self):
+        self.validator.set_subs(self.sub_model.subs)
+
+    def _sub_rows(self, parent, first, last):
+        category = parent.data()
+        return category, self.sub_model.subs.get(category, [])[first:last + 1]
+
+    def on_subs_inserted(self, parent, first, last):
+        if not parent.isValid():
+            # An undone category delete brings its subs back with it
+            for row in range(first, last + 1):
+                category = self.sub_model.nodes[row].name
+                for sub in self.sub_model.subs.get(category, []):
+                    self.validator.sub_changed(category, sub)
+            self.validator.categories_changed()
+            return
+        category, subs = self._sub_rows(parent, first, last)
+        for sub in subs:
+            self.validator.sub_changed(category, sub)
+
+    def on_subs_removed(self, parent, first, last):
+        if parent.isValid():
+            _, subs = self._sub_rows(parent, first, last)
+        else:
+            # The validator only knows the subs of loaded categories
+            categories = [self.sub_model.nodes[row].name for row in range(first, last + 1)]
+            subs = [sub for category in categories if self.sub_model.is_loaded(category)
+                    for sub in self.sub_model.subs.get(category, [])]
+        for sub in subs:
+            self.validator.sub_removed(sub)
+
+    def on_subs_rows_removed(self, parent, first, last):
+        if not parent.isValid():
+            self.validator.categories_changed()
+
+    def on_subs_changed(self, top_left, bottom_right, roles=()):
+        parent = top_left.parent()
+        if parent.isValid():
+            category, subs = self._sub_rows(parent, top_left.row(), bottom_right.row())
+            for sub in subs:
+                self.validator.sub_changed(category, sub)
+
+    # Tips and config
+
+    def on_tips_reset(self):
+        self.validator.set_tips(self.tip_model.tips)
+        self.validator.set_config(self.tip_model.config)
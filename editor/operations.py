@@ -0,0 +1,241 @@
+# Catalog edits as plain data, shared by the command-line interface and
+# anything else that needs to script changes without the Qt editor.
+#
+# An operation is a dict such as
+#   {"op": "add", "kind": "ingredient", "name": "Bacon", "category": "Meats"}
+#   {"op": "rename", "kind": "sub", "category": "Originals", "name": "#1 The Pepe", "new_name": "#1 Pepe"}
+#   {"op": "delete", "kind": "tip", "index": 3}
+# apply_operation mutates subs/ingredients/tips in place and returns the set of
+# dataset names (see data_manager.DATASETS) it changed. Renaming or deleting an
+# ingredient also rewrites the subs that list it.
+from catalog import Ingredient, Sub, Tip
+from history import rename_key
+from ingredient_usage import IngredientUsage
+from sub_shards import is_loaded
+
+OPS = ("add", "update", "rename", "delete")
+KINDS = ("category", "sub", "ingredient", "tip")
+
+
+class OperationError(ValueError):
+    pass
+
+
+def _require(op, key):
+    if key not in op or op[key] is None:
+        raise OperationError(f"'{op.get('op')} {op.get('kind')}' needs '{key}'")
+    return op[key]
+
+
+def find_sub(subs, category, name):
+    if category not in subs:
+        raise OperationError(f"Unknown category '{category}'")
+    for i, sub in enumerate(subs[category]):
+        if sub.get('name') == name:
+            return i
+    raise OperationError(f"No sub named '{name}' in '{category}'")
+
+
+def _tip_index(tips, op):
+    index = _require(op, "index")
+    if not isinstance(index, int) or not 0 <= index < len(tips):
+        raise OperationError(f"Tip index out of range: {index}")
+    return index
+
+
+# Categories
+
+def _add_category(subs, ingredients, tips, op, usage):
+    name = _require(op, "name")
+    if name in subs:
+        raise OperationError(f"Category '{name}' already exists")
+    subs[name] = []
+    return {"subs"}
+
+
+def _rename_category(subs, ingredients, tips, op, usage):
+    name, new_name = _require(op, "name"), _require(op, "new_name")
+    if name not in subs:
+        raise OperationError(f"Unknown category '{name}'")
+    if new_name in subs:
+        raise OperationError(f"Category '{new_name}' already exists")
+    rename_key(subs, name, new_name)
+    if usage is not None and is_loaded(subs, new_name):
+        usage.set_category(new_name, subs[new_name])
+    return {"subs"}
+
+
+def _delete_category(subs, ingredients, tips, op, usage):
+    name = _require(op, "name")
+    if name not in subs:
+        raise OperationError(f"Unknown category '{name}'")
+    if usage is not None and is_loaded(subs, name):
+        for sub in subs[name]:
+            usage.remove_sub(sub)
+    del subs[name]
+    return {"subs"}
+
+
+# Subs
+
+def _add_sub(subs, ingredients, tips, op, usage):
+    category = _require(op, "category")
+    if category not in subs:
+        if not op.get("create_category", True):
+            raise OperationError(f"Unknown category '{category}'")
+        subs[category] = []
+    sub = Sub(name=_require(op, "name"), ingredients=list(op.get("ingredients", [])),
+              tip=op.get("tip", ""), image=op.get("image", ""))
+    subs[category].append(sub)
+    if usage is not None:
+        usage.add_sub(category, sub)
+    return {"subs"}
+
+
+def _update_sub(subs, ingredients, tips, op, usage):
+    category = _require(op, "category")
+    index = find_sub(subs, category, _require(op, "name"))
+    sub = subs[category][index]
+    for field in ("tip", "image"):
+        if field in op:
+            sub[field] = op[field]
+    if "ingredients" in op:
+        sub["ingredients"] = list(op["ingredients"])
+    if "new_name" in op:
+        sub["name"] = op["new_name"]
+    new_category = op.get("new_category")
+    if new_category and new_category != category:
+        if new_category not in subs:
+            raise OperationError(f"Unknown category '{new_category}'")
+        subs[new_category].append(subs[category].pop(index))
+        category = new_category
+    if usage is not None:
+        usage.update_sub(category, sub)
+    return {"subs"}
+
+
+def _rename_sub(subs, ingredients, tips, op, usage):
+    category = _require(op, "category")
+    index = find_sub(subs, category, _require(op, "name"))
+    subs[category][index]["name"] = _require(op, "new_name")
+    return {"subs"}
+
+
+def _delete_sub(subs, ingredients, tips, op, usage):
+    category = _require(op, "category")
+    sub = subs[category].pop(find_sub(subs, category, _require(op, "name")))
+    if usage is not None:
+        usage.remove_sub(sub)
+    return {"subs"}
+
+
+# Ingredients
+
+def _usage_of(subs):
+    # One-off index for callers that don't keep one (a single catalog scan)
+    usage = IngredientUsage()
+    usage.rebuild(subs)
+    return usage
+
+
+def _add_ingredient(subs, ingredients, tips, op, usage):
+    name = _require(op, "name")
+    if name in ingredients:
+        raise OperationError(f"Ingredient '{name}' already exists")
+    ingredients[name] = Ingredient(category=op.get("category", "Meats"), image=op.get("image", ""),
+                                   is_lto=bool(op.get("is_lto", False)))
+    return {"ingredients"}
+
+
+def _update_ingredient(subs, ingredients, tips, op, usage):
+    name = _require(op, "name")
+    if name not in ingredients:
+        raise OperationError(f"Unknown ingredient '{name}'")
+    for field in ("category", "image"):
+        if field in op:
+            ingredients[name][field] = op[field]
+    if "is_lto" in op:
+        ingredients[name]["is_lto"] = bool(op["is_lto"])
+    return {"ingredients"}
+
+
+def _rename_ingredient(subs, ingredients, tips, op, usage):
+    name, new_name = _require(op, "name"), _require(op, "new_name")
+    if name not in ingredients:
+        raise OperationError(f"Unknown ingredient '{name}'")
+    if new_name in ingredients:
+        raise OperationError(f"Ingredient '{new_name}' already exists")
+    ingredients[new_name] = ingredients.pop(name)
+    if (usage or _usage_of(subs)).rename_ingredient(name, new_name):
+        return {"ingredients", "subs"}
+    return {"ingredients"}
+
+
+def _delete_ingredient(subs, ingredients, tips, op, usage):
+    name = _require(op, "name")
+    if name not in ingredients:
+        raise OperationError(f"Unknown ingredient '{name}'")
+    del ingredients[name]
+    if (usage or _usage_of(subs)).remove_ingredient(name):
+        return {"ingredients", "subs"}
+    return {"ingredients"}
+
+
+# Tips
+
+def _add_tip(subs, ingredients, tips, op, usage):
+    tips.append(Tip(text=_require(op, "text"), icon=op.get("icon", "")))
+    return {"tips"}
+
+
+def _update_tip(subs, ingredients, tips, op, usage):
+    index = _tip_index(tips, op)
+    tip = tips[index].copy()
+    for field in ("text", "icon"):
+        if field in op:
+            tip[field] = op[field]
+    tips[index] = tip
+    return {"tips"}
+
+
+def _rename_tip(subs, ingredients, tips, op, usage):
+    # A tip has no name; "renaming" it replaces its text
+    index = _tip_index(tips, op)
+    tip = tips[index].copy()
+    tip["text"] = _require(op, "text")
+    tips[index] = tip
+    return {"tips"}
+
+
+def _delete_tip(subs, ingredients, tips, op, usage):
+    tips.pop(_tip_index(tips, op))
+    return {"tips"}
+
+
+_HANDLERS = {
+    ("add", "category"): _add_category,
+    ("rename", "category"): _rename_category,
+    ("delete", "category"): _delete_category,
+    ("add", "sub"): _add_sub,
+    ("update", "sub"): _update_sub,
+    ("rename", "sub"): _rename_sub,
+    ("delete", "sub"): _delete_sub,
+    ("add", "ingredient"): _add_ingredient,
+    ("update", "ingredient"): _update_ingredient,
+    ("rename", "ingredient"): _rename_ingredient,
+    ("delete", "ingredient"): _delete_ingredient,
+    ("add", "tip"): _add_tip,
+    ("update", "tip"): _update_tip,
+    ("rename", "tip"): _rename_tip,
+    ("delete", "tip"): _delete_tip,
+}
+
+
+def apply_operation(subs, ingredients, tips, op, usage=None):
+    # usage: the IngredientUsage indexing `subs`, kept up to date if given
+    if not isinstance(op, dict):
+        raise OperationError(f"Operation must be an object, got {type(op).__name__}")
+    handler = _HANDLERS.get((op.get("op"), op.get("kind")))
+    if handler is None:
+        raise OperationError(f"Unknown operation '{op.get('op')} {op.get('kind')}'")
+    return handler(subs, ingredients, tips, op, usage)
@@ -0,0 +1,197 @@
+# Opt-in timing of editor operations: data file I/O, view refreshes, image
+# decodes and saves. Off unless enable() is called (main.py --profile, the
+# Ctrl+Alt+P shortcut, or `python -m editor --profile`); while off, span()
+# hands back a shared no-op and @profiled adds one global lookup per call.
+#
+# Timings accumulate as Chrome trace events (open the export in
+# chrome://tracing or https://ui.perfetto.dev) plus per-name totals for the
+# editor's status bar. With memory=True, tracemalloc runs too: each event
+# carries the traced size, and the export ends with the top allocation sites.
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+# Events kept for export; the oldest are dropped beyond this
+MAX_EVENTS = 200_000
+
+
+class Profiler:
+    def __init__(self, memory=False, max_events=MAX_EVENTS):
+        self.memory = memory
+        self.owns_tracing = False
+        self.events = deque(maxlen=max_events)
+        # name -> [calls, total ns, max ns, last ns]
+        self.totals = {}
+        self.last = None
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._threads = {}
+        self._allocations = []
+
+    def record(self, name, start, end, args=None):
+        # A finished span; start and end are time.perf_counter_ns() values
+        duration = end - start
+        event = {"name": name, "ph": "X", "ts": (start - self._origin) / 1000, "dur": duration / 1000,
+                 "pid": self._pid, "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        if self.memory and tracemalloc.is_tracing():
+            event.setdefault("args", {})["traced_kb"] = tracemalloc.get_traced_memory()[0] // 1024
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(event["tid"], threading.current_thread().name)
+            totals = self.totals.get(name)
+            if totals is None:
+                self.totals[name] = [1, duration, duration, duration]
+            else:
+                totals[0] += 1
+                totals[1] += duration
+                totals[2] = max(totals[2], duration)
+                totals[3] = duration
+            self.last = (name, duration)
+
+    def summary(self):
+        # [(name, calls, total ms, max ms, last ms)], slowest total first
+        with self._lock:
+            rows = [(name, calls, total / 1e6, longest / 1e6, last / 1e6)
+                    for name, (calls, total, longest, last) in self.totals.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def memory_usage(self):
+        # (current, peak) bytes traced, or None without memory=True
+        if not (self.memory and tracemalloc.is_tracing()):
+            return None
+        return tracemalloc.get_traced_memory()
+
+    def top_allocations(self, limit=25):
+        # The biggest allocation sites by line, now or (once stopped) when
+        # profiling stopped
+        if not (self.memory and tracemalloc.is_tracing()):
+            return self._allocations[:limit]
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+        return [{"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "kb": stat.size // 1024, "blocks": stat.count} for stat in stats]
+
+    def trace(self):
+        # Chrome trace-event JSON object format
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                    for tid, name in threads.items()]
+        trace = {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+        if self.memory:
+            trace["otherData"] = {"top_allocations": self.top_allocations()}
+        return trace
+
+    def export(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.trace(), f, separators=(',', ':'))
+        return path
+
+
+_active = None
+
+
+def enable(memory=False):
+    # Starts a fresh profile (replacing any running one) and returns it
+    global _active
+    disable()
+    profiler = Profiler(memory)
+    if memory and not tracemalloc.is_tracing():
+        # Left running on disable if someone else started it
+        tracemalloc.start()
+        profiler.owns_tracing = True
+    _active = profiler
+    return profiler
+
+
+def disable():
+    # Stops recording; returns the profile that was running, if any
+    global _active
+    profiler, _active = _active, None
+    if profiler is not None and profiler.memory:
+        profiler._allocations = profiler.top_allocations()
+    if profiler is not None and profiler.owns_tracing:
+        tracemalloc.stop()
+    return profiler
+
+
+def active():
+    return _active
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+    def note(self, **args):
+        # Adds details only known once the work is done (bytes written, ...)
+        self.args = dict(self.args or {}, **args)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def note(self, **args):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **args):
+    # with span("parse", file="sub_data.json") as s: ...; s.note(bytes=n)
+    profiler = _active
+    if profiler is None:
+        return _NO_SPAN
+    return _Span(profiler, name, args or None)
+
+
+def profiled(name):
+    # Decorator timing every call under name while profiling is on
+    def decorate(func):
+        # Qt calls a slot with all of a signal's arguments unless the slot
+        # itself refuses them, which this wrapper never would; extra ones
+        # are dropped here instead
+        code = func.__code__
+        limit = None if code.co_flags & inspect.CO_VARARGS else code.co_argcount
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if limit is not None and len(args) > limit:
+                args = args[:limit]
+            profiler = _active
+            if profiler is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(name, start, time.perf_counter_ns())
+        return timed
+    return decorate
@@ -0,0 +1,330 @@
+# Production publish for the built trainer (python -m editor publish-site).
+#
+# Runs over the site vite builds (dist/ by default):
+#   1. Copies every image the catalog references to assets/images/ under a
+#      content-hashed name, then writes the data bundle (with image paths
+#      pointing at those copies) to assets/data/ and data/manifest.json.
+#   2. Writes .gz and, with the optional brotli module, .br siblings for
+#      text assets, in parallel, skipping files whose hash hasn't changed.
+#   3. Regenerates the cache rules in netlify.toml, vercel.json, web.config
+#      and .htaccess: everything under /assets/ is content-hashed and cached
+#      as immutable, everything else (index.html, the manifest) revalidates.
+# Never imports Qt, like the rest of the CLI.
+import gzip
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+from image_store import hash_file
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+TEXT_EXTENSIONS = {".html", ".css", ".js", ".mjs", ".json", ".svg", ".txt", ".xml", ".webmanifest", ".map"}
+# Anything smaller fits in a packet either way
+MIN_COMPRESS_BYTES = 1024
+HASH_LENGTH = 10
+
+BEGIN = "BEGIN publish-site cache rules"
+END = "END publish-site cache rules"
+
+
+def brotli_available():
+    return find_spec("brotli") is not None
+
+
+class PublishState:
+    # Remembers file hashes (by size and mtime) and which hash each text
+    # asset was last compressed from, in .cache/publish_state.json
+    def __init__(self, path):
+        self.path = path
+        self.hashes = {}
+        self.compressed = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.hashes = data.get("hashes", {})
+            self.compressed = data.get("compressed", {})
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    def hash(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        cached = self.hashes.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hash_file(path)
+        self.hashes[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"hashes": self.hashes, "compressed": self.compressed}, f)
+
+
+# 1. Fingerprinting
+
+def _hashed_name(relpath, digest):
+    stem, ext = os.path.splitext(relpath)
+    if stem.endswith("." + digest[:HASH_LENGTH]):
+        return relpath  # Already content addressed by ImageStore
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def fingerprint_images(dm, subs, ingredients, site_dir, state):
+    # Returns {image path as used in the data: "/assets/images/<hashed path>"}
+    refs = {data.get('image') for data in ingredients.values()}
+    refs.update(sub.get('image') for cat_subs in subs.values() for sub in cat_subs)
+    mapping = {}
+    for relpath in sorted(ref for ref in refs if ref):
+        source = os.path.join(dm.images_dir, relpath)
+        if not os.path.isfile(source):
+            continue  # Reported by validation
+        hashed = _hashed_name(relpath, state.hash(source))
+        dest = os.path.join(site_dir, 'assets', 'images', hashed)
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy2(source, dest)
+        mapping[relpath] = f"/assets/images/{hashed}"
+    return mapping
+
+
+def write_site_bundle(dm, subs, ingredients, tips, config, mapping, site_dir):
+    # Writes assets/data/bundle.<hash>.json with image paths rewritten to the
+    # fingerprinted copies, and data/manifest.json pointing at it
+    def image(path):
+        return mapping.get(path, path)
+
+    bundle = {
+        "subs": {cat: [dict(sub, image=image(sub.get('image', ''))) for sub in cat_subs]
+                 for cat, cat_subs in subs.items()},
+        "ingredients": {name: dict(data, image=image(data.get('image', '')))
+                        for name, data in ingredients.items()},
+        "tips": tips,
+        "config": config,
+    }
+    data, digest = dm.encode_bundle(bundle)
+    relpath = f"assets/data/bundle.{digest[:12]}.json"
+    bundle_path = os.path.join(site_dir, relpath)
+    if not os.path.exists(bundle_path):
+        os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+        with open(bundle_path, 'wb') as f:
+            f.write(data)
+    manifest_path = os.path.join(site_dir, 'data', 'manifest.json')
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": 1, "bundle": "/" + relpath, "hash": digest, "bytes": len(data)}, f)
+    return relpath
+
+
+# 2. Precompression
+
+def _write_bytes(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _compress_file(path, use_brotli):
+    # zlib and brotli release the GIL, so threads compress in parallel
+    with open(path, 'rb') as f:
+        data = f.read()
+    compressed = gzip.compress(data, 9, mtime=0)
+    _write_bytes(path + '.gz', compressed)
+    sizes = {"gz": len(compressed)}
+    if use_brotli:
+        import brotli
+        compressed = brotli.compress(data, quality=11)
+        _write_bytes(path + '.br', compressed)
+        sizes["br"] = len(compressed)
+    return sizes
+
+
+def compress_site(site_dir, state, workers=None, use_brotli=None):
+    # Returns (files compressed, files skipped as unchanged)
+    if use_brotli is None:
+        use_brotli = brotli_available()
+    jobs = []
+    skipped = 0
+    for root, _, files in os.walk(site_dir):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in TEXT_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) < MIN_COMPRESS_BYTES:
+                continue
+            key = os.path.relpath(path, site_dir).replace('\\', '/')
+            digest = state.hash(path)
+            outputs = [path + '.gz'] + ([path + '.br'] if use_brotli else [])
+            if state.compressed.get(key) == digest and all(os.path.exists(out) for out in outputs):
+                skipped += 1
+                continue
+            jobs.append((key, path, digest))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(key, digest, pool.submit(_compress_file, path, use_brotli)) for key, path, digest in jobs]
+        for key, digest, future in futures:
+            future.result()
+            state.compressed[key] = digest
+    return len(jobs), skipped
+
+
+# 3. Host configs. Each file gets a marked section that is replaced on every
+# run; everything outside the markers is left alone.
+
+def _replace_section(text, section, comment, anchor=None, name=None):
+    # comment: (prefix, suffix) for the marker lines, name tells apart
+    # several sections in one file. Without an existing section the new one
+    # goes before `anchor`, or at the end.
+    prefix, suffix = comment
+    label = f" ({name})" if name else ""
+    begin, end = f"{prefix}{BEGIN}{label}{suffix}", f"{prefix}{END}{label}{suffix}"
+    block = f"{begin}\n{section.rstrip()}\n{end}"
+    pattern = re.compile(rf"{re.escape(begin)}.*?{re.escape(end)}", re.DOTALL)
+    if pattern.search(text):
+        return pattern.sub(lambda m: block, text, count=1)
+    if anchor and anchor in text:
+        return text.replace(anchor, block + "\n" + anchor, 1)
+    return text.rstrip("\n") + "\n\n" + block + "\n"
+
+
+def _indent(text, spaces):
+    return "\n".join(" " * spaces + line if line else line for line in text.splitlines())
+
+
+NETLIFY_SECTION = f"""\
+# Content-hashed files never change; everything else keeps Netlify's
+# default must-revalidate caching. Netlify compresses responses itself.
+[[headers]]
+  for = "/assets/*"
+  [headers.values]
+    Cache-Control = "{IMMUTABLE}"
+"""
+
+HTACCESS_SECTION = f"""\
+# Content-hashed files never change; everything else revalidates
+<IfModule mod_headers.c>
+    <If "%{{REQUEST_URI}} =~ m#^/assets/#">
+        Header set Cache-Control "{IMMUTABLE}"
+    </If>
+    <Else>
+        Header set Cache-Control "{REVALIDATE}"
+    </Else>
+</IfModule>
+
+# Serve the .br/.gz siblings written by publish-site when the client accepts them
+<IfModule mod_rewrite.c>
+    RewriteCond "%{{HTTP:Accept-Encoding}}" "br"
+    RewriteCond "%{{REQUEST_FILENAME}}\\.br" "-s"
+    RewriteRule "^(.*)\\.(js|css|html|json|svg)$" "$1\\.$2\\.br" [QSA]
+    RewriteCond "%{{HTTP:Accept-Encoding}}" "gzip"
+    RewriteCond "%{{REQUEST_FILENAME}}\\.gz" "-s"
+    RewriteRule "^(.*)\\.(js|css|html|json|svg)$" "$1\\.$2\\.gz" [QSA]
+
+    # Keep the original content types and don't compress twice
+    RewriteRule "\\.js\\.(br|gz)$" "-" [T=text/javascript,E=no-gzip:1,E=no-brotli:1]
+    RewriteRule "\\.css\\.(br|gz)$" "-" [T=text/css,E=no-gzip:1,E=no-brotli:1]
+    RewriteRule "\\.html\\.(br|gz)$" "-" [T=text/html,E=no-gzip:1,E=no-brotli:1]
+    RewriteRule "\\.json\\.(br|gz)$" "-" [T=application/json,E=no-gzip:1,E=no-brotli:1]
+    RewriteRule "\\.svg\\.(br|gz)$" "-" [T=image/svg+xml,E=no-gzip:1,E=no-brotli:1]
+</IfModule>
+<IfModule mod_headers.c>
+    <FilesMatch "\\.(js|css|html|json|svg)\\.br$">
+        Header append Content-Encoding br
+        Header append Vary Accept-Encoding
+    </FilesMatch>
+    <FilesMatch "\\.(js|css|html|json|svg)\\.gz$">
+        Header append Content-Encoding gzip
+        Header append Vary Accept-Encoding
+    </FilesMatch>
+</IfModule>
+"""
+
+# IIS compresses static files itself (and caches the result), so only the
+# cache headers are needed: revalidate by default, immutable under /assets/
+WEBCONFIG_SERVER_SECTION = """\
+<staticContent>
+  <clientCache cacheControlMode="DisableCache" />
+</staticContent>
+<urlCompression doStaticCompression="true" doDynamicCompression="false" />
+"""
+
+WEBCONFIG_LOCATION_SECTION = """\
+<location path="assets">
+  <system.webServer>
+    <staticContent>
+      <clientCache cacheControlMode="UseMaxAge" cacheControlMaxAge="365.00:00:00" cacheControlCustom="public, immutable" />
+    </staticContent>
+  </system.webServer>
+</location>
+"""
+
+
+def _update_text(path, update):
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    new_text = update(text)
+    if new_text == text:
+        return False
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(new_text)
+    return True
+
+
+def _update_vercel(text):
+    config = json.loads(text)
+    rules = [{"source": "/assets/(.*)", "headers": [{"key": "Cache-Control", "value": IMMUTABLE}]}]
+    sources = {rule["source"] for rule in rules}
+    headers = [rule for rule in config.get("headers", []) if rule.get("source") not in sources]
+    config["headers"] = headers + rules
+    return json.dumps(config, indent=2) + "\n"
+
+
+def _update_webconfig(text):
+    # <location> must sit directly under <configuration>
+    text = _replace_section(text, _indent(WEBCONFIG_SERVER_SECTION, 4), ("    <!-- ", " -->"),
+                            anchor="  </system.webServer>\n</configuration>", name="system.webServer")
+    return _replace_section(text, _indent(WEBCONFIG_LOCATION_SECTION, 2), ("  <!-- ", " -->"),
+                            anchor="</configuration>", name="location")
+
+
+def update_host_configs(base_dir):
+    # Returns the config files that changed. Missing files are skipped.
+    updates = {
+        "netlify.toml": lambda text: _replace_section(text, NETLIFY_SECTION, ("# ", "")),
+        "vercel.json": _update_vercel,
+        "web.config": _update_webconfig,
+        ".htaccess": lambda text: _replace_section(text, HTACCESS_SECTION, ("# ", "")),
+    }
+    changed = []
+    for name, update in updates.items():
+        path = os.path.join(base_dir, name)
+        if os.path.exists(path) and _update_text(path, update):
+            changed.append(name)
+    return changed
+
+
+def publish_site(dm, subs, ingredients, tips, config, site_dir=None, workers=None,
+                 use_brotli=None, host_configs=True):
+    # Returns a summary dict for the CLI
+    site_dir = site_dir or dm.site_dir
+    if not os.path.isdir(site_dir):
+        raise RuntimeError(f"{site_dir} not found; build the trainer first (npm run build)")
+    state = PublishState(os.path.join(dm.cache_dir, 'publish_state.json'))
+    mapping = fingerprint_images(dm, subs, ingredients, site_dir, state)
+    bundle = write_site_bundle(dm, subs, ingredients, tips, config, mapping, site_dir)
+    compressed, skipped = compress_site(site_dir, state, workers, use_brotli)
+    state.save()
+    return {
+        "images": len(mapping),
+        "bundle": bundle,
+        "compressed": compressed,
+        "unchanged": skipped,
+        "host_configs": update_host_configs(dm.base_dir) if host_configs else [],
+    }
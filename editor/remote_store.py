@@ -0,0 +1,93 @@
+# Client side of the editing service (see service.py): the same interface as
+# SqliteStore, so DataManager edits a catalog held by `python -m editor serve`
+# exactly as it edits catalog.db. Editor edits go out as journal records in
+# a PATCH; saves of whole datasets are a PUT that the service refuses for
+# datasets someone else has changed since (optimistic concurrency).
+#
+# Uses urllib only; the service is expected on the local network.
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+import catalog
+from sqlite_store import DATASETS, StoreError
+
+
+class RemoteStore:
+    def __init__(self, url, timeout=10):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        # Identifies this editor's writes, so its own edits never conflict
+        # with each other
+        self.client = uuid.uuid4().hex
+        # Revision of each dataset the local copy reflects; the service
+        # checks each edit against what others have changed since
+        self._base = {}
+
+    def _request(self, method, path, payload=None):
+        data = None
+        headers = {"Accept": "application/json"}
+        if payload is not None:
+            data = json.dumps(payload, ensure_ascii=False, default=catalog.to_json).encode('utf-8')
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise StoreError(f"{self.url}: {message}") from None
+        except (urllib.error.URLError, OSError) as e:
+            raise StoreError(f"Can't reach {self.url}: {getattr(e, 'reason', e)}") from None
+
+    def close(self):
+        pass
+
+    def _follow(self, revisions):
+        # Keeps the base in step with our own writes; a revision someone
+        # else moved on in between waits for load()
+        for name, revision in revisions.items():
+            if self._base.get(name) == revision - 1:
+                self._base[name] = revision
+
+    # Reading
+
+    def revisions(self):
+        return self._request("GET", "/revisions")
+
+    def load(self, names=DATASETS):
+        query = urllib.parse.urlencode({"datasets": ",".join(names)})
+        reply = self._request("GET", f"/catalog?{query}")
+        loaded = {}
+        for name in names:
+            data = reply["datasets"][name]
+            loaded[name] = data if name == "config" else catalog.load_dataset(name, data)
+        self._base.update(reply["revisions"])
+        return loaded, reply["revisions"]
+
+    def subs_using(self, name):
+        # [(category, row)] of every sub listing ingredient `name`, as of the
+        # service's current subs
+        query = urllib.parse.urlencode({"ingredient": name})
+        return [tuple(entry) for entry in self._request("GET", f"/usage?{query}")["subs"]]
+
+    # Writing
+
+    def apply(self, records):
+        # Journal records, applied by the service in order. Raises
+        # StoreError if one touches something another client changed since
+        # our base, or that no longer exists.
+        reply = self._request("PATCH", "/catalog", {"client": self.client, "base": self._base, "edits": records})
+        self._follow(reply["revisions"])
+        return reply["revisions"]
+
+    def replace(self, datasets, expected=None):
+        reply = self._request("PUT", "/catalog", {"client": self.client, "datasets": datasets,
+                                                  "expected": expected})
+        self._base.update(reply["revisions"])
+        return reply["written"], reply["revisions"]
@@ -0,0 +1,132 @@
+import threading
+import time
+
+from catalog import Record
+from sub_shards import ShardedSubs
+
+
+def snapshot(data):
+    # Structural copy of JSON-shaped data and catalog records; much cheaper
+    # than copy.deepcopy and lets the writer thread serialize while the
+    # editors keep mutating.
+    if isinstance(data, dict):
+        return {k: snapshot(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [snapshot(v) for v in data]
+    if isinstance(data, Record):
+        return data.copy()
+    if isinstance(data, ShardedSubs):
+        # Categories not loaded yet have nothing unsaved to copy
+        return data.snapshot(snapshot)
+    return data
+
+
+class SaveQueue:
+    # Background writer owned by DataManager. Requests are merged per dataset
+    # (newest snapshot wins) and written once the burst has been quiet for
+    # `debounce` seconds, or at most `max_latency` seconds after the first
+    # pending request. Callbacks run on the writer thread.
+    def __init__(self, data_manager, on_saved=None, on_error=None, debounce=0.3, max_latency=2.0):
+        self.dm = data_manager
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self.debounce = debounce
+        self.max_latency = max_latency
+
+        self._cond = threading.Condition()
+        self._pending = {}
+        # Newest journaled edit the pending snapshots include
+        self._pending_seq = None
+        self._first_request = 0.0
+        self._last_request = 0.0
+        self._busy = False
+        self._flushing = False
+        self._closing = False
+
+        self._thread = threading.Thread(target=self._run, name="SaveQueue", daemon=True)
+        self._thread.start()
+
+    def submit(self, datasets, seq=None):
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("Save queue is closed")
+            now = time.monotonic()
+            if not self._pending:
+                self._first_request = now
+            self._last_request = now
+            self._pending.update(datasets)
+            if seq is not None:
+                self._pending_seq = max(seq, self._pending_seq or 0)
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return bool(self._pending) or self._busy
+
+    def pending_datasets(self):
+        # Names of the datasets waiting to be written
+        with self._cond:
+            return set(self._pending)
+
+    def flush(self, timeout=None):
+        # Skip the debounce and wait until everything submitted so far is on disk
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            try:
+                while self._pending or self._busy:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                # Also on timeout, or later saves would skip the debounce too
+                self._flushing = False
+
+    def close(self, timeout=None):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _wait_for_batch(self):
+        # Called with the lock held; returns (batch, seq) to write or None to exit
+        while not self._pending:
+            if self._closing:
+                return None
+            self._cond.wait()
+        while not (self._closing or self._flushing):
+            now = time.monotonic()
+            deadline = min(self._last_request + self.debounce,
+                           self._first_request + self.max_latency)
+            if now >= deadline:
+                break
+            self._cond.wait(deadline - now)
+        batch, seq = self._pending, self._pending_seq
+        self._pending = {}
+        self._pending_seq = None
+        self._busy = True
+        return batch, seq
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._wait_for_batch()
+            if job is None:
+                return
+            batch, seq = job
+            try:
+                written = self.dm.write_snapshot(batch, seq=seq)
+                if self.on_saved:
+                    self.on_saved(written)
+            except Exception as e:
+                # Keep the datasets dirty so the next save retries them
+                self.dm.mark_dirty(*batch.keys())
+                if self.on_error:
+                    self.on_error(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
@@ -0,0 +1,199 @@
+# In-memory fuzzy search over subs, ingredients and tips.
+#
+# Every searchable field is broken into padded word trigrams ("ham" ->
+# " ha", "ham", "am ") and short word prefixes. Posting sets map each gram to
+# the entries containing it, so a lookup only scores entries that share the
+# query's rarest grams instead of scanning the catalog. Entries are added,
+# updated and removed one at a time as the editors change data.
+#
+# Every candidate is still scored in Python, so a lookup costs about 2-3 us
+# per entry that matches. That is under a millisecond for the 1k-sub catalog
+# (~1.2k entries), but a common word ("bac", "ham") or a short prefix at 10k
+# subs (~11k entries) matches 1-3k entries and takes 2-7 ms.
+
+MAX_PREFIX = 2
+
+
+def _words(text):
+    return text.lower().split()
+
+
+def _grams(text):
+    grams = set()
+    for word in _words(text):
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def _prefixes(text):
+    prefixes = set()
+    for word in _words(text):
+        for n in range(1, min(MAX_PREFIX, len(word)) + 1):
+            prefixes.add(word[:n])
+    return prefixes
+
+
+class SearchEntry:
+    __slots__ = ("key", "kind", "label", "detail", "payload", "fields", "grams", "prefixes")
+
+    def __init__(self, key, kind, label, detail, payload, fields):
+        self.key = key
+        self.kind = kind
+        self.label = label
+        self.detail = detail
+        self.payload = payload
+        # [(" " + lowercase text, weight, grams)]; the leading space lets a
+        # single substring test detect matches at the start of a word
+        self.fields = [(" " + text.lower(), weight, _grams(text)) for text, weight in fields if text]
+        self.grams = set()
+        self.prefixes = set()
+        for text, _, grams in self.fields:
+            self.grams |= grams
+            self.prefixes |= _prefixes(text)
+
+
+class SearchIndex:
+    def __init__(self):
+        self.entries = {}
+        self._grams = {}
+        self._prefixes = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Maintenance
+
+    def add(self, key, kind, label, detail, payload, fields):
+        # Adds or replaces the entry for key. fields: [(text, weight)]
+        self.remove(key)
+        entry = SearchEntry(key, kind, label, detail, payload, fields)
+        self.entries[key] = entry
+        for gram in entry.grams:
+            self._grams.setdefault(gram, set()).add(key)
+        for prefix in entry.prefixes:
+            self._prefixes.setdefault(prefix, set()).add(key)
+        return entry
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for table, values in ((self._grams, entry.grams), (self._prefixes, entry.prefixes)):
+            for value in values:
+                keys = table.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del table[value]
+
+    def clear(self, kind=None):
+        if kind is None:
+            self.entries.clear()
+            self._grams.clear()
+            self._prefixes.clear()
+            return
+        for key in [key for key, entry in self.entries.items() if entry.kind == kind]:
+            self.remove(key)
+
+    # Catalog helpers; subs and tips are keyed by object identity because
+    # their list positions shift as items are inserted and removed.
+
+    def add_sub(self, category, sub):
+        name = sub.name or ''
+        return self.add(("sub", id(sub)), "sub", name, category, sub,
+                        [(name, 3), (sub.tip or '', 1), (category, 0.5)])
+
+    def remove_sub(self, sub):
+        self.remove(("sub", id(sub)))
+
+    def add_ingredient(self, name, data):
+        category = data.category or ''
+        return self.add(("ingredient", name), "ingredient", name, category, name,
+                        [(name, 3), (category, 1)])
+
+    def remove_ingredient(self, name):
+        self.remove(("ingredient", name))
+
+    def add_tip(self, tip):
+        text = tip.text or ''
+        return self.add(("tip", id(tip)), "tip", text, "Site tip", tip, [(text, 2)])
+
+    def remove_tip(self, tip):
+        self.remove(("tip", id(tip)))
+
+    def index_catalog(self, subs, ingredients, tips):
+        self.clear()
+        for category, cat_subs in subs.items():
+            for sub in cat_subs:
+                self.add_sub(category, sub)
+        for name, data in ingredients.items():
+            self.add_ingredient(name, data)
+        for tip in tips:
+            self.add_tip(tip)
+
+    # Lookup
+
+    def _candidates(self, query, limit):
+        words = _words(query)
+        if all(len(word) <= MAX_PREFIX for word in words):
+            sets = sorted((self._prefixes.get(word, set()) for word in words), key=len)
+            return sets[0].intersection(*sets[1:]) if sets else set()
+        postings = sorted((self._grams.get(gram, set()) for gram in _grams(query)), key=len)
+        # Entries containing every gram of the query (near-exact matches);
+        # starting from the rarest gram keeps the intersection small.
+        candidates = set(postings[0]) if postings else set()
+        for keys in postings[1:]:
+            if not candidates:
+                break
+            candidates &= keys
+        if len(candidates) < limit:
+            # Typo tolerance: anything sharing half of the query's grams must
+            # appear in at least one of the rarest len/2 + 1 postings
+            for keys in postings[:len(postings) // 2 + 1]:
+                candidates |= keys
+        return candidates
+
+    def _score(self, entry, query, query_grams):
+        best = 0.0
+        spaced_query = " " + query
+        for text, weight, grams in entry.fields:
+            if query in text:
+                score = 2.0
+                if text.startswith(spaced_query):
+                    score += 1.5
+                elif spaced_query in text:
+                    score += 1.0
+                # Prefer matches that cover more of the field
+                score += len(query) / len(text)
+            elif query_grams:
+                overlap = len(query_grams & grams) / len(query_grams)
+                if overlap < 0.5:
+                    continue
+                score = overlap
+            else:
+                continue
+            best = max(best, score * weight)
+        return best
+
+    def search(self, query, limit=50, kinds=None):
+        # Returns up to `limit` SearchEntry objects, best match first
+        query = " ".join(_words(query))
+        if not query:
+            return []
+        query_grams = _grams(query) if len(query) > MAX_PREFIX else set()
+        # Fuzzy matches must share at least half of the query's grams
+        need = (len(query_grams) + 1) // 2
+        scored = []
+        for key in self._candidates(query, limit):
+            entry = self.entries[key]
+            if kinds and entry.kind not in kinds:
+                continue
+            if need and len(query_grams & entry.grams) < need:
+                continue
+            score = self._score(entry, query, query_grams)
+            if score > 0:
+                scored.append((-score, len(entry.label), entry.label, key))
+        scored.sort()
+        return [self.entries[key] for _, _, _, key in scored[:limit]]
@@ -0,0 +1,473 @@
+# Local editing service: `python -m editor serve` holds the catalog in memory
+# and lets several editors (and scripts) change it at once over HTTP, instead
+# of each rewriting public/ and clobbering the others.
+#
+#   GET   /revisions                    {dataset: revision}
+#   GET   /catalog[?datasets=subs,tips] {"revisions", "datasets", "versions"}
+#   GET   /usage?ingredient=NAME        {"revision", "subs": [[category, row], ...]}
+#   PATCH /catalog   {"client", "base": {dataset: revision}, "edits": [journal record, ...]}
+#   PUT   /catalog   {"client", "datasets": {name: data}, "expected": {dataset: revision} | null}
+#
+# Each dataset has a revision, bumped by every request that changes it, and
+# each entity (category, sub, ingredient, tip, config key) a version stamp:
+# the dataset revision it last changed at. "versions" lays the stamps out
+# like the data: {"categories": {name: v}, "subs": {category: [v, ...]},
+# "ingredients": {name: v}, "tips": [v, ...], "config": {key: v}}.
+#
+# PATCH takes the editor's journal records (see journal.encode), which
+# locate subs and tips by position. `base` is the revision of each dataset
+# the client's copy reflects; an edit is refused (409) if another client has
+# changed any entity it depends on since then, including the category or
+# tip list whose positions it relies on. Edits by the same client never
+# conflict with each other. Edits apply in order and stop at the first
+# refused one; the reply says how many went in.
+#
+# PUT replaces whole datasets, skipping those whose revision isn't
+# `expected` (null forces), like SqliteStore.replace.
+#
+# Writes are acknowledged once they are on disk. Requests arriving together
+# share one save (group commit): the first waits `window` seconds for
+# others, then every dataset they touched is written in one write_snapshot.
+#
+# There is no authentication: the service binds to localhost unless told
+# otherwise, and should only be exposed on a trusted network.
+import asyncio
+import json
+import sys
+import urllib.parse
+from http import HTTPStatus
+
+import catalog
+from data_manager import DATASETS, DEFAULT_CONFIG
+from journal import apply_record, record_datasets
+from save_queue import snapshot
+from sub_shards import ShardedSubs
+
+
+# Entity key kinds of each dataset
+_DATASET_KINDS = {"subs": ("category", "sub"), "ingredients": ("ingredient",), "tips": ("tips", "tip"),
+                  "config": ("config",)}
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class CatalogService:
+    def __init__(self, dm, data, window=0.02):
+        # data: (subs, ingredients, tips, config) from dm.load_data()
+        self.dm = dm
+        self.window = window
+        subs, ingredients, tips, config = data
+        if isinstance(subs, ShardedSubs):
+            # Held in memory whole; saves still write only changed shards
+            subs.load_all()
+        self.data = {"subs": subs, "ingredients": ingredients, "tips": tips, "config": config}
+        self.revisions = dict.fromkeys(DATASETS, 0)
+        # entity key -> {client: dataset revision it last changed the entity at}
+        self._changes = {}
+        # "sub"/"tip" -> {id(entity): (entity, serial)}: the serial an entity
+        # is keyed by while it is in the data. Holding the entity keeps its
+        # id() from being reused by a new one meanwhile.
+        self._serials = {"sub": {}, "tip": {}}
+        self._next_serial = 0
+        # Group commit: datasets changed since the last save and the
+        # requests waiting for it
+        self._unsaved = set()
+        self._waiters = []
+        self._committer = None
+        self.commits = 0
+
+    # Entities. Keys are ("category", name), ("sub", serial),
+    # ("ingredient", name), ("tips",) for the list's order, ("tip", serial)
+    # and ("config", key); each belongs to one dataset. Keys of deleted
+    # entities are dropped along with their stamps.
+
+    def _key(self, kind, entity):
+        # ("sub", serial) or ("tip", serial), numbering entities on first sight
+        serials = self._serials[kind]
+        found = serials.get(id(entity))
+        if found is None:
+            self._next_serial += 1
+            found = serials[id(entity)] = (entity, self._next_serial)
+        return kind, found[1]
+
+    def _sub_keys(self, category, row):
+        # A sub located by position depends on its category's order too
+        return [("subs", ("category", category)), ("subs", self._key("sub", self.data["subs"][category][row]))]
+
+    def _category_key(self, category):
+        # For edits that need the category to still be there
+        if category not in self.data["subs"]:
+            raise KeyError(category)
+        return "subs", ("category", category)
+
+    def _reads(self, record):
+        # The entities a journaled edit depends on, located in the current data
+        kind = record["k"]
+        subs, tips = self.data["subs"], self.data["tips"]
+        if kind in ("sub_set", "sub_remove"):
+            return self._sub_keys(record["c"], record["r"])
+        if kind == "sub_insert":
+            return [self._category_key(record["c"])]
+        if kind == "sub_move":
+            return self._sub_keys(record["c"], record["r"]) + [self._category_key(record["to"])]
+        if kind == "category_insert":
+            return [("subs", ("category", record["name"]))]
+        if kind == "category_remove":
+            return [("subs", ("category", record["name"]))] + \
+                [("subs", self._key("sub", sub)) for sub in subs[record["name"]]]
+        if kind.startswith("ingredient_"):
+            names = [record["old"], record["new"]] if kind == "ingredient_rename" else [record["name"]]
+            if kind != "ingredient_insert" and names[0] not in self.data["ingredients"]:
+                # Deleted by someone else; its stamp went with it
+                raise KeyError(names[0])
+            keys = [("ingredients", ("ingredient", name)) for name in names]
+            for category, row, _ in record.get("cascade", ()):
+                keys += self._sub_keys(category, row)
+            return keys
+        if kind == "tip_insert":
+            return [("tips", ("tips",))]
+        if kind in ("tip_remove", "tip_set"):
+            return [("tips", ("tips",)), ("tips", self._key("tip", tips[record["r"]]))]
+        return [("config", ("config", record["key"]))]
+
+    def _writes(self, record, extra_subs):
+        # The entities a journaled edit changed, located after applying it
+        kind = record["k"]
+        subs, tips = self.data["subs"], self.data["tips"]
+        if kind == "sub_set":
+            keys = self._sub_keys(record["c"], record["r"])[1:]
+        elif kind == "sub_insert":
+            keys = self._sub_keys(record["c"], record["r"])
+        elif kind == "sub_remove":
+            keys = [("subs", ("category", record["c"]))]
+        elif kind == "sub_move":
+            keys = [("subs", ("category", record["c"]))] + self._sub_keys(record["to"], record["tr"])
+        elif kind == "category_insert":
+            keys = [("subs", ("category", record["name"]))] + \
+                [("subs", self._key("sub", sub)) for sub in subs[record["name"]]]
+        elif kind == "category_remove":
+            keys = [("subs", ("category", record["name"]))]
+        elif kind.startswith("ingredient_"):
+            names = [record["old"], record["new"]] if kind == "ingredient_rename" else [record["name"]]
+            keys = [("ingredients", ("ingredient", name)) for name in names]
+            keys += [("subs", self._key("sub", subs[category][row])) for category, row, _ in record.get("cascade", ())]
+        elif kind == "tip_insert":
+            keys = [("tips", ("tips",)), ("tips", self._key("tip", tips[record["r"]]))]
+        elif kind == "tip_remove":
+            keys = [("tips", ("tips",))]
+        elif kind == "tip_set":
+            keys = [("tips", self._key("tip", tips[record["r"]]))]
+        else:
+            keys = [("config", ("config", record["key"]))]
+        return keys + [("subs", self._key("sub", sub)) for sub in extra_subs]
+
+    def _removals(self, record):
+        # (kind, entity) for what a journaled edit deletes, looked up before
+        # it applies: subs and tips as objects, the rest by name
+        kind = record["k"]
+        if kind == "sub_remove":
+            return [("sub", self.data["subs"][record["c"]][record["r"]])]
+        if kind == "category_remove":
+            return [("category", record["name"])] + [("sub", sub) for sub in self.data["subs"][record["name"]]]
+        if kind in ("ingredient_remove", "ingredient_rename"):
+            return [("ingredient", record["old"] if kind == "ingredient_rename" else record["name"])]
+        if kind == "tip_remove":
+            return [("tip", self.data["tips"][record["r"]])]
+        if kind == "config_set" and record.get("drop"):
+            return [("config", record["key"])]
+        return []
+
+    def _forget(self, removals):
+        for kind, entity in removals:
+            if kind in self._serials:
+                found = self._serials[kind].pop(id(entity), None)
+                if found is None:
+                    continue
+                entity = found[1]
+            self._changes.pop((kind, entity), None)
+
+    def _prune(self, name):
+        # After a whole-dataset change: drops the stamps and serials of
+        # entities no longer in it
+        current = set(self._entity_keys(name))
+        kinds = _DATASET_KINDS[name]
+        for key in [key for key in self._changes if key[0] in kinds and key not in current]:
+            del self._changes[key]
+        for kind in kinds:
+            if kind in self._serials:
+                self._serials[kind] = {ident: found for ident, found in self._serials[kind].items()
+                                       if (kind, found[1]) in current}
+
+    def _finish_cascade(self, record):
+        # A rename or delete only rewrote the subs the client knew listed
+        # the ingredient; others may have added it elsewhere since. Returns
+        # the subs fixed up here.
+        kind = record["k"]
+        if kind not in ("ingredient_rename", "ingredient_remove"):
+            return []
+        name = record["old"] if kind == "ingredient_rename" else record["name"]
+        fixed = []
+        for cat_subs in self.data["subs"].values():
+            for sub in cat_subs:
+                if sub.ingredients and name in sub.ingredients:
+                    if kind == "ingredient_rename":
+                        sub['ingredients'] = [record["new"] if ing == name else ing for ing in sub.ingredients]
+                    else:
+                        sub['ingredients'] = [ing for ing in sub.ingredients if ing != name]
+                    fixed.append(sub)
+        return fixed
+
+    def _entity_keys(self, name):
+        # Every entity of a dataset, for whole-dataset replaces
+        if name == "subs":
+            keys = []
+            for category, cat_subs in self.data["subs"].items():
+                keys.append(("category", category))
+                keys += [self._key("sub", sub) for sub in cat_subs]
+            return keys
+        if name == "ingredients":
+            return [("ingredient", key) for key in self.data["ingredients"]]
+        if name == "tips":
+            return [("tips",)] + [self._key("tip", tip) for tip in self.data["tips"]]
+        return [("config", key) for key in self.data["config"]]
+
+    def _stamp(self, key):
+        return max(self._changes.get(key, {}).values(), default=0)
+
+    def versions(self, names=DATASETS):
+        versions = {}
+        if "subs" in names:
+            subs = self.data["subs"]
+            versions["categories"] = {category: self._stamp(("category", category)) for category in subs}
+            versions["subs"] = {category: [self._stamp(self._key("sub", sub)) for sub in cat_subs]
+                                for category, cat_subs in subs.items()}
+        if "ingredients" in names:
+            versions["ingredients"] = {name: self._stamp(("ingredient", name)) for name in self.data["ingredients"]}
+        if "tips" in names:
+            versions["tips"] = [self._stamp(self._key("tip", tip)) for tip in self.data["tips"]]
+        if "config" in names:
+            versions["config"] = {key: self._stamp(("config", key)) for key in self.data["config"]}
+        return versions
+
+    # Requests
+
+    def catalog(self, names=DATASETS):
+        datasets = {name: self.data[name] for name in names}
+        if isinstance(datasets.get("subs"), ShardedSubs):
+            datasets["subs"] = dict(datasets["subs"].items())
+        return {"revisions": {name: self.revisions[name] for name in names},
+                "datasets": datasets,
+                "versions": self.versions(names)}
+
+    def usage(self, name):
+        # Where ingredient `name` is used, as SqliteStore.subs_using
+        found = [[category, row] for category, cat_subs in self.data["subs"].items()
+                 for row, sub in enumerate(cat_subs) if name in (sub.get("ingredients") or [])]
+        return {"revision": self.revisions["subs"], "subs": found}
+
+    async def patch(self, body):
+        client, base, edits = body.get("client"), body.get("base") or {}, body.get("edits")
+        if not client or not isinstance(edits, list):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "PATCH needs 'client' and a list of 'edits'")
+        upcoming = {name: revision + 1 for name, revision in self.revisions.items()}
+        touched, refused = set(), None
+        for i, record in enumerate(edits):
+            try:
+                reads = self._reads(record)
+            except (KeyError, IndexError, TypeError):
+                refused = ServiceError(HTTPStatus.CONFLICT, f"edit {i + 1} refers to something that no longer exists",
+                                       applied=i)
+                break
+            stale = [key for dataset, key in reads
+                     if any(other != client and revision > base.get(dataset, 0)
+                            for other, revision in self._changes.get(key, {}).items())]
+            if stale:
+                refused = ServiceError(HTTPStatus.CONFLICT, f"edit {i + 1} conflicts with changes by another editor",
+                                       applied=i)
+                break
+            datasets = record_datasets(record)
+            touched |= datasets
+            removals = self._removals(record)
+            # tip_set swaps in a new Tip; it keeps the old one's key
+            replaced = self.data["tips"][record["r"]] if record["k"] == "tip_set" else None
+            try:
+                apply_record(record, self.data["subs"], self.data["ingredients"], self.data["tips"],
+                             self.data["config"])
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                # Possibly half applied: every client reloads the datasets
+                refused = ServiceError(HTTPStatus.CONFLICT, f"edit {i + 1} could not be applied: {e}", applied=i)
+                for dataset in datasets:
+                    self._prune(dataset)
+                    for key in self._entity_keys(dataset):
+                        self._changes.setdefault(key, {})[client] = upcoming[dataset]
+                break
+            if replaced is not None:
+                found = self._serials["tip"].pop(id(replaced), None)
+                if found is not None:
+                    tip = self.data["tips"][record["r"]]
+                    self._serials["tip"][id(tip)] = (tip, found[1])
+            fixed = self._finish_cascade(record)
+            if fixed:
+                touched.add("subs")
+            for dataset, key in self._writes(record, fixed):
+                self._changes.setdefault(key, {})[client] = upcoming[dataset]
+            self._forget(removals)
+        revisions = self._bump(touched)
+        if touched:
+            await self._commit(touched)
+        if refused is not None:
+            refused.details["revisions"] = revisions
+            raise refused
+        return {"revisions": revisions}
+
+    async def put(self, body):
+        client, datasets, expected = body.get("client"), body.get("datasets"), body.get("expected")
+        if not client or not isinstance(datasets, dict) or not set(datasets) <= set(DATASETS):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "PUT needs 'client' and 'datasets'")
+        written = {}
+        for name, data in datasets.items():
+            if expected is not None and expected.get(name) != self.revisions[name]:
+                continue
+            loaded = catalog.load_dataset(name, data, DEFAULT_CONFIG)
+            current = self.data[name]
+            if name == "tips":
+                current[:] = loaded
+            else:
+                current.clear()
+                current.update(loaded)
+            self._prune(name)
+            for key in self._entity_keys(name):
+                self._changes.setdefault(key, {})[client] = self.revisions[name] + 1
+            written[name] = sum(map(len, loaded.values())) if name == "subs" else len(loaded)
+        revisions = self._bump(written)
+        if written:
+            await self._commit(written.keys())
+        return {"written": written, "revisions": revisions}
+
+    def _bump(self, names):
+        for name in names:
+            self.revisions[name] += 1
+        return {name: self.revisions[name] for name in names}
+
+    # Group commit
+
+    async def _commit(self, names):
+        # Returns once `names` are on disk
+        self._unsaved |= set(names)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._committer is None or self._committer.done():
+            self._committer = asyncio.create_task(self._run_commits())
+        await waiter
+
+    async def _run_commits(self):
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            # Let requests arriving meanwhile join this save
+            await asyncio.sleep(self.window)
+            waiters, self._waiters = self._waiters, []
+            names, self._unsaved = self._unsaved, set()
+            batch = {name: snapshot(self.data[name]) for name in DATASETS if name in names}
+            try:
+                # The service owns the files, so it doesn't defer to changes
+                # on disk as the editor does
+                await loop.run_in_executor(None, self.dm.write_snapshot, batch, True)
+            except Exception as e:
+                self._unsaved |= names
+                for waiter in waiters:
+                    waiter.set_exception(e)
+                continue
+            self.commits += 1
+            for waiter in waiters:
+                waiter.set_result(None)
+
+    # HTTP
+
+    async def route(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(url.query)
+        names = DATASETS
+        if "datasets" in query:
+            names = tuple(name for name in query["datasets"][0].split(",") if name)
+            if not set(names) <= set(DATASETS):
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"Unknown dataset in {query['datasets'][0]}")
+        if url.path == "/revisions" and method == "GET":
+            return self.revisions
+        if url.path == "/usage" and method == "GET":
+            if "ingredient" not in query:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "GET /usage needs ?ingredient=NAME")
+            return self.usage(query["ingredient"][0])
+        if url.path == "/catalog":
+            if method == "GET":
+                return self.catalog(names)
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "Request body is not JSON") from None
+            if method == "PATCH":
+                return await self.patch(payload)
+            if method == "PUT":
+                return await self.put(payload)
+            raise ServiceError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} /catalog")
+        raise ServiceError(HTTPStatus.NOT_FOUND, f"No such resource: {url.path}")
+
+    async def handle(self, reader, writer):
+        # HTTP/1.1 with keep-alive; requests on one connection are answered in order
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                method, target, _ = line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = header.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, payload = HTTPStatus.OK, await self.route(method, target, body)
+                except ServiceError as e:
+                    status, payload = e.status, dict(e.details, error=str(e))
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+                data = json.dumps(payload, ensure_ascii=False, separators=(',', ':'),
+                                  default=catalog.to_json).encode('utf-8')
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             "Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def serve(dm, data, host="127.0.0.1", port=8765, window=0.02):
+    # Runs the service until interrupted
+    service = CatalogService(dm, data, window)
+
+    async def run():
+        server = await service.start(host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Serving {dm.public_dir} on http://{address[0]}:{address[1]}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
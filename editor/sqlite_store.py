@@ -0,0 +1,452 @@
+# SQLite storage for the catalog, in place of rewriting the JSON files.
+#
+# catalog.db (next to public/, never deployed) holds one row per category,
+# sub, sub ingredient, ingredient, tip and config entry, with list order kept
+# in dense `position` columns. Editor edits arrive as journal records (see
+# journal.encode) and each one is a single transaction touching only the rows
+# it changes; whole datasets (CLI batches, imports) are replaced in one
+# transaction. The trainer still reads public/*.json: DataManager.export_json
+# writes them from the loaded catalog.
+#
+# The database runs in WAL mode, so other processes (the CLI, a second
+# editor) read while the editor writes. Every transaction bumps the
+# revision of the datasets it touched; DataManager.poll_external compares
+# revisions to notice other writers.
+import json
+import sqlite3
+import sys
+
+from catalog import Ingredient, Sub, Tip
+from journal import record_datasets
+
+SCHEMA_VERSION = 1
+DATASETS = ("subs", "ingredients", "tips", "config")
+
+_SCHEMA = """
+CREATE TABLE categories (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE subs (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL REFERENCES categories(name) ON UPDATE CASCADE ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT,
+    tip TEXT,
+    image TEXT,
+    ingredients INTEGER,  -- how many, or NULL when the sub has no "ingredients" key
+    extra TEXT            -- JSON object of keys the editor doesn't know
+);
+CREATE INDEX subs_by_position ON subs(category, position);
+CREATE INDEX subs_by_name ON subs(name);
+CREATE TABLE sub_ingredients (
+    sub_id INTEGER NOT NULL REFERENCES subs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    ingredient TEXT NOT NULL
+);
+CREATE INDEX sub_ingredients_by_sub ON sub_ingredients(sub_id, position);
+CREATE INDEX sub_ingredients_by_name ON sub_ingredients(ingredient);
+CREATE TABLE ingredients (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    category TEXT,
+    image TEXT,
+    is_lto INTEGER,
+    extra TEXT
+);
+CREATE INDEX ingredients_by_position ON ingredients(position);
+CREATE TABLE tips (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    text TEXT,
+    icon TEXT,
+    extra TEXT
+);
+CREATE INDEX tips_by_position ON tips(position);
+CREATE TABLE config (
+    key TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    value TEXT NOT NULL  -- JSON
+);
+CREATE TABLE revisions (
+    dataset TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+"""
+
+# Record fields with a column of their own; the rest go in `extra`. A NULL
+# column means the field is absent, so an explicit null for one is kept in
+# `extra` as well (and the column wins when it isn't NULL).
+_SUB_COLUMNS = ("name", "tip", "image")
+_INGREDIENT_COLUMNS = ("category", "image", "is_lto")
+_TIP_COLUMNS = ("text", "icon")
+
+
+class StoreError(RuntimeError):
+    pass
+
+
+def _extra(values, fields):
+    extra = {key: value for key, value in values.items() if key not in fields or value is None}
+    return json.dumps(extra, ensure_ascii=False) if extra else None
+
+
+def _columns(data, **columns):
+    # Adds a row's column values to what its `extra` held
+    for key, value in columns.items():
+        if value is not None:
+            data[key] = value
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        # Autocommit; transactions are explicit (see _transaction). One
+        # connection shared by the editor and its save thread, which
+        # DataManager serializes with its I/O lock.
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise StoreError(f"{path} was written by a newer editor (schema {version})")
+        if version == 0:
+            self._begin()
+            try:
+                for statement in _SCHEMA.split(';'):
+                    if statement.strip():
+                        self._db.execute(statement)
+                self._db.executemany("INSERT INTO revisions VALUES (?, 0)", [(name,) for name in DATASETS])
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def close(self):
+        self._db.close()
+
+    def _begin(self):
+        # Takes the write lock up front so two writers wait on each other
+        # (busy timeout) instead of failing halfway through
+        self._db.execute("BEGIN IMMEDIATE")
+
+    def _commit(self, datasets):
+        # Bumps the revisions of `datasets` and commits; returns them
+        revisions = {}
+        for name in sorted(datasets):
+            self._db.execute("UPDATE revisions SET revision = revision + 1 WHERE dataset = ?", (name,))
+            revisions[name] = self._db.execute("SELECT revision FROM revisions WHERE dataset = ?",
+                                               (name,)).fetchone()[0]
+        self._db.execute("COMMIT")
+        return revisions
+
+    def _run(self, datasets, work):
+        # work() inside one transaction, then bumps whatever `datasets`
+        # holds by the time it returns
+        self._begin()
+        try:
+            work()
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return self._commit(datasets)
+
+    # Reading
+
+    def revisions(self):
+        return dict(self._db.execute("SELECT dataset, revision FROM revisions"))
+
+    def load(self, names=DATASETS):
+        # ({name: data} as catalog records, {name: revision}). Config comes
+        # back as a plain dict, which DataManager fills in with defaults. One
+        # read transaction, so the datasets are consistent with each other
+        # and with the revisions.
+        self._db.execute("BEGIN")
+        try:
+            loaded = {name: getattr(self, f"_load_{name}")() for name in names}
+            revisions = self.revisions()
+        finally:
+            self._db.execute("COMMIT")
+        return loaded, {name: revisions[name] for name in names}
+
+    def _load_subs(self):
+        intern = sys.intern
+        subs = {intern(name): [] for (name,) in
+                self._db.execute("SELECT name FROM categories ORDER BY position")}
+        by_id = {}
+        rows = self._db.execute(
+            "SELECT s.id, s.category, s.name, s.tip, s.image, s.ingredients, s.extra FROM subs s "
+            "JOIN categories c ON c.name = s.category ORDER BY c.position, s.position")
+        for sub_id, category, name, tip, image, count, extra in rows:
+            data = json.loads(extra) if extra else {}
+            _columns(data, name=name, tip=tip, image=image, ingredients=None if count is None else [])
+            sub = Sub.from_json(data)
+            subs[category].append(sub)
+            by_id[sub_id] = sub
+        for sub_id, ingredient in self._db.execute(
+                "SELECT sub_id, ingredient FROM sub_ingredients ORDER BY sub_id, position"):
+            by_id[sub_id].ingredients.append(intern(ingredient))
+        return subs
+
+    def _load_ingredients(self):
+        ingredients = {}
+        for name, category, image, is_lto, extra in self._db.execute(
+                "SELECT name, category, image, is_lto, extra FROM ingredients ORDER BY position"):
+            data = json.loads(extra) if extra else {}
+            _columns(data, category=category, image=image, is_lto=None if is_lto is None else bool(is_lto))
+            ingredients[sys.intern(name)] = Ingredient.from_json(data)
+        return ingredients
+
+    def _load_tips(self):
+        tips = []
+        for text, icon, extra in self._db.execute("SELECT text, icon, extra FROM tips ORDER BY position"):
+            data = json.loads(extra) if extra else {}
+            _columns(data, text=text, icon=icon)
+            tips.append(Tip.from_json(data))
+        return tips
+
+    def _load_config(self):
+        return {key: json.loads(value) for key, value in
+                self._db.execute("SELECT key, value FROM config ORDER BY position")}
+
+    def subs_using(self, name):
+        # [(category, row)] of every sub listing ingredient `name`, in
+        # catalog order; an index lookup rather than a scan
+        return self._db.execute(
+            "SELECT s.category, s.position FROM sub_ingredients i JOIN subs s ON s.id = i.sub_id "
+            "JOIN categories c ON c.name = s.category WHERE i.ingredient = ? "
+            "GROUP BY s.id ORDER BY c.position, s.position", (name,)).fetchall()
+
+    # Writing whole datasets
+
+    def replace(self, datasets, expected=None):
+        # {name: data}: swaps each dataset's rows for `data` in one
+        # transaction. expected: {name: revision} the caller last saw; a
+        # dataset someone else has written since is left alone. Returns
+        # ({name: rows written}, {name: new revision}).
+        written = {}
+
+        def work():
+            current = self.revisions()
+            for name, data in datasets.items():
+                if expected is not None and current[name] != expected.get(name):
+                    continue
+                written[name] = getattr(self, f"_replace_{name}")(data)
+
+        return written, self._run(written, work)
+
+    def _replace_subs(self, subs):
+        self._db.execute("DELETE FROM categories")
+        rows = 0
+        for position, (category, cat_subs) in enumerate(subs.items()):
+            self._db.execute("INSERT INTO categories VALUES (?, ?)", (category, position))
+            for row, sub in enumerate(cat_subs):
+                rows += 1 + self._insert_sub(category, row, sub)
+        return rows
+
+    def _replace_ingredients(self, ingredients):
+        self._db.execute("DELETE FROM ingredients")
+        for position, (name, data) in enumerate(ingredients.items()):
+            self._insert_ingredient(name, position, data)
+        return len(ingredients)
+
+    def _replace_tips(self, tips):
+        self._db.execute("DELETE FROM tips")
+        for position, tip in enumerate(tips):
+            self._insert_tip(position, tip)
+        return len(tips)
+
+    def _replace_config(self, config):
+        self._db.execute("DELETE FROM config")
+        self._db.executemany("INSERT INTO config VALUES (?, ?, ?)",
+                             [(key, position, json.dumps(value, ensure_ascii=False))
+                              for position, (key, value) in enumerate(config.items())])
+        return len(config)
+
+    # Rows. Records and plain dicts are both read through the mapping
+    # interface.
+
+    def _insert_sub(self, category, row, sub):
+        # Returns the number of ingredient rows written
+        ingredients = sub.get('ingredients')
+        cursor = self._db.execute(
+            "INSERT INTO subs (category, position, name, tip, image, ingredients, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (category, row, sub.get('name'), sub.get('tip'), sub.get('image'),
+             None if ingredients is None else len(ingredients), _extra(sub, Sub.FIELDS)))
+        if ingredients:
+            self._db.executemany("INSERT INTO sub_ingredients VALUES (?, ?, ?)",
+                                 [(cursor.lastrowid, i, name) for i, name in enumerate(ingredients)])
+        return len(ingredients or ())
+
+    def _insert_ingredient(self, name, position, data):
+        self._db.execute("INSERT INTO ingredients VALUES (?, ?, ?, ?, ?, ?)",
+                         (name, position, data.get('category'), data.get('image'), data.get('is_lto'),
+                          _extra(data, Ingredient.FIELDS)))
+
+    def _insert_tip(self, position, tip):
+        self._db.execute("INSERT INTO tips (position, text, icon, extra) VALUES (?, ?, ?, ?)",
+                         (position, tip.get('text'), tip.get('icon'), _extra(tip, Tip.FIELDS)))
+
+    def _shift(self, table, where, params, start, delta):
+        # Moves the rows at or after `start` by `delta` to open or close a gap
+        self._db.execute(f"UPDATE {table} SET position = position + ? WHERE {where} AND position >= ?",
+                         (delta, *params, start))
+
+    def _sub_id(self, category, row):
+        found = self._db.execute("SELECT id FROM subs WHERE category = ? AND position = ?",
+                                 (category, row)).fetchone()
+        if found is None:
+            raise StoreError(f"No sub at row {row} of '{category}'")
+        return found[0]
+
+    def _set_extra(self, table, key_column, key, values, drop):
+        row = self._db.execute(f"SELECT extra FROM {table} WHERE {key_column} = ?", (key,)).fetchone()
+        if not (row and row[0]) and not values:
+            return
+        extra = json.loads(row[0]) if row and row[0] else {}
+        for name in drop:
+            extra.pop(name, None)
+        extra.update(values)
+        self._db.execute(f"UPDATE {table} SET extra = ? WHERE {key_column} = ?",
+                         (json.dumps(extra, ensure_ascii=False) if extra else None, key))
+
+    def _set_record_extra(self, table, key_column, key, record, fields):
+        # The `extra` side of a sub_set/ingredient_set: unknown keys and
+        # explicit nulls are stored, dropped keys and known fields that got
+        # a value lose their entry
+        values = {name: value for name, value in record["set"].items() if name not in fields or value is None}
+        drop = [*record["drop"], *(name for name in record["set"] if name not in values)]
+        if values or drop:
+            self._set_extra(table, key_column, key, values, drop)
+
+    def _set_sub_ingredients(self, sub_id, ingredients):
+        self._db.execute("DELETE FROM sub_ingredients WHERE sub_id = ?", (sub_id,))
+        if ingredients:
+            self._db.executemany("INSERT INTO sub_ingredients VALUES (?, ?, ?)",
+                                 [(sub_id, i, name) for i, name in enumerate(ingredients)])
+        self._db.execute("UPDATE subs SET ingredients = ? WHERE id = ?",
+                         (None if ingredients is None else len(ingredients), sub_id))
+
+    def _edit_sub_ingredient(self, category, row, position, name):
+        # Inserts `name` at `position` in a sub's ingredient list, or with
+        # name None removes the entry there
+        sub_id = self._sub_id(category, row)
+        where, params = "sub_id = ?", (sub_id,)
+        if name is None:
+            self._db.execute("DELETE FROM sub_ingredients WHERE sub_id = ? AND position = ?", (sub_id, position))
+            self._shift("sub_ingredients", where, params, position + 1, -1)
+            self._db.execute("UPDATE subs SET ingredients = ingredients - 1 WHERE id = ?", (sub_id,))
+        else:
+            self._shift("sub_ingredients", where, params, position, 1)
+            self._db.execute("INSERT INTO sub_ingredients VALUES (?, ?, ?)", (sub_id, position, name))
+            self._db.execute("UPDATE subs SET ingredients = ingredients + 1 WHERE id = ?", (sub_id,))
+
+    # Writing single edits
+
+    def apply(self, records):
+        # Journal records (see journal.encode), applied in order in one
+        # transaction. Returns the new revision of each dataset touched.
+        datasets = set()
+
+        def work():
+            for record in records:
+                self._apply(record)
+                datasets.update(record_datasets(record))
+
+        return self._run(datasets, work)
+
+    def _apply(self, record):
+        kind = record["k"]
+        db = self._db
+        in_category, category = "category = ?", (record.get("c"),)
+        if kind == "sub_set":
+            sub_id = self._sub_id(record["c"], record["r"])
+            values = dict.fromkeys(record["drop"])
+            values.update(record["set"])
+            for key, value in values.items():
+                if key == 'ingredients':
+                    self._set_sub_ingredients(sub_id, value)
+                elif key in _SUB_COLUMNS:
+                    db.execute(f"UPDATE subs SET {key} = ? WHERE id = ?", (value, sub_id))
+            self._set_record_extra("subs", "id", sub_id, record, Sub.FIELDS)
+        elif kind == "sub_insert":
+            self._shift("subs", in_category, category, record["r"], 1)
+            self._insert_sub(record["c"], record["r"], record["sub"])
+        elif kind == "sub_remove":
+            db.execute("DELETE FROM subs WHERE id = ?", (self._sub_id(record["c"], record["r"]),))
+            self._shift("subs", in_category, category, record["r"] + 1, -1)
+        elif kind == "sub_move":
+            sub_id = self._sub_id(record["c"], record["r"])
+            self._shift("subs", in_category, category, record["r"] + 1, -1)
+            self._shift("subs", "category = ? AND id != ?", (record["to"], sub_id), record["tr"], 1)
+            db.execute("UPDATE subs SET category = ?, position = ? WHERE id = ?", (record["to"], record["tr"], sub_id))
+        elif kind == "category_insert":
+            self._shift("categories", "1", (), record["pos"], 1)
+            db.execute("INSERT INTO categories VALUES (?, ?)", (record["name"], record["pos"]))
+            for row, sub in enumerate(record["subs"]):
+                self._insert_sub(record["name"], row, sub)
+        elif kind == "category_remove":
+            found = db.execute("SELECT position FROM categories WHERE name = ?", (record["name"],)).fetchone()
+            if found is None:
+                raise StoreError(f"Unknown category '{record['name']}'")
+            db.execute("DELETE FROM categories WHERE name = ?", (record["name"],))
+            self._shift("categories", "1", (), found[0] + 1, -1)
+        elif kind == "ingredient_set":
+            name = record["name"]
+            values = dict.fromkeys(record["drop"])
+            values.update(record["set"])
+            for key, value in values.items():
+                if key in _INGREDIENT_COLUMNS:
+                    db.execute(f"UPDATE ingredients SET {key} = ? WHERE name = ?", (value, name))
+            self._set_record_extra("ingredients", "name", name, record, Ingredient.FIELDS)
+        elif kind == "ingredient_insert":
+            self._shift("ingredients", "1", (), record["pos"], 1)
+            self._insert_ingredient(record["name"], record["pos"], record["data"])
+            for category, row, positions in record["cascade"]:
+                for i in positions:
+                    self._edit_sub_ingredient(category, row, i, record["name"])
+        elif kind == "ingredient_remove":
+            position = self._ingredient_position(record["name"])
+            db.execute("DELETE FROM ingredients WHERE name = ?", (record["name"],))
+            self._shift("ingredients", "1", (), position + 1, -1)
+            for category, row, positions in record["cascade"]:
+                for i in reversed(positions):
+                    self._edit_sub_ingredient(category, row, i, None)
+        elif kind == "ingredient_rename":
+            position = self._ingredient_position(record["old"])
+            self._shift("ingredients", "name != ?", (record["old"],), position + 1, -1)
+            self._shift("ingredients", "name != ?", (record["old"],), record["pos"], 1)
+            db.execute("UPDATE ingredients SET name = ?, position = ? WHERE name = ?",
+                       (record["new"], record["pos"], record["old"]))
+            for category, row, positions in record["cascade"]:
+                sub_id = self._sub_id(category, row)
+                db.executemany("UPDATE sub_ingredients SET ingredient = ? WHERE sub_id = ? AND position = ?",
+                               [(record["new"], sub_id, i) for i in positions])
+        elif kind == "tip_insert":
+            self._shift("tips", "1", (), record["r"], 1)
+            self._insert_tip(record["r"], record["tip"])
+        elif kind == "tip_remove":
+            db.execute("DELETE FROM tips WHERE position = ?", (record["r"],))
+            self._shift("tips", "1", (), record["r"] + 1, -1)
+        elif kind == "tip_set":
+            tip = record["tip"]
+            db.execute("UPDATE tips SET text = ?, icon = ?, extra = ? WHERE position = ?",
+                       (tip.get('text'), tip.get('icon'), _extra(tip, Tip.FIELDS), record["r"]))
+        elif kind == "config_set":
+            if record.get("drop"):
+                db.execute("DELETE FROM config WHERE key = ?", (record["key"],))
+            else:
+                value = json.dumps(record["value"], ensure_ascii=False)
+                if not db.execute("UPDATE config SET value = ? WHERE key = ?", (value, record["key"])).rowcount:
+                    db.execute("INSERT INTO config SELECT ?, COALESCE(MAX(position) + 1, 0), ? FROM config",
+                               (record["key"], value))
+        else:
+            raise StoreError(f"Unknown edit '{kind}'")
+
+    def _ingredient_position(self, name):
+        found = self._db.execute("SELECT position FROM ingredients WHERE name = ?", (name,)).fetchone()
+        if found is None:
+            raise StoreError(f"Unknown ingredient '{name}'")
+        return found[0]
@@ -0,0 +1,167 @@
+# Optional sharded layout for the subs: public/subs/<category>.json holds one
+# category's list of subs (the same JSON as its value in sub_data.json), and
+# public/subs/index.json lists the categories in file order:
+#
+#   {"version": 1, "categories": [
+#       {"name": "Originals", "file": "originals.json", "subs": 12,
+#        "hash": "<sha1 of the shard>", "ingredients": ["Bacon", ...]}, ...]}
+#
+# ShardedSubs is what load_data hands out for that layout: a mapping that
+# reads a category's shard the first time someone asks for its subs. Keys,
+# sub counts and which ingredients each category uses come from the index,
+# so listing categories, sizing the tree and finding the subs an ingredient
+# rename has to rewrite don't parse anything else. Anything that walks every
+# sub (items(), values(), the validation report, search) loads the rest.
+#
+# The index hashes every shard, so its own fingerprint stands for the whole
+# dataset: DataManager journals, watches and conflict-checks it as it does
+# sub_data.json in the single-file layout.
+import re
+import sys
+from collections.abc import MutableMapping
+
+INDEX_VERSION = 1
+
+_SLUG = re.compile(r'[^a-z0-9]+')
+
+
+class ShardedSubs(MutableMapping):
+    def __init__(self, index, loader):
+        # index: parsed index.json. loader(entry) -> [Sub] for an index entry.
+        self._loader = loader
+        # category -> [Sub], or None until its shard is read
+        self._shards = {}
+        # category -> index entry it was loaded from (None for new categories)
+        self._entries = {}
+        for entry in index.get("categories", ()):
+            name = sys.intern(entry["name"])
+            self._shards[name] = None
+            self._entries[name] = entry
+        # owner -> callback(category, cat_subs), run as each shard loads
+        self.on_load = {}
+
+    # Lazy loading
+
+    def is_loaded(self, category):
+        return self._shards.get(category) is not None
+
+    def loaded_items(self):
+        return [(category, cat_subs) for category, cat_subs in self._shards.items() if cat_subs is not None]
+
+    def load_all(self):
+        for category in list(self._shards):
+            self[category]
+
+    def count(self, category):
+        # Number of subs in `category` without loading it
+        cat_subs = self._shards.get(category)
+        if cat_subs is not None:
+            return len(cat_subs)
+        entry = self._entries.get(category)
+        return entry.get("subs", 0) if entry else 0
+
+    def categories_using(self, name):
+        # Categories not loaded yet whose index entry lists ingredient `name`
+        return [category for category, cat_subs in self._shards.items()
+                if cat_subs is None and name in self._entries[category].get("ingredients", ())]
+
+    def entry(self, category):
+        return self._entries.get(category)
+
+    # Key-level edits that keep unloaded categories unloaded
+
+    def insert(self, key, value, position):
+        items = list(self._shards.items())
+        items.insert(position, (key, value))
+        self._shards = dict(items)
+        self._entries[key] = None
+
+    def rename(self, old, new):
+        self._shards = {new if key == old else key: value for key, value in self._shards.items()}
+        self._entries[new] = self._entries.pop(old)
+
+    def snapshot(self, copy):
+        # Copies the loaded categories with `copy` (save_queue.snapshot);
+        # the rest stay unloaded and share the index entries
+        clone = ShardedSubs({}, self._loader)
+        clone._shards = {key: None if value is None else copy(value) for key, value in self._shards.items()}
+        clone._entries = dict(self._entries)
+        return clone
+
+    # Mapping interface
+
+    def __getitem__(self, category):
+        cat_subs = self._shards[category]
+        if cat_subs is None:
+            cat_subs = self._shards[category] = self._loader(self._entries[category])
+            for callback in list(self.on_load.values()):
+                callback(category, cat_subs)
+        return cat_subs
+
+    def __setitem__(self, category, cat_subs):
+        if category not in self._shards:
+            self._entries[category] = None
+        self._shards[category] = cat_subs
+
+    def __delitem__(self, category):
+        del self._shards[category]
+        del self._entries[category]
+
+    def __contains__(self, category):
+        return category in self._shards
+
+    def __iter__(self):
+        return iter(self._shards)
+
+    def __len__(self):
+        return len(self._shards)
+
+    def clear(self):
+        self._shards.clear()
+        self._entries.clear()
+
+    def update(self, other=(), **kwargs):
+        if isinstance(other, ShardedSubs):
+            # Take its categories as they are, loaded or not
+            for category, cat_subs in other._shards.items():
+                self._shards[category] = cat_subs
+                self._entries[category] = other._entries.get(category)
+            other = ()
+        super().update(other, **kwargs)
+
+    def __repr__(self):
+        loaded = sum(cat_subs is not None for cat_subs in self._shards.values())
+        return f"ShardedSubs({len(self._shards)} categories, {loaded} loaded)"
+
+
+def shard_filename(category, taken):
+    # A file name for a new category's shard that no other category uses
+    slug = _SLUG.sub('-', category.lower()).strip('-') or 'category'
+    filename, n = f"{slug}.json", 1
+    while filename in taken or filename == "index.json":
+        n += 1
+        filename = f"{slug}-{n}.json"
+    return filename
+
+
+# Helpers for code that takes either layout
+
+def loaded_items(subs, owner=None, callback=None):
+    # (category, cat_subs) pairs already in memory. For ShardedSubs,
+    # callback(category, cat_subs) then runs for each category loaded later,
+    # so an index built from these stays complete.
+    if isinstance(subs, ShardedSubs):
+        if callback is not None:
+            subs.on_load[owner] = callback
+        return subs.loaded_items()
+    return subs.items()
+
+
+def category_size(subs, category):
+    if isinstance(subs, ShardedSubs):
+        return subs.count(category)
+    return len(subs.get(category, ()))
+
+
+def is_loaded(subs, category):
+    return not isinstance(subs, ShardedSubs) or subs.is_loaded(category)
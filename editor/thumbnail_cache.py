@@ -0,0 +1,117 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtGui import QImage, QImageReader, QPixmap
+
+import profiling
+
+
+class ThumbnailCache:
+    # Two-level cache of downscaled image previews:
+    #   memory: LRU of QPixmaps, bounded by an approximate byte budget
+    #   disk:   small PNGs under cache_dir, keyed by path + mtime + size + target size
+    # so selecting an item never decodes the multi-megabyte original twice.
+    def __init__(self, cache_dir, max_bytes=32 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()  # key -> (pixmap, cost)
+        self._memory_bytes = 0
+
+    def key(self, path, width, height):
+        # Identifies one preview of the file as it is now; None if it's missing
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{width}x{height}"
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.png')
+
+    def _cost(self, pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def remember(self, key, image):
+        # Turns a QImage from load() into the cached QPixmap (GUI thread only)
+        pixmap = QPixmap.fromImage(image)
+        self._remember(key, pixmap)
+        return pixmap
+
+    def _remember(self, key, pixmap):
+        cost = self._cost(pixmap)
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (pixmap, cost)
+        self._memory_bytes += cost
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            _, (_, old_cost) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_cost
+
+    def decode_scaled(self, path, width, height):
+        # Decode straight to the target size where the format supports it
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            size.scale(QSize(width, height), Qt.AspectRatioMode.KeepAspectRatio)
+            if size.width() < reader.size().width():
+                reader.setScaledSize(size)
+        image = reader.read()
+        if image.isNull():
+            return image
+        if image.width() > width or image.height() > height:
+            image = image.scaled(width, height, Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        return image
+
+    def cached(self, key):
+        # The QPixmap for key if it's in memory, else None
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        return entry[0]
+
+    def load(self, key, path, width, height):
+        # The preview as a QImage, from the disk cache or decoded from path
+        # (a null QImage if it can't be). Touches no QPixmaps or shared
+        # state, so it is safe to call from worker threads (see image_loader).
+        disk_path = self._disk_path(key)
+        with profiling.span("read thumbnail", file=os.path.basename(path)):
+            image = QImage(disk_path) if os.path.exists(disk_path) else QImage()
+        if not image.isNull():
+            return image
+        with profiling.span("decode image", file=os.path.basename(path), size=f"{width}x{height}"):
+            image = self.decode_scaled(path, width, height)
+        if image.isNull():
+            return image
+        try:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            # Two workers may produce the same preview; each renames its own copy
+            tmp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+            if image.save(tmp_path, "PNG"):
+                os.replace(tmp_path, disk_path)
+        except OSError:
+            pass  # Disk cache is best effort
+        return image
+
+    def get(self, path, width, height):
+        # Returns a QPixmap no larger than width x height, or None if the
+        # file is missing or can't be decoded. Decodes on the calling thread;
+        # the editors go through ImageLoader instead.
+        key = self.key(path, width, height)
+        if key is None:
+            return None
+        pixmap = self.cached(key)
+        if pixmap is not None:
+            return pixmap
+        image = self.load(key, path, width, height)
+        return None if image.isNull() else self.remember(key, image)
+
+    def clear_memory(self):
+        self._memory.clear()
+        self._memory_bytes = 0
@@ -0,0 +1,334 @@
+# Catalog-wide validation with per-entity cached results.
+#
+# Every sub, ingredient and category (plus the tips and config as a whole) is
+# an entity with its own cached list of problems. Edits mark just the entities
+# they affect as stale: the edited sub, subs whose duplicate name/number group
+# it joined or left, the subs listing an ingredient that was added or removed
+# (via IngredientUsage), and so on. Stale entities are rechecked the next time
+# anyone asks, so the editor tree and the CLI read the same report and neither
+# re-derives it on every repaint.
+import os
+import re
+
+from sub_shards import category_size, loaded_items
+
+ERROR = "error"
+WARNING = "warning"
+
+SORT_MODES = ("category", "alphabetical")
+# Config entries that must be positive numbers when present
+SIZE_KEYS = ("ingredient_image_size", "sub_image_size", "image_hidpi_scale",
+             "ui_text_size", "ingredient_text_size")
+
+_SUB_NUMBER = re.compile(r"#(\d+)\b")
+_NEW_INGREDIENT = re.compile(r"New Ingredient( \d+)?$")
+
+
+class Problem:
+    __slots__ = ("severity", "label", "message", "key")
+
+    def __init__(self, severity, label, message, key=None):
+        self.severity = severity
+        self.label = label
+        self.message = message
+        self.key = key
+
+    def __str__(self):
+        if self.severity == ERROR:
+            return f"{self.label}: {self.message}"
+        return f"{self.label}: {self.severity}: {self.message}"
+
+
+def _is_placeholder_sub(name):
+    return not name or name == "New Sub"
+
+
+class CatalogValidator:
+    def __init__(self, images_dir, categories, usage, load_errors=None):
+        self.images_dir = images_dir
+        self.categories = set(categories)
+        # IngredientUsage over the same subs; finds the subs an ingredient
+        # change can affect
+        self.usage = usage
+        # path -> parse error, shared with DataManager
+        self.load_errors = load_errors if load_errors is not None else {}
+
+        self.subs = {}
+        self.ingredients = {}
+        self.tips = []
+        self.config = {}
+
+        # id(sub) -> [category, sub, name group, number]
+        self._subs = {}
+        self._by_name = {}
+        self._by_number = {}
+        # entity key -> [(severity, message)], and keys needing a recheck
+        self._results = {}
+        self._stale = set()
+
+    # Loading
+
+    def reset(self, subs, ingredients, tips, config):
+        self.set_ingredients(ingredients)
+        self.set_subs(subs)
+        self.set_tips(tips)
+        self.set_config(config)
+
+    def set_subs(self, subs):
+        self.subs = subs
+        for key in [key for key in self._results if key[0] in ("sub", "category")]:
+            del self._results[key]
+        self._stale = {key for key in self._stale if key[0] not in ("sub", "category")}
+        self._subs.clear()
+        self._by_name.clear()
+        self._by_number.clear()
+        # Sharded subs join as their categories load; report() loads them all
+        for category, cat_subs in loaded_items(subs, self, self._category_loaded):
+            self._category_loaded(category, cat_subs)
+        self.categories_changed()
+
+    def _category_loaded(self, category, cat_subs):
+        for sub in cat_subs:
+            self.sub_changed(category, sub)
+
+    def set_ingredients(self, ingredients):
+        self.ingredients = ingredients
+        for key in [key for key in self._results if key[0] == "ingredient"]:
+            del self._results[key]
+        self._stale = {key for key in self._stale if key[0] != "ingredient"}
+        self._stale.update(("ingredient", name) for name in ingredients)
+        # Any sub may reference an ingredient that (dis)appeared
+        self._stale.update(("sub", key) for key in self._subs)
+
+    def set_tips(self, tips):
+        self.tips = tips
+        self.tips_changed()
+
+    def set_config(self, config):
+        self.config = config
+        self.config_changed()
+
+    # Change notifications
+
+    def sub_changed(self, category, sub):
+        # A sub was added or edited (possibly moved to `category`)
+        key = id(sub)
+        record = self._subs.get(key)
+        if record is not None:
+            self._leave_groups(key, record)
+            self._stale.add(("category", record[0]))
+        name = sub.name or ''
+        name_group = None if _is_placeholder_sub(name) else name.strip().lower()
+        match = _SUB_NUMBER.match(name.strip())
+        number = int(match.group(1)) if match else None
+        record = [category, sub, name_group, number]
+        self._subs[key] = record
+        self._join_groups(key, record)
+        self._stale.add(("sub", key))
+        self._stale.add(("category", category))
+
+    def sub_removed(self, sub):
+        key = id(sub)
+        record = self._subs.pop(key, None)
+        if record is None:
+            return
+        self._leave_groups(key, record)
+        self._results.pop(("sub", key), None)
+        self._stale.discard(("sub", key))
+        self._stale.add(("category", record[0]))
+
+    def categories_changed(self):
+        for key in [key for key in self._results if key[0] == "category" and key[1] not in self.subs]:
+            del self._results[key]
+        self._stale = {key for key in self._stale if key[0] != "category" or key[1] in self.subs}
+        self._stale.update(("category", name) for name in self.subs if ("category", name) not in self._results)
+
+    def ingredient_changed(self, name):
+        # Added or edited; subs listing it may have stopped dangling
+        self._stale.add(("ingredient", name))
+        self._stale.update(("sub", id(sub)) for _, sub in self.usage.users(name))
+
+    def ingredient_removed(self, name):
+        self._results.pop(("ingredient", name), None)
+        self._stale.discard(("ingredient", name))
+        self._stale.update(("sub", id(sub)) for _, sub in self.usage.users(name))
+
+    def tips_changed(self):
+        self._stale.add(("tips",))
+
+    def config_changed(self):
+        self._stale.add(("config",))
+
+    def images_changed(self):
+        # Files appeared or disappeared under images/; recheck everything
+        # that points at one
+        self._stale.update(("sub", key) for key in self._subs)
+        self._stale.update(("ingredient", name) for name in self.ingredients)
+
+    def _groups(self, record):
+        if record[2] is not None:
+            yield self._by_name, record[2]
+        if record[3] is not None:
+            yield self._by_number, record[3]
+
+    def _join_groups(self, key, record):
+        for table, value in self._groups(record):
+            group = table.setdefault(value, set())
+            group.add(key)
+            if len(group) > 1:
+                self._stale.update(("sub", other) for other in group)
+
+    def _leave_groups(self, key, record):
+        for table, value in self._groups(record):
+            group = table.get(value)
+            if group is None:
+                continue
+            group.discard(key)
+            if group:
+                self._stale.update(("sub", other) for other in group)
+            else:
+                del table[value]
+
+    # Rules
+
+    def _image_problem(self, image):
+        if image and not os.path.isfile(os.path.join(self.images_dir, image)):
+            return (ERROR, f"image file not found: {image}")
+        return None
+
+    def _check_sub(self, record):
+        category, sub = record[0], record[1]
+        problems = []
+        if _is_placeholder_sub(sub.name):
+            problems.append((ERROR, "missing name"))
+        ingredients = sub.ingredients
+        if not ingredients:
+            problems.append((ERROR, "no ingredients"))
+        elif self.ingredients:
+            for ing in ingredients:
+                if ing not in self.ingredients:
+                    problems.append((ERROR, f"unknown ingredient '{ing}'"))
+        image = sub.image
+        if not image:
+            problems.append((ERROR, "no image"))
+        else:
+            problem = self._image_problem(image)
+            if problem:
+                problems.append(problem)
+        key = id(sub)
+        if record[2] is not None and len(self._by_name.get(record[2], ())) > 1:
+            others = sorted(self._subs[other][0] for other in self._by_name[record[2]] if other != key)
+            problems.append((WARNING, f"duplicate name (also in {', '.join(others)})"))
+        if record[3] is not None and len(self._by_number.get(record[3], ())) > 1:
+            others = sorted(self._subs[other][1].name or '' for other in self._by_number[record[3]]
+                            if other != key)
+            problems.append((WARNING, f"number #{record[3]} also used by {', '.join(others)}"))
+        return problems
+
+    def _check_ingredient(self, name):
+        data = self.ingredients[name]
+        problems = []
+        if _NEW_INGREDIENT.match(name):
+            problems.append((ERROR, "placeholder name"))
+        category = data.category or ''
+        if category not in self.categories:
+            problems.append((ERROR, f"unknown category '{category}'"))
+        image = data.image
+        if not image:
+            problems.append((WARNING, "no image"))
+        else:
+            problem = self._image_problem(image)
+            if problem:
+                problems.append(problem)
+        return problems
+
+    def _check_category(self, name):
+        if not category_size(self.subs, name):
+            return [(WARNING, "empty category")]
+        return []
+
+    def _check_tips(self):
+        problems = []
+        for i, tip in enumerate(self.tips):
+            if not (tip.text or '').strip():
+                problems.append((ERROR, f"tip {i + 1} is empty"))
+        return problems
+
+    def _check_config(self):
+        problems = []
+        if self.config.get("sort_mode", "category") not in SORT_MODES:
+            problems.append((ERROR, f"unknown sort_mode '{self.config.get('sort_mode')}'"))
+        for name in SIZE_KEYS:
+            value = self.config.get(name)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                problems.append((ERROR, f"{name} must be a positive number, got {value!r}"))
+        return problems
+
+    def _check(self, key):
+        kind = key[0]
+        if kind == "sub":
+            record = self._subs.get(key[1])
+            return self._check_sub(record) if record else None
+        if kind == "ingredient":
+            return self._check_ingredient(key[1]) if key[1] in self.ingredients else None
+        if kind == "category":
+            return self._check_category(key[1]) if key[1] in self.subs else None
+        if kind == "tips":
+            return self._check_tips()
+        return self._check_config()
+
+    def _refresh(self, key):
+        if key in self._stale:
+            self._stale.discard(key)
+            problems = self._check(key)
+            if problems is None:
+                self._results.pop(key, None)
+            else:
+                self._results[key] = problems
+        return self._results.get(key, [])
+
+    # Queries
+
+    def sub_problems(self, sub):
+        return self._refresh(("sub", id(sub)))
+
+    def has_errors(self, sub):
+        return any(severity == ERROR for severity, _ in self.sub_problems(sub))
+
+    def _label(self, key):
+        kind = key[0]
+        if kind == "sub":
+            category, sub = self._subs[key[1]][:2]
+            return f"{category} / {sub.name or ''}"
+        if kind == "ingredient":
+            return f"ingredient '{key[1]}'"
+        if kind == "category":
+            return f"category '{key[1]}'"
+        if kind == "tips":
+            return "site_tips.json"
+        return "sorting_config.json"
+
+    def report(self):
+        # Every problem in the catalog, in file order with unreadable files
+        # first. Only stale entities are rechecked.
+        keys = []
+        for category, cat_subs in self.subs.items():
+            keys.append(("category", category))
+            keys.extend(("sub", id(sub)) for sub in cat_subs)
+        keys.extend(("ingredient", name) for name in self.ingredients)
+        keys.extend([("tips",), ("config",)])
+
+        problems = [Problem(ERROR, os.path.basename(path), error) for path, error in self.load_errors.items()]
+        for key in keys:
+            results = self._refresh(key)
+            if results:
+                label = self._label(key)
+                problems.extend(Problem(severity, label, message, key) for severity, message in results)
+        return problems
+
+    def counts(self):
+        problems = self.report()
+        errors = sum(problem.severity == ERROR for problem in problems)
+        return errors, len(problems) - errors
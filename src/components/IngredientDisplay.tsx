@@ -1,6 +1,6 @@
 import React, { useState, useMemo } from 'react';
 import './IngredientDisplay.css';
-import { Ingredient, getCategoryOrder } from '../utils/dataUtils';
+import { Ingredient, getCategoryOrder, imageUrl } from '../utils/dataUtils';
 
 interface IngredientDisplayProps {
   categories: string[];
@@ -96,7 +96,7 @@ const IngredientDisplay: React.FC<IngredientDisplayProps> = ({
                 style={{ width: `${imageSize}px`, height: `${imageSize}px` }}
               >
                 <img 
-                  src={`/images/${info.image}`} 
+                  src={imageUrl(info.image)} 
                   alt={displayName}
                   onError={(e) => {
                     const target = e.target as HTMLImageElement;
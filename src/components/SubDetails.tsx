@@ -1,6 +1,6 @@
 import React from 'react';
 import './SubDetails.css';
-import { Sub, IngredientData } from '../utils/dataUtils';
+import { Sub, IngredientData, imageUrl } from '../utils/dataUtils';
 
 interface SubDetailsProps {
   sub: Sub;
@@ -15,7 +15,7 @@ const SubDetails: React.FC<SubDetailsProps> = ({ sub, ingredientData }) => {
       <div className="sub-image-container">
         <div className="sub-image">
           <img 
-            src={`/images/${sub.image}`} 
+            src={imageUrl(sub.image)} 
             alt={sub.name}
             onError={(e) => {
               const target = e.target as HTMLImageElement;
@@ -39,7 +39,7 @@ const SubDetails: React.FC<SubDetailsProps> = ({ sub, ingredientData }) => {
               <div className="ingredient-icon">
                 {ingredientData[ingredient] && (
                   <img 
-                    src={`/images/${ingredientData[ingredient].image}`} 
+                    src={imageUrl(ingredientData[ingredient].image)} 
                     alt={ingredient}
                     onError={(e) => {
                       const target = e.target as HTMLImageElement;
@@ -63,4 +63,4 @@ const SubDetails: React.FC<SubDetailsProps> = ({ sub, ingredientData }) => {
   );
 };
 
-export default SubDetails; 
\ No newline at end of file
+export default SubDetails; 
\ No newline at end of file
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useMemo, useRef } from 'react';
 import './SubQuiz.css';
-import { Sub, Ingredient, SubData, extractSandwichNumber, cleanSandwichName, getCategoryOrder } from '../utils/dataUtils';
+import { Sub, Ingredient, SubData, DistractorBank, extractSandwichNumber, cleanSandwichName, getCategoryOrder, imageUrl, loadDistractorBank } from '../utils/dataUtils';
 
 interface SubQuizProps {
   allSubs: Sub[];
@@ -39,6 +39,13 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
   const [showCategoryMenu, setShowCategoryMenu] = useState(false);
   const categoryMenuRef = useRef<HTMLDivElement>(null);
 
+  // Close matches for each sub, used to make wrong answers plausible
+  const [distractors, setDistractors] = useState<DistractorBank>({});
+
+  useEffect(() => {
+    loadDistractorBank().then(setDistractors);
+  }, []);
+
   // Initialize selected sub categories
   useEffect(() => {
     if (Object.keys(subData).length > 0 && selectedSubCategories.length === 0) {
@@ -183,7 +190,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
         const randomIndex = Math.floor(Math.random() * newSub.ingredients.length);
         const missing = newSub.ingredients[randomIndex];
         setMissingIngredient(missing);
-        generateMissingIngredientOptions(missing, newSub.ingredients);
+        generateMissingIngredientOptions(missing, newSub.ingredients, newSub.name);
       }
     }
     
@@ -193,7 +200,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
   };
   
   // Generate options for missing ingredient
-  const generateMissingIngredientOptions = (correctIngredient: string, currentIngredients: string[]) => {
+  const generateMissingIngredientOptions = (correctIngredient: string, currentIngredients: string[], subName: string) => {
     // Get all available ingredients
     const allIngredients = Object.keys(ingredientInfo);
     
@@ -201,16 +208,11 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
     // We want distractors that are NOT in the sub
     const possibleDistractors = allIngredients.filter(ing => !currentIngredients.includes(ing));
     
-    // Select 3 random distractors
-    const randomOptions: string[] = [];
-    for (let i = 0; i < 3 && possibleDistractors.length > 0; i++) {
-      const randomIndex = Math.floor(Math.random() * possibleDistractors.length);
-      randomOptions.push(possibleDistractors[randomIndex]);
-      possibleDistractors.splice(randomIndex, 1);
-    }
+    // Prefer ingredients that similar subs use
+    const wrongOptions = pickDistractors(distractors[subName]?.decoys ?? [], possibleDistractors, 3);
     
     // Add correct option and shuffle
-    const finalOptions = [...randomOptions, correctIngredient];
+    const finalOptions = [...wrongOptions, correctIngredient];
     setMissingOptions(shuffleArray(finalOptions));
   };
 
@@ -223,16 +225,11 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
       .filter(sub => sub.name !== correctName)
       .map(sub => sub.name);
     
-    // Select 3 random incorrect options
-    const randomOptions: string[] = [];
-    for (let i = 0; i < 3 && otherSubs.length > 0; i++) {
-      const randomIndex = Math.floor(Math.random() * otherSubs.length);
-      randomOptions.push(otherSubs[randomIndex]);
-      otherSubs.splice(randomIndex, 1);
-    }
+    // Select 3 incorrect options, preferring subs with similar ingredients
+    const wrongOptions = pickDistractors(distractors[correctName]?.similar ?? [], otherSubs, 3);
     
     // Add correct option and shuffle
-    const finalOptions = [...randomOptions, correctName];
+    const finalOptions = [...wrongOptions, correctName];
     setSubOptions(shuffleArray(finalOptions));
   };
   
@@ -262,6 +259,19 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
     setNumberOptions(shuffleArray(finalOptions));
   };
   
+  // Pick `count` wrong answers from `pool`, drawing first from the close
+  // matches in `preferred` and topping up at random
+  const pickDistractors = (preferred: string[], pool: string[], count: number) => {
+    const picked = shuffleArray(preferred.filter(option => pool.includes(option))).slice(0, count);
+    const rest = pool.filter(option => !picked.includes(option));
+    while (picked.length < count && rest.length > 0) {
+      const randomIndex = Math.floor(Math.random() * rest.length);
+      picked.push(rest[randomIndex]);
+      rest.splice(randomIndex, 1);
+    }
+    return picked;
+  };
+  
   // Shuffle an array
   const shuffleArray = (array: string[]) => {
     const shuffled = [...array];
@@ -705,7 +715,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                           {group.image && (
                             <div className="ingredient-image">
                               <img 
-                                src={`/images/${group.image}`} 
+                                src={imageUrl(group.image)} 
                                 alt={group.baseName}
                                 onError={(e) => {
                                   const target = e.target as HTMLImageElement;
@@ -740,7 +750,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                              {info.image && (
                               <div className="ingredient-image">
                                 <img 
-                                  src={`/images/${info.image}`} 
+                                  src={imageUrl(info.image)} 
                                   alt={ingredient} 
                                   onError={(e) => {
                                     const target = e.target as HTMLImageElement;
@@ -775,7 +785,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                              {info.image && (
                               <div className="ingredient-image">
                                 <img 
-                                  src={`/images/${info.image}`} 
+                                  src={imageUrl(info.image)} 
                                   alt={ingredient} 
                                   onError={(e) => {
                                     const target = e.target as HTMLImageElement;
@@ -810,7 +820,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                              {info.image && (
                               <div className="ingredient-image">
                                 <img 
-                                  src={`/images/${info.image}`} 
+                                  src={imageUrl(info.image)} 
                                   alt={ingredient} 
                                   onError={(e) => {
                                     const target = e.target as HTMLImageElement;
@@ -866,7 +876,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                     {info && info.image && (
                       <div className="ingredient-image">
                         <img 
-                          src={`/images/${info.image}`} 
+                          src={imageUrl(info.image)} 
                           alt={ingredient}
                           onError={(e) => {
                             const target = e.target as HTMLImageElement;
@@ -917,7 +927,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
               {currentSub.image && (
                 <div className="sandwich-image large-thumbnail">
                   <img 
-                    src={`/images/${currentSub.image}`} 
+                    src={imageUrl(currentSub.image)} 
                     alt={currentSub.name}
                     onError={(e) => {
                       const target = e.target as HTMLImageElement;
@@ -973,7 +983,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                     {sub && sub.image && (
                       <div className="sub-option-image">
                         <img 
-                          src={`/images/${sub.image}`} 
+                          src={imageUrl(sub.image)} 
                           alt={subName}
                           onError={(e) => {
                             const target = e.target as HTMLImageElement;
@@ -1021,7 +1031,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                     {info && info.image && (
                       <div className="ingredient-image">
                         <img 
-                          src={`/images/${info.image}`} 
+                          src={imageUrl(info.image)} 
                           alt={ingredient}
                           onError={(e) => {
                             const target = e.target as HTMLImageElement;
@@ -1060,7 +1070,7 @@ const SubQuiz: React.FC<SubQuizProps> = ({ allSubs, subData, ingredientInfo, cat
                     {info && info.image && (
                       <div className="sub-option-image ingredient-image-small">
                         <img 
-                          src={`/images/${info.image}`} 
+                          src={imageUrl(info.image)} 
                           alt={option}
                           onError={(e) => {
                             const target = e.target as HTMLImageElement;
@@ -48,9 +48,58 @@ export interface TipObject {
   icon?: string;
 }
 
+export interface DataBundle {
+  subs: SubData;
+  ingredients: IngredientData;
+  tips: (string | TipObject)[];
+  config: SortingConfig;
+}
+
+let bundlePromise: Promise<DataBundle | null> | null = null;
+
+// Load the published data bundle (see the editor's publish command). The tiny
+// manifest is always revalidated; the bundle it names is content-hashed, so the
+// browser can cache it for good. Resolves to null when nothing has been
+// published, and the loaders below fall back to the individual JSON files.
+export function loadDataBundle(): Promise<DataBundle | null> {
+  if (!bundlePromise) {
+    bundlePromise = (async () => {
+      try {
+        const manifestResponse = await fetch('/data/manifest.json', { cache: 'no-cache' });
+        if (!manifestResponse.ok) {
+          return null;
+        }
+        const manifest = await manifestResponse.json();
+        // publish-site writes an absolute /assets/ path; the editor's own
+        // bundle sits next to the manifest
+        const bundleUrl = manifest.bundle.startsWith('/') ? manifest.bundle : `/data/${manifest.bundle}`;
+        const response = await fetch(bundleUrl);
+        if (!response.ok) {
+          throw new Error(`Failed to load data bundle: ${response.status}`);
+        }
+        return await response.json();
+      } catch (error) {
+        console.warn('No data bundle, loading individual files:', error);
+        return null;
+      }
+    })();
+  }
+  return bundlePromise;
+}
+
+// URL for an image path from the data. Published bundles point at
+// fingerprinted copies under /assets/; plain paths live in /images/.
+export function imageUrl(path: string): string {
+  return path.startsWith('/') ? path : `/images/${path}`;
+}
+
 // Load site tips
 export async function loadSiteTips(): Promise<(string | TipObject)[]> {
   try {
+    const bundle = await loadDataBundle();
+    if (bundle) {
+      return bundle.tips;
+    }
     // Add timestamp to prevent caching
     const response = await fetch(`/site_tips.json?t=${Date.now()}`);
     if (!response.ok) {
@@ -67,6 +116,10 @@ export async function loadSiteTips(): Promise<(string | TipObject)[]> {
 // Load sub data from the JSON file
 export async function loadSubData(): Promise<SubData> {
   try {
+    const bundle = await loadDataBundle();
+    if (bundle) {
+      return bundle.subs;
+    }
     // Add timestamp to prevent caching
     const response = await fetch(`/sub_data.json?t=${Date.now()}`);
     if (!response.ok) {
@@ -84,6 +137,10 @@ export async function loadSubData(): Promise<SubData> {
 // Load ingredient data
 export async function loadIngredientData(): Promise<IngredientData> {
   try {
+    const bundle = await loadDataBundle();
+    if (bundle) {
+      return bundle.ingredients;
+    }
     // Add timestamp to prevent caching
     const response = await fetch(`/ingredient_data.json?t=${Date.now()}`);
     if (!response.ok) {
@@ -99,6 +156,10 @@ export async function loadIngredientData(): Promise<IngredientData> {
 // Load sorting configuration
 export async function loadSortingConfig(): Promise<SortingConfig> {
   try {
+    const bundle = await loadDataBundle();
+    if (bundle) {
+      return bundle.config;
+    }
     const response = await fetch('/sorting_config.json');
     if (!response.ok) {
       throw new Error(`Failed to load sorting config: ${response.status}`);
@@ -117,6 +178,31 @@ export async function loadSortingConfig(): Promise<SortingConfig> {
   }
 }
 
+export interface DistractorEntry {
+  similar: string[];
+  decoys: string[];
+}
+
+export type DistractorBank = Record<string, DistractorEntry>;
+
+// Load the quiz distractor bank (see the editor's build-distractors command):
+// for each sub, the subs and the missing-ingredient decoys most easily
+// confused with it, best first. It's optional; quizzes fall back to random
+// options for anything it doesn't cover.
+export async function loadDistractorBank(): Promise<DistractorBank> {
+  try {
+    const response = await fetch('/quiz_distractors.json', { cache: 'no-cache' });
+    if (!response.ok) {
+      return {};
+    }
+    const bank = await response.json();
+    return bank.subs ?? {};
+  } catch (error) {
+    console.warn('No quiz distractor bank, using random options:', error);
+    return {};
+  }
+}
+
 // Helper function to get sample sub data if JSON can't be loaded
 function getSampleSubData(): SubData {
   return {